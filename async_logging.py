@@ -0,0 +1,112 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Loggers that fire once per tick; rate limited by setup_async_logging
+TICK_LOGGERS = ('IBConnection.ticks', 'StockTrader.ticks')
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock QueueHandler.prepare renders the message on the calling thread;
+    here the record is queued as-is so %-style arguments are only formatted
+    by the background thread, and only if a handler actually emits it.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message template: at most `rate` records per second
+    (with bursts up to `burst`). The next record that gets through notes how
+    many were dropped in between.
+    """
+
+    def __init__(self, rate=1.0, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            tokens, last, suppressed = self.buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1.0:
+                self.buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[key] = (tokens - 1.0, now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Pass one record out of every `every` per message template"""
+
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = every
+        self.counts = {}
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return count % self.every == 0
+
+
+def setup_async_logging(level=logging.INFO, log_file='trading.log', fmt=DEFAULT_FORMAT,
+                        tick_log_rate=1.0, tick_log_sample=None):
+    """
+    Route all logging through a queue to a background writer thread
+    tick_log_rate: max records per second per message on the per-tick loggers
+    tick_log_sample: if set, keep one in N per-tick records instead of rate limiting
+    Returns: the running QueueListener (stopped automatically at exit)
+    """
+    formatter = logging.Formatter(fmt)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    for name in TICK_LOGGERS:
+        tick_logger = logging.getLogger(name)
+        for existing in list(tick_logger.filters):
+            tick_logger.removeFilter(existing)
+        if tick_log_sample:
+            tick_logger.addFilter(SampleFilter(tick_log_sample))
+        elif tick_log_rate:
+            tick_logger.addFilter(RateLimitFilter(tick_log_rate))
+
+    listener.start()
+    atexit.register(stop_async_logging, listener)
+    return listener
+
+
+def stop_async_logging(listener):
+    """Drain the queue and stop the writer thread; safe to call twice"""
+    if listener._thread is not None:
+        listener.stop()
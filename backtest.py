@@ -0,0 +1,393 @@
+import logging
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+
+from market_data import QuoteTable
+from strategy import ThresholdStrategy, stack_states, update_state
+from trader import StockTrader, STOP_LOSS_PERCENTAGE
+
+
+class SimulatedConnection:
+    """
+    Stand-in for IBConnection used by the backtest engine.
+
+    Implements only the calls StockTrader makes. Limit orders fill
+    immediately and completely at their limit price: the order future is
+    already resolved when submit_order returns.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.is_connected = True
+        self.next_order_id = 1
+        self.orders = {}
+        self.fills = []
+        self.quotes = QuoteTable()
+        self.slot = self.quotes.add_symbol(symbol)
+        self.now = 0
+        self.logger = logging.getLogger('SimulatedConnection')
+
+    @property
+    def current_price(self):
+        return self.quotes.last[self.slot]
+
+    def set_price(self, price, timestamp):
+        self.quotes.last[self.slot] = price
+        self.now = timestamp
+
+    def get_last_price(self, symbol):
+        return self.quotes.get(symbol)
+
+    def subscribe(self, symbol, tick_by_tick=False):
+        return self.slot
+
+    def add_tick_listener(self, symbol, callback):
+        pass
+
+    def remove_tick_listener(self, symbol, callback):
+        pass
+
+    def create_contract(self, symbol, sec_type="STK", exchange="SMART", currency="USD"):
+        # Contracts are only echoed back in logs; keep them lightweight
+        return _SimContract(symbol)
+
+    def get_next_order_id(self):
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        return order_id
+
+    def submit_order(self, contract, order, tick_ns=0):
+        order_id = self.get_next_order_id()
+        future = Future()
+        self.placeOrder(order_id, contract, order)
+        future.set_result(self.orders[order_id])
+        return order_id, future
+
+    def placeOrder(self, order_id, contract, order):
+        self.orders[order_id] = {
+            'status': 'Filled',
+            'filled': order.totalQuantity,
+            'remaining': 0,
+            'avgFillPrice': order.lmtPrice,
+            'whyHeld': ''
+        }
+        self.fills.append((self.now, order.action, order.totalQuantity, order.lmtPrice))
+
+    def cancelOrder(self, order_id, *args):
+        self.orders[order_id]['status'] = 'Cancelled'
+
+    def get_order_status(self, order_id):
+        return self.orders.get(order_id)
+
+
+class _SimContract:
+    __slots__ = ('symbol',)
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+
+def synthetic_ticks(count, start_price=100.0, volatility=0.0005, seed=None,
+                    start_time=None, interval_ns=100_000_000):
+    """
+    Generate a geometric random walk of last prices
+    Returns: (prices, timestamps) with timestamps in epoch nanoseconds
+    """
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0.0, volatility, count)
+    log_returns[0] = 0.0
+    prices = start_price * np.exp(np.cumsum(log_returns))
+    if start_time is None:
+        start_time = time.time_ns()
+    timestamps = start_time + np.arange(count, dtype=np.int64) * interval_ns
+    return prices, timestamps
+
+
+class BacktestEngine:
+    """
+    Replay last-price ticks through StockTrader.process_tick on a simulated clock.
+
+    Between two trades the trader's state is constant, so the engine scans
+    the tick array with NumPy for the next tick that can trigger a stop loss,
+    a sell, a buy or a reference price update, and only calls into Python
+    decision code for those ticks. The scan uses the same expressions and
+    position book thresholds as process_tick, so trigger decisions are
+    identical to tick-by-tick replay.
+
+    With indicators (keyword arguments for StockTrader.enable_indicators),
+    the first tick of every bar is an event as well; the ticks skipped
+    inside a bar are folded into it in one NumPy pass.
+
+    strategy: a strategy.Strategy for the trader; its triggers() drives the
+    scan, so any strategy replays with the same event skipping.
+    """
+
+    MIN_CHUNK = 1024
+    MAX_CHUNK = 1 << 20
+
+    def __init__(self, symbol='SIM', buy_trigger_percentage=-0.01, sell_trigger_percentage=0.01,
+                 max_positions=3, position_size=30, stop_loss_percentage=STOP_LOSS_PERCENTAGE,
+                 reference_price=None, indicators=None, strategy=None):
+        self.symbol = symbol
+        self.buy_trigger_percentage = buy_trigger_percentage
+        self.sell_trigger_percentage = sell_trigger_percentage
+        self.max_positions = max_positions
+        self.position_size = position_size
+        self.stop_loss_percentage = stop_loss_percentage
+        self.reference_price = reference_price
+        self.indicators = indicators
+        self.strategy = strategy
+        self.logger = logging.getLogger('BacktestEngine')
+
+    def create_trader(self):
+        ib = SimulatedConnection(self.symbol)
+        trader = StockTrader(ib, self.symbol)
+        trader.set_parameters(self.buy_trigger_percentage, self.sell_trigger_percentage,
+                              self.max_positions, self.position_size, self.stop_loss_percentage)
+        trader.clock = lambda: datetime.fromtimestamp(ib.now / 1e9)
+        trader.now = lambda: ib.now / 1e9
+        if self.indicators is not None:
+            trader.enable_indicators(**self.indicators)
+        if self.strategy is not None:
+            trader.strategy = self.strategy
+        return trader
+
+    def run(self, prices, timestamps=None):
+        """
+        Run the strategy over a tick stream
+        prices: 1-D array of last prices
+        timestamps: optional epoch-nanosecond timestamps, one per price
+        Returns: dict with trades, P&L and drawdown statistics
+        """
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        if timestamps is None:
+            timestamps = np.arange(len(prices), dtype=np.int64)
+        timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        valid = prices > 0
+        if not valid.all():
+            prices = prices[valid]
+            timestamps = timestamps[valid]
+
+        trader = self.create_trader()
+        ib = trader.ib
+        trader.is_trading = True
+        if self.reference_price:
+            trader.set_reference_price(self.reference_price)
+        elif len(prices):
+            trader.set_reference_price(float(prices[0]))
+
+        started = time.perf_counter()
+        # Per-tick decision logging would dominate the run time
+        previous_level = trader.logger.level
+        trader.logger.setLevel(logging.ERROR)
+        try:
+            stats = self._replay(trader, prices, timestamps)
+        finally:
+            trader.logger.setLevel(previous_level)
+        elapsed = time.perf_counter() - started
+
+        last_price = float(prices[-1]) if len(prices) else 0.0
+        open_shares = trader.positions.total_shares
+        unrealized = open_shares * last_price - trader.positions.total_cost
+        result = {
+            'ticks': len(prices),
+            'events': stats['events'],
+            'elapsed': elapsed,
+            'ticks_per_second': len(prices) / elapsed if elapsed else 0.0,
+            'trades': ib.fills,
+            'total_trades': trader.total_trades,
+            'realized_profit': trader.total_profit,
+            'unrealized_profit': unrealized,
+            'total_profit': trader.total_profit + unrealized,
+            'open_shares': open_shares,
+            'max_drawdown': stats['max_drawdown'],
+            'peak_equity': stats['peak_equity'],
+        }
+        self.logger.info(
+            f"Backtest {self.symbol}: {result['ticks']} ticks, {result['events']} events, "
+            f"P&L ${result['total_profit']:.2f}, max drawdown ${result['max_drawdown']:.2f} "
+            f"in {elapsed:.3f}s"
+        )
+        return result
+
+    def _replay(self, trader, prices, timestamps):
+        ib = trader.ib
+        count = len(prices)
+        position = 0
+        events = 0
+        peak = 0.0
+        max_drawdown = 0.0
+        chunk = self.MIN_CHUNK
+
+        while position < count:
+            stop = min(position + chunk, count)
+            window = prices[position:stop]
+            hits = np.flatnonzero(self._trigger_mask(trader, window, timestamps[position:stop]))
+
+            if len(hits) == 0:
+                segment_end = stop
+                chunk = min(chunk * 2, self.MAX_CHUNK)
+            else:
+                segment_end = position + int(hits[0])
+                chunk = max(self.MIN_CHUNK, chunk // 2)
+
+            # Mark to market the quiet ticks with the pre-event position
+            if segment_end > position:
+                if trader.indicators is not None:
+                    trader.indicators.bars.extend(prices[position:segment_end])
+                peak, max_drawdown = self._update_drawdown(
+                    trader, prices[position:segment_end], peak, max_drawdown)
+
+            if len(hits) == 0:
+                position = stop
+                continue
+
+            price = float(prices[segment_end])
+            ib.set_price(price, int(timestamps[segment_end]))
+            trader.process_tick(price)
+            # Apply the fills of orders sent on this tick
+            trader.process_pending_events()
+            events += 1
+            peak, max_drawdown = self._update_drawdown(
+                trader, prices[segment_end:segment_end + 1], peak, max_drawdown)
+            position = segment_end + 1
+
+        return {'events': events, 'peak_equity': peak, 'max_drawdown': max_drawdown}
+
+    @staticmethod
+    def _trigger_mask(trader, window, times):
+        """Vectorized form of the trigger conditions in StockTrader.process_tick"""
+        strategy = trader.strategy
+        mask = strategy.triggers(window, strategy.state(trader))
+        highest_stop = trader.positions.highest_stop()
+        if highest_stop is not None:
+            mask |= window <= highest_stop
+            mask |= window >= trader.positions.lowest_target()
+        if trader.indicators is not None:
+            # Same float conversion as trader.now(), so bar boundaries agree
+            mask |= times / 1e9 >= trader.indicators.bars.bar_end
+        return mask
+
+    @staticmethod
+    def _update_drawdown(trader, window, peak, max_drawdown):
+        shares = trader.positions.total_shares
+        cost = trader.positions.total_cost
+
+        if shares:
+            equity = trader.total_profit - cost + shares * window
+            running_peak = np.maximum.accumulate(equity)
+            np.maximum(running_peak, peak, out=running_peak)
+            max_drawdown = max(max_drawdown, float((running_peak - equity).max()))
+            peak = float(running_peak[-1])
+        else:
+            equity = trader.total_profit
+            peak = max(peak, equity)
+            max_drawdown = max(max_drawdown, peak - equity)
+        return peak, max_drawdown
+
+
+class PortfolioBacktest:
+    """
+    Replay many symbols in lockstep through one strategy.
+
+    prices is a (ticks, symbols) matrix on a common clock. For each row a
+    single strategy.triggers call over every symbol's stacked state, plus
+    the stop and target thresholds as arrays, finds the symbols that act on
+    that tick; only those go through StockTrader.process_tick. Symbols with
+    nothing to do cost no Python calls, so a row of hundreds of symbols is a
+    few NumPy operations. Results per symbol match BacktestEngine.run on
+    that symbol's column. Indicators are not supported here.
+    """
+
+    def __init__(self, symbols, strategy=None, **parameters):
+        self.symbols = list(symbols)
+        self.strategy = strategy or ThresholdStrategy()
+        self.engines = [BacktestEngine(symbol, strategy=self.strategy, **parameters) for symbol in self.symbols]
+        self.logger = logging.getLogger('PortfolioBacktest')
+
+    def run(self, prices, timestamps=None):
+        """
+        prices: (ticks, symbols) array of last prices; non-positive entries are skipped
+        timestamps: optional epoch-nanosecond timestamps, one per row
+        Returns: dict with per-symbol results under 'symbols' and portfolio totals
+        """
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        if prices.ndim != 2 or prices.shape[1] != len(self.symbols):
+            raise ValueError(f"Expected a (ticks, {len(self.symbols)}) price matrix, got {prices.shape}")
+        if timestamps is None:
+            timestamps = np.arange(len(prices), dtype=np.int64)
+        strategy = self.strategy
+
+        traders = []
+        for engine, column in zip(self.engines, prices.T):
+            trader = engine.create_trader()
+            trader.is_trading = True
+            positive = column[column > 0]
+            reference = engine.reference_price or (float(positive[0]) if len(positive) else 0.0)
+            if reference:
+                trader.set_reference_price(reference)
+            traders.append(trader)
+        states = stack_states(strategy, traders)
+        stops = np.full(len(traders), -np.inf)
+        targets = np.full(len(traders), np.inf)
+        active = np.array([trader.reference_price > 0 for trader in traders])
+
+        started = time.perf_counter()
+        events = 0
+        previous_level = traders[0].logger.level if traders else logging.NOTSET
+        if traders:
+            traders[0].logger.setLevel(logging.ERROR)
+        try:
+            for row in range(len(prices)):
+                window = prices[row]
+                mask = strategy.triggers(window, states)
+                mask |= window <= stops
+                mask |= window >= targets
+                mask &= (window > 0) & active
+                for index in np.flatnonzero(mask).tolist():
+                    trader = traders[index]
+                    price = float(window[index])
+                    trader.ib.set_price(price, int(timestamps[row]))
+                    trader.process_tick(price)
+                    trader.process_pending_events()
+                    update_state(states, index, strategy.state(trader))
+                    highest_stop = trader.positions.highest_stop()
+                    stops[index] = -np.inf if highest_stop is None else highest_stop
+                    lowest_target = trader.positions.lowest_target()
+                    targets[index] = np.inf if lowest_target is None else lowest_target
+                    events += 1
+        finally:
+            if traders:
+                traders[0].logger.setLevel(previous_level)
+        elapsed = time.perf_counter() - started
+
+        results = {}
+        for symbol, trader, column in zip(self.symbols, traders, prices.T):
+            positive = column[column > 0]
+            last_price = float(positive[-1]) if len(positive) else 0.0
+            open_shares = trader.positions.total_shares
+            unrealized = open_shares * last_price - trader.positions.total_cost
+            results[symbol] = {
+                'trades': trader.ib.fills,
+                'total_trades': trader.total_trades,
+                'realized_profit': trader.total_profit,
+                'unrealized_profit': unrealized,
+                'total_profit': trader.total_profit + unrealized,
+                'open_shares': open_shares,
+            }
+        total_profit = sum(result['total_profit'] for result in results.values())
+        self.logger.info(f"Portfolio backtest: {len(self.symbols)} symbols x {len(prices)} ticks, "
+                         f"{events} events, P&L ${total_profit:.2f} in {elapsed:.3f}s")
+        return {
+            'ticks': prices.size,
+            'events': events,
+            'elapsed': elapsed,
+            'ticks_per_second': prices.size / elapsed if elapsed else 0.0,
+            'symbols': results,
+            'total_trades': sum(result['total_trades'] for result in results.values()),
+            'realized_profit': sum(result['realized_profit'] for result in results.values()),
+            'total_profit': total_profit,
+        }
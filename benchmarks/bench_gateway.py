@@ -0,0 +1,161 @@
+"""
+End-to-end benchmarks against the local mock gateway.
+
+Runs the real IBConnection decoder, StockTrader event loop and order path
+over a loopback socket. Usage (from the repository root):
+
+    python -m benchmarks.bench_gateway [--samples 500] [--ticks 200000] [--message-rate 1000000]
+
+Outbound messages go through the IBConnection rate limiter at
+--message-rate; at the live 40 msg/s the tick-to-order figures measure
+the limiter, whose wait is also reported as the send_queue stage.
+"""
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+from ib_connection import IBConnection
+from mock_gateway import MockGateway
+from trader import StockTrader
+
+SYMBOL = 'BENCH'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def connect(gateway, message_rate):
+    ib = IBConnection(message_rate=message_rate)
+    if not ib.connect_and_init(port=gateway.port):
+        raise ConnectionError("Could not connect to mock gateway")
+    ib.start_price_stream(SYMBOL)
+    if not gateway.wait_for_subscription(SYMBOL):
+        raise TimeoutError("Market data subscription never reached the gateway")
+    return ib
+
+
+def start_trader(ib, reference_price):
+    trader = StockTrader(ib, SYMBOL)
+    trader.set_reference_price(reference_price)
+    trader.is_trading = True
+    thread = threading.Thread(
+        target=trader.monitor_and_trade,
+        kwargs={'symbol': SYMBOL, 'max_positions': 1_000_000, 'position_size': 1},
+        daemon=True
+    )
+    thread.start()
+    return trader, thread
+
+
+def bench_tick_to_order(samples, message_rate):
+    """
+    Time from the gateway writing a buy-triggering tick to the gateway
+    receiving the resulting order. Orders are left unfilled so no lots
+    (and no stop losses) build up between samples.
+    """
+    gateway = MockGateway(fill_orders=False).start()
+    ib = connect(gateway, message_rate)
+    price = 100.0
+    gateway.publish(SYMBOL, price)
+    trader, thread = start_trader(ib, price)
+    time.sleep(0.2)
+
+    latencies = []
+    for sample in range(samples):
+        # A 2% rise only moves the reference price, the 1.5% drop then buys
+        price *= 1.02
+        gateway.publish(SYMBOL, round(price, 4))
+        price *= 0.985
+        expected = len(gateway.orders) + 1
+        sent = time.perf_counter_ns()
+        gateway.publish(SYMBOL, round(price, 4))
+        if not gateway.wait_for_orders(expected):
+            raise TimeoutError(f"No order for sample {sample}")
+        latencies.append((gateway.orders[expected - 1]['received_ns'] - sent) / 1000)
+
+    trader.is_trading = False
+    thread.join()
+    stages = ib.latency.snapshot()
+    ib.disconnect()
+    gateway.stop()
+    return {
+        'stages': stages,
+        'samples': len(latencies),
+        'mean_us': statistics.fmean(latencies),
+        'p50_us': percentile(latencies, 0.50),
+        'p99_us': percentile(latencies, 0.99),
+        'max_us': max(latencies),
+    }
+
+
+def bench_tick_throughput(ticks, message_rate, batch=1000):
+    """
+    Ticks per second decoded by IBConnection and evaluated by StockTrader.
+    Prices stay inside the trigger band so every tick is a no-trade tick.
+    """
+    gateway = MockGateway().start()
+    ib = connect(gateway, message_rate)
+    gateway.publish(SYMBOL, 100.0)
+    trader, thread = start_trader(ib, 100.0)
+    time.sleep(0.2)
+
+    received = [0]
+    done = threading.Event()
+
+    def count(price):
+        received[0] += 1
+        if received[0] >= ticks:
+            done.set()
+
+    ib.add_tick_listener(SYMBOL, count)
+    prices = [100.0 + (i % 50) * 0.001 for i in range(batch)]
+    started = time.perf_counter()
+    for _ in range(0, ticks, batch):
+        gateway.publish_many(SYMBOL, prices)
+    done.wait(120)
+    decoded = time.perf_counter() - started
+    while not trader.event_queue.empty():
+        time.sleep(0.001)
+    evaluated = time.perf_counter() - started
+
+    trader.is_trading = False
+    thread.join()
+    ib.disconnect()
+    gateway.stop()
+    return {
+        'ticks': received[0],
+        'decoded_per_second': received[0] / decoded,
+        'evaluated_per_second': received[0] / evaluated,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=200_000)
+    parser.add_argument('--message-rate', type=float, default=1_000_000.0,
+                        help="outbound messages per second allowed by the rate limiter")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    latency = bench_tick_to_order(args.samples, args.message_rate)
+    print(f"tick-to-order latency over {latency['samples']} samples: "
+          f"mean {latency['mean_us']:.0f}us p50 {latency['p50_us']:.0f}us "
+          f"p99 {latency['p99_us']:.0f}us max {latency['max_us']:.0f}us")
+    for stage, stats in latency['stages'].items():
+        if stats['count']:
+            print(f"  {stage:<17} n={stats['count']:<7} p50 {stats['p50']:.0f}us "
+                  f"p99 {stats['p99']:.0f}us p999 {stats['p999']:.0f}us")
+
+    throughput = bench_tick_throughput(args.ticks, args.message_rate)
+    print(f"tick throughput over {throughput['ticks']} ticks: "
+          f"decoded {throughput['decoded_per_second']:,.0f}/s, "
+          f"evaluated {throughput['evaluated_per_second']:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Historical loader throughput against the mock gateway.
+
+Cold: every day is requested from the mock, which answers each request
+after --delay seconds; with one request in flight the load is serial.
+Warm: the same range again, served entirely from the npz cache. The
+10-minute request cap is lifted so runs are not pacing-bound; the
+per-symbol burst limit still applies. Usage (from the repository root):
+
+    python -m benchmarks.bench_historical [--symbols 4] [--days 14] [--delay 0.2]
+"""
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from historical import HistoricalLoader, PacingLimiter
+from ib_connection import IBConnection
+from mock_gateway import MockGateway
+
+
+def timed_load(ib, cache_dir, symbols, start, end, bar_size, max_in_flight):
+    loader = HistoricalLoader(ib, cache_dir, max_in_flight, pacing=PacingLimiter(max_requests=100_000))
+    started = time.perf_counter()
+    result = loader.load_many(symbols, start, end, bar_size)
+    elapsed = time.perf_counter() - started
+    return elapsed, loader.requests, sum(len(columns['time']) for columns in result.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=4)
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--bar-size', default='1 min')
+    parser.add_argument('--delay', type=float, default=0.2, help="mock reply latency per request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(days=args.days)
+    gateway = MockGateway(history_delay=args.delay).start()
+    ib = IBConnection()
+    ib.connect_and_init(port=gateway.port)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for max_in_flight in (1, 10):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            elapsed, requests, bars = timed_load(ib, cache_dir, symbols, start, end, args.bar_size, max_in_flight)
+            print(f"cold, {max_in_flight:>2} in flight  {requests:>5} requests  {bars:>9,} bars  {elapsed:7.2f}s")
+        elapsed, requests, bars = timed_load(None, cache_dir, symbols, start, end, args.bar_size, 10)
+        print(f"warm (cache only)  {requests:>5} requests  {bars:>9,} bars  {elapsed * 1000:7.1f}ms")
+    finally:
+        ib.disconnect()
+        gateway.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
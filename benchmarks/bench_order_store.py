@@ -0,0 +1,88 @@
+"""
+Order state memory and callback cost: OrderStore against the previous
+dict of per-callback status dicts.
+
+Each order goes through Submitted, a partial fill and Filled, with a
+get_order_status-style lookup after every callback. Lookups alone are
+then timed over the most recent cap orders. Usage (from the
+repository root):
+
+    python -m benchmarks.bench_order_store [--orders 1000000] [--cap 10000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from order_store import OrderStore
+
+LIFECYCLE = (
+    ('Submitted', 0.0, 100.0, False),
+    ('Submitted', 40.0, 60.0, False),
+    ('Filled', 100.0, 0.0, True),
+)
+
+
+def run_dict(orders):
+    store = {}
+    for order_id in range(1, orders + 1):
+        for status, filled, remaining, _ in LIFECYCLE:
+            store[order_id] = {
+                'status': status,
+                'filled': filled,
+                'remaining': remaining,
+                'avgFillPrice': 100.0,
+                'whyHeld': ''
+            }
+            store.get(order_id)
+    return store
+
+
+def run_store(orders, cap, ttl):
+    store = OrderStore(ttl=ttl, max_terminal=cap)
+    for order_id in range(1, orders + 1):
+        for status, filled, remaining, terminal in LIFECYCLE:
+            store.update(order_id, status, filled, remaining, 100.0, '', terminal)
+            store.get(order_id)
+    return store
+
+
+def measure(run, *args):
+    """Time one untraced run, then trace a second run for retained memory"""
+    started = time.perf_counter()
+    run(*args)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    result = run(*args)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, retained
+
+
+def time_lookups(get, order_ids, rounds=5):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for order_id in order_ids:
+            get(order_id)
+    return (time.perf_counter() - started) / (rounds * len(order_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--cap', type=int, default=10_000, help="max terminal orders kept in memory")
+    parser.add_argument('--ttl', type=float, default=300.0)
+    args = parser.parse_args()
+    callbacks = args.orders * len(LIFECYCLE)
+
+    for name, run, run_args in (
+        ('dict of dicts', run_dict, (args.orders,)),
+        (f'OrderStore cap {args.cap}', run_store, (args.orders, args.cap, args.ttl)),
+    ):
+        result, elapsed, retained = measure(run, *run_args)
+        lookup = time_lookups(result.get, range(args.orders - args.cap + 1, args.orders + 1))
+        print(f"{name:<22} {len(result):>9,} orders kept, {retained / 2**20:8.1f} MiB retained, "
+              f"{elapsed / callbacks * 1e9:6.0f} ns per callback + lookup, {lookup * 1e9:4.0f} ns per lookup")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Firm-wide P&L query cost: recomputed from every lot vs running aggregates.
+
+Random fills and price ticks are applied over --symbols symbols, each with
+up to --lots open lots. After every tick the recomputing side walks every
+lot of every symbol, as get_positions_summary did for one symbol; the
+Portfolio side applies the tick and reads summary(). Both must agree at the
+end. Usage (from the repository root):
+
+    python -m benchmarks.bench_portfolio [--symbols 200] [--lots 20] [--ticks 20000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from portfolio import Portfolio
+from position_book import PositionBook
+
+
+def recompute(books, prices):
+    """Totals the slow way: every lot of every symbol"""
+    shares = cost = market_value = 0.0
+    for symbol, book in books.items():
+        price = prices[symbol]
+        for lot in book:
+            shares += lot.shares
+            cost += lot.shares * lot.price
+            market_value += lot.shares * price
+    return {'shares': shares, 'cost_basis': cost, 'unrealized': market_value - cost}
+
+
+def make_events(symbols, ticks, seed=1):
+    """(symbol, price, fill) tuples; fill is +shares to buy, -1 to close the oldest lot, 0 for none"""
+    rng = random.Random(seed)
+    prices = {symbol: 100.0 for symbol in symbols}
+    events = []
+    for _ in range(ticks):
+        symbol = rng.choice(symbols)
+        prices[symbol] = max(1.0, prices[symbol] * (1 + rng.gauss(0, 0.002)))
+        roll = rng.random()
+        fill = rng.randint(1, 100) if roll < 0.05 else -1 if roll < 0.09 else 0
+        events.append((symbol, prices[symbol], fill))
+    return events
+
+
+def run(events, symbols, max_lots, aggregate):
+    books = {symbol: PositionBook() for symbol in symbols}
+    prices = {symbol: 0.0 for symbol in symbols}
+    realized = {symbol: 0.0 for symbol in symbols}
+    portfolio = Portfolio()
+    now = datetime.now()
+    started = time.perf_counter()
+    for symbol, price, fill in events:
+        book = books[symbol]
+        prices[symbol] = price
+        if fill > 0 and len(book) < max_lots:
+            book.add(fill, price, now)
+        elif fill < 0 and book:
+            lot = next(iter(book))
+            realized[symbol] += (price - lot.price) * lot.shares
+            book.reduce(lot, lot.shares)
+        if aggregate:
+            portfolio.mark(symbol, price)
+            if fill:
+                portfolio.set_position(symbol, book.total_shares, book.total_cost, realized[symbol], 0)
+            totals = portfolio.summary()
+        else:
+            totals = recompute(books, prices)
+    elapsed = time.perf_counter() - started
+    return elapsed, totals, recompute(books, prices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--lots', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=20000)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    events = make_events(symbols, args.ticks)
+    for name, aggregate in (('recompute', False), ('aggregates', True)):
+        elapsed, totals, exact = run(events, symbols, args.lots, aggregate)
+        error = max(abs(totals[key] - exact[key]) for key in exact)
+        print(f"{name:<10} {elapsed / len(events) * 1e6:9.2f}us per tick+query  "
+              f"unrealized {totals['unrealized']:12.2f}  max abs error vs exact {error:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Recovery time after a gateway restart.
+
+An IBConnection subscribes --symbols symbols on a MockGateway and places
+--orders orders that stay working. The gateway is then stopped, every
+order is filled while it is down, and it is started again after
+--downtime seconds. Times are measured from the restart: until the
+connection is back, until every symbol has ticked again through its
+original subscription, and until every order's future has resolved from
+the one bulk reconciliation pass. Repeated --runs times. Usage (from the
+repository root):
+
+    python -m benchmarks.bench_reconnect [--symbols 50] [--orders 20] [--downtime 2.0]
+"""
+import argparse
+import logging
+import threading
+import time
+
+from ibapi.order import Order
+
+from ib_connection import IBConnection
+from mock_gateway import MockGateway
+
+
+def limit_order(price, quantity=10):
+    order = Order()
+    order.action = 'BUY'
+    order.orderType = 'LMT'
+    order.totalQuantity = quantity
+    order.lmtPrice = price
+    return order
+
+
+def restart(gateway, ib, symbols, futures, downtime):
+    """Drop and restart the gateway; returns (connected, ticking, settled) seconds after the restart"""
+    ticked = {symbol: threading.Event() for symbol in symbols}
+    listeners = {symbol: (lambda _, event=event: event.set()) for symbol, event in ticked.items()}
+    gateway.stop()
+    while ib.is_connected:
+        time.sleep(0.001)
+    for order_id in list(gateway.open_orders):
+        gateway.fill(order_id)
+    for symbol, listener in listeners.items():
+        ib.add_tick_listener(symbol, listener)
+    time.sleep(downtime)
+
+    gateway.start()
+    started = time.monotonic()
+    connected = ticking = settled = None
+    price = 100.0
+    while ticking is None or settled is None:
+        now = time.monotonic() - started
+        if now > 60:
+            raise TimeoutError("No recovery within 60s")
+        if connected is None and ib.is_connected:
+            connected = now
+        if ticking is None and all(event.is_set() for event in ticked.values()):
+            ticking = now
+        if settled is None and all(future.done() for future in futures):
+            settled = now
+        price += 0.01
+        for symbol in symbols:
+            gateway.publish(symbol, round(price, 2))
+        time.sleep(0.005)
+    for symbol, listener in listeners.items():
+        ib.remove_tick_listener(symbol, listener)
+    return connected, ticking, settled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--downtime', type=float, default=2.0, help="seconds the gateway stays down")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--reconnect-delay', type=float, default=0.5)
+    parser.add_argument('--reconnect-max-delay', type=float, default=30.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    gateway = MockGateway(fill_orders=False).start()
+    ib = IBConnection(reconnect_delay=args.reconnect_delay, reconnect_max_delay=args.reconnect_max_delay)
+    if not ib.connect_and_init(gateway.host, gateway.port, 1):
+        raise SystemExit("Could not connect to the mock gateway")
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    for symbol in symbols:
+        ib.subscribe(symbol)
+        gateway.wait_for_subscription(symbol)
+
+    try:
+        for run in range(args.runs):
+            futures = []
+            for i in range(args.orders):
+                contract = ib.create_contract(symbols[i % len(symbols)])
+                futures.append(ib.submit_order(contract, limit_order(100.0))[1])
+            while len(gateway.open_orders) < args.orders:
+                time.sleep(0.001)
+            connected, ticking, settled = restart(gateway, ib, symbols, futures, args.downtime)
+            filled = sum(future.result()['status'] == 'Filled' for future in futures)
+            print(f"run {run + 1}: connected {connected:6.3f}s  {args.symbols} symbols ticking {ticking:6.3f}s  "
+                  f"{filled}/{args.orders} orders settled {settled:6.3f}s after restart")
+    finally:
+        ib.disconnect()
+        gateway.stop()
+
+
+if __name__ == '__main__':
+    main()
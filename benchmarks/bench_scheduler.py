@@ -0,0 +1,66 @@
+"""
+Order latency behind a burst of data requests, with and without priorities.
+
+A client subscribes --symbols symbols back to back (one reqMktData each)
+and then places an order. With priority scheduling the order overtakes the
+queued data requests; the FIFO run sends everything in one class, as a
+plain rate limiter would. The time reported is from submit_order until the
+mock gateway receives the order. Usage (from the repository root):
+
+    python -m benchmarks.bench_scheduler [--symbols 200] [--rate 40]
+"""
+import argparse
+import logging
+import time
+
+from ibapi import comm
+from ibapi.order import Order
+
+from ib_connection import IBConnection
+from mock_gateway import MockGateway
+from scheduler import PRIORITY_DATA
+
+
+def run(symbols, rate, prioritized):
+    gateway = MockGateway(fill_orders=False).start()
+    ib = IBConnection(message_rate=rate)
+    try:
+        if not ib.connect_and_init(port=gateway.port):
+            raise ConnectionError("Could not connect to the mock gateway")
+        if not prioritized:
+            ib.sendMsg = lambda msg: ib.scheduler.submit(PRIORITY_DATA, comm.make_msg(msg))
+        for i in range(symbols):
+            ib.subscribe(f"SYM{i}")
+
+        order = Order()
+        order.action = "BUY"
+        order.totalQuantity = 10
+        order.orderType = "LMT"
+        order.lmtPrice = 100.0
+        sent_ns = time.perf_counter_ns()
+        ib.submit_order(ib.create_contract("SYM0"), order)
+        if not gateway.wait_for_orders(1, timeout=symbols / rate + 10):
+            raise TimeoutError("The order never reached the gateway")
+        latency = (gateway.orders[0]['received_ns'] - sent_ns) / 1e6
+        depths = ib.scheduler.queue_depths()
+        return latency, depths['data']
+    finally:
+        ib.disconnect()
+        gateway.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=40.0, help="messages per second")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    for name, prioritized in (('FIFO', False), ('priority', True)):
+        latency, behind = run(args.symbols, args.rate, prioritized)
+        print(f"{name:<9} order after {args.symbols} data requests: reached gateway in {latency:9.2f}ms, "
+              f"{behind} data requests still queued")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Import time and cold-start time of the headless entry point.
+
+Import: a fresh interpreter imports main; tkinter must not be loaded.
+Startup: main.py is launched as a subprocess against the mock gateway and
+timed until every symbol is subscribed, and until each strategy has placed
+its first order. Usage (from the repository root):
+
+    python -m benchmarks.bench_startup [--runs 5] [--symbols 4]
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from mock_gateway import MockGateway
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "print(json.dumps({'seconds': time.perf_counter() - started, 'tkinter': 'tkinter' in sys.modules}))\n"
+)
+
+
+def bench_import(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output)
+        if result['tkinter']:
+            raise AssertionError("Importing main loaded tkinter")
+        timings.append(result['seconds'])
+    return timings
+
+
+def bench_startup(symbols):
+    gateway = MockGateway(fill_orders=False).start()
+    names = [f"SYM{i}" for i in range(symbols)]
+    command = [sys.executable, 'main.py', '--port', str(gateway.port), '--log-file', '',
+               '--log-level', 'WARNING']
+    for name in names:
+        command += ['--symbol', name]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT)
+    try:
+        for name in names:
+            if not gateway.wait_for_subscription(name, timeout=10):
+                raise TimeoutError(f"{name} was never subscribed")
+        subscribed = time.perf_counter() - started
+
+        # The first tick a strategy sees becomes its reference price; each
+        # later tick is a further 1.5% drop, so whichever it saw first, the
+        # next one buys
+        price = 100.0
+        while len(gateway.orders) < symbols:
+            if time.perf_counter() - started > 10:
+                raise TimeoutError("Strategies did not place their first orders")
+            for name in names:
+                gateway.publish(name, round(price, 4))
+            price *= 0.985
+            gateway.wait_for_orders(symbols, timeout=0.005)
+        first_orders = time.perf_counter() - started
+
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+        shutdown = time.perf_counter() - stopping
+    finally:
+        if process.poll() is None:
+            process.kill()
+        gateway.stop()
+    return subscribed, first_orders, shutdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--symbols', type=int, default=4)
+    args = parser.parse_args()
+
+    imports = bench_import(args.runs)
+    print(f"import main: median {statistics.median(imports) * 1000:.0f}ms "
+          f"min {min(imports) * 1000:.0f}ms over {args.runs} runs (tkinter not loaded)")
+
+    runs = [bench_startup(args.symbols) for _ in range(args.runs)]
+    subscribed, first_orders, shutdown = (statistics.median(column) for column in zip(*runs))
+    print(f"cold start with {args.symbols} symbols, median of {args.runs}: "
+          f"all subscribed {subscribed * 1000:.0f}ms, first orders {first_orders * 1000:.0f}ms, "
+          f"shutdown {shutdown * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
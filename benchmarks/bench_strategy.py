@@ -0,0 +1,65 @@
+"""
+Many-symbol replay: one strategy call per symbol per tick vs one batched
+evaluation per tick across every symbol.
+
+--symbols random walks of --ticks rows are replayed through the default
+ThresholdStrategy. The per-symbol run calls StockTrader.process_tick for
+every symbol on every row, as a loop over live traders would. The batched
+run is PortfolioBacktest: a single strategy.triggers call per row, with
+process_tick only for the symbols that act. Both must produce the same
+fills. Usage (from the repository root):
+
+    python -m benchmarks.bench_strategy [--symbols 500] [--ticks 2000]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from backtest import BacktestEngine, PortfolioBacktest, synthetic_ticks
+
+
+def per_symbol(symbols, prices, timestamps):
+    traders = []
+    for symbol, column in zip(symbols, prices.T):
+        trader = BacktestEngine(symbol).create_trader()
+        trader.is_trading = True
+        trader.set_reference_price(float(column[0]))
+        traders.append(trader)
+    started = time.perf_counter()
+    for row, timestamp in zip(prices.tolist(), timestamps.tolist()):
+        for trader, price in zip(traders, row):
+            trader.ib.set_price(price, timestamp)
+            trader.process_tick(price)
+            trader.process_pending_events()
+    return time.perf_counter() - started, {symbol: trader.ib.fills for symbol, trader in zip(symbols, traders)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=2000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    prices = np.column_stack([
+        synthetic_ticks(args.ticks, start_price=20.0 + i % 200, volatility=0.001, seed=i, start_time=0)[0]
+        for i in range(args.symbols)
+    ])
+    timestamps = np.arange(args.ticks, dtype=np.int64) * 1_000_000_000
+
+    looped, looped_fills = per_symbol(symbols, prices, timestamps)
+    result = PortfolioBacktest(symbols).run(prices, timestamps)
+    batched_fills = {symbol: entry['trades'] for symbol, entry in result['symbols'].items()}
+
+    ticks = prices.size
+    print(f"per-symbol  {looped:7.3f}s  {ticks / looped / 1e6:6.2f}M ticks/s")
+    print(f"batched     {result['elapsed']:7.3f}s  {ticks / result['elapsed'] / 1e6:6.2f}M ticks/s  "
+          f"({result['events']} of {ticks} ticks reached process_tick)")
+    print(f"same fills: {looped_fills == batched_fills}, {result['total_trades']} round trips")
+
+
+if __name__ == '__main__':
+    main()
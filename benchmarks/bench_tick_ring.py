@@ -0,0 +1,125 @@
+"""
+Reader-thread delay with strategy work in-process vs in a worker process.
+
+A producer thread stands in for the IB reader thread: it wakes for each of
+--ticks ticks at --rate per second and hands the tick on. The consumer
+spends --work-us of pure-Python CPU per tick, like strategy code. In the
+threaded run the consumer shares the producer's GIL through a queue, as
+TradingService does; in the process run it reads a TickRing from another
+process, as ProcessTradingService does. "Late" is how long past its due time
+the producer got to run, i.e. how long decoding would have been held up;
+"latency" is publish-to-consumer time. Usage (from the repository root):
+
+    python -m benchmarks.bench_tick_ring [--ticks 20000] [--rate 5000] [--work-us 100]
+"""
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+
+from latency import LatencyHistogram
+from tick_ring import TickRing
+
+
+def calibrate(work_us):
+    """Loop iterations that take about work_us microseconds"""
+    iterations = 100_000
+    started = time.perf_counter()
+    burn(iterations)
+    return max(1, int(iterations * work_us / ((time.perf_counter() - started) * 1e6)))
+
+
+def burn(iterations):
+    total = 0
+    for i in range(iterations):
+        total += i
+    return total
+
+
+def produce(ticks, rate, publish):
+    """Publish ticks on schedule; returns a histogram of how late each one went out"""
+    late = LatencyHistogram()
+    interval_ns = int(1e9 / rate)
+    due = time.perf_counter_ns()
+    for i in range(ticks):
+        due += interval_ns
+        remaining = due - time.perf_counter_ns()
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+        now = time.perf_counter_ns()
+        late.record(max(0, now - due))
+        publish(i, now)
+    return late
+
+
+def run_threaded(ticks, rate, iterations):
+    ticks_queue = queue.SimpleQueue()
+    latency = LatencyHistogram()
+
+    def consume():
+        while True:
+            ts_ns = ticks_queue.get()
+            if ts_ns is None:
+                return
+            latency.record(time.perf_counter_ns() - ts_ns)
+            burn(iterations)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    late = produce(ticks, rate, lambda i, now: ticks_queue.put(now))
+    ticks_queue.put(None)
+    consumer.join()
+    return late.summary(), latency.summary()
+
+
+def consume_ring(name, ticks, iterations, ready, results):
+    ring = TickRing.attach(name)
+    reader = ring.reader(start=0)
+    latency = LatencyHistogram()
+    ready.set()
+    seen = 0
+    while seen < ticks:
+        batch = reader.poll()
+        if batch is None:
+            time.sleep(0.0001)
+            continue
+        for ts_ns in batch['ts_ns'].tolist():
+            latency.record(time.perf_counter_ns() - ts_ns)
+            burn(iterations)
+        seen += len(batch)
+    results.put(latency.summary())
+    ring.close()
+
+
+def run_process(ticks, rate, iterations):
+    context = multiprocessing.get_context('spawn')
+    ring = TickRing.create(1 << 16)
+    ready = context.Event()
+    results = context.Queue()
+    consumer = context.Process(target=consume_ring, args=(ring.name, ticks, iterations, ready, results))
+    consumer.start()
+    ready.wait()
+    late = produce(ticks, rate, lambda i, now: ring.publish(0, 100.0, 99.99, 100.01, 100.0, now))
+    latency = results.get()
+    consumer.join()
+    ring.close()
+    return late.summary(), latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ticks', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=5000.0, help="ticks per second")
+    parser.add_argument('--work-us', type=float, default=100.0, help="strategy CPU per tick")
+    args = parser.parse_args()
+
+    iterations = calibrate(args.work_us)
+    for name, run in (('threaded', run_threaded), ('process', run_process)):
+        late, latency = run(args.ticks, args.rate, iterations)
+        print(f"{name:<9} producer late p50 {late['p50']:8.1f}us p99 {late['p99']:8.1f}us max {late['max']:8.1f}us   "
+              f"latency p50 {latency['p50']:8.1f}us p99 {latency['p99']:8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,63 @@
 import tkinter as tk
+from collections import deque
 from datetime import datetime
 from tkinter import ttk, messagebox
 import threading
 import logging
 
+from async_logging import TICK_LOGGERS
+
+# Loggers whose records also appear in the GUI log view (per-tick children excluded)
+VIEW_LOGGERS = ('StockTrader', 'IBConnection')
+POSITION_COLUMNS = (('lot', "Lot", 50), ('shares', "Shares", 70), ('price', "Price", 80),
+                    ('stop', "Stop", 80), ('target', "Target", 80), ('time', "Time", 80))
+
+
+class _LogViewHandler(logging.Handler):
+    """Hands records from any thread to TradingGUI.log_message"""
+
+    def __init__(self, gui):
+        super().__init__(logging.INFO)
+        self.gui = gui
+        self.addFilter(lambda record: record.name not in TICK_LOGGERS)
+
+    def emit(self, record):
+        try:
+            self.gui.log_message(f"{record.name}: {record.getMessage()}")
+        except Exception:
+            self.handleError(record)
+
 
 class TradingGUI:
-    def __init__(self, trader):
+    def __init__(self, trader, refresh_rate=10, log_lines=1000):
         self.trader = trader
-        self.trader.ib.gui = self
         self.root = tk.Tk()
         self.root.title("Stock Trading Bot")
         self.logger = logging.getLogger('TradingGUI')
+        # Written by the IB reader thread, drawn by the Tk thread
+        self.latest_price = None
+        self.price_dirty = False
+        self.price_symbol = None
+        # lot_id -> row values as drawn in the positions table
+        self.rendered_positions = {}
+        self.rendered_version = None
+        # The newest log_lines messages; the view shows those matching the
+        # filter. Messages arrive on log_pending from any thread and are
+        # moved over on the Tk thread by refresh
+        self.log_lines = deque(maxlen=log_lines)
+        self.log_pending = deque()
+        self.log_filter = ''
+        self.log_view_lines = 0
+        self.trading_error = None
+        # Connection state as last shown; IBConnection reconnects on its own
+        self.shown_connected = False
+        self.connect_failed = False
+        self.refresh_interval_ms = max(1, int(1000 / refresh_rate))
         self.setup_gui()
+        self.log_handler = _LogViewHandler(self)
+        for name in VIEW_LOGGERS:
+            logging.getLogger(name).addHandler(self.log_handler)
+        self.root.after(self.refresh_interval_ms, self.refresh)
 
     def setup_gui(self):
         # Create main container with padding
@@ -83,39 +128,77 @@ class TradingGUI:
         frame = ttk.LabelFrame(self.main_frame, text="Positions", padding="5")
         frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
 
-        self.position_text = tk.Text(frame, height=5, width=50)
-        self.position_text.grid(row=0, column=0, padx=5)
+        self.position_table = ttk.Treeview(frame, columns=[name for name, _, _ in POSITION_COLUMNS],
+                                           show='headings', height=5)
+        for name, heading, width in POSITION_COLUMNS:
+            self.position_table.heading(name, text=heading)
+            self.position_table.column(name, width=width, anchor=tk.E)
+        self.position_table.grid(row=0, column=0, padx=5)
 
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.position_text.yview)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.position_table.yview)
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.position_text.configure(yscrollcommand=scrollbar.set)
+        self.position_table.configure(yscrollcommand=scrollbar.set)
+
+        self.pnl_label = ttk.Label(frame, text="")
+        self.pnl_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5)
 
     def create_log_section(self):
         frame = ttk.LabelFrame(self.main_frame, text="Log", padding="5")
         frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
 
-        self.log_text = tk.Text(frame, height=6, width=50)
-        self.log_text.grid(row=0, column=0, padx=5)
+        filter_frame = ttk.Frame(frame)
+        filter_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        ttk.Label(filter_frame, text="Filter:").grid(row=0, column=0, padx=5)
+        self.log_filter_var = tk.StringVar()
+        self.log_filter_var.trace_add('write', lambda *_: self.apply_log_filter())
+        ttk.Entry(filter_frame, textvariable=self.log_filter_var, width=30).grid(row=0, column=1, padx=5)
+
+        self.log_text = tk.Text(frame, height=6, width=50, state='disabled')
+        self.log_text.grid(row=1, column=0, padx=5)
 
         scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.log_text.yview)
-        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
         self.log_text.configure(yscrollcommand=scrollbar.set)
 
     def connect_to_ib(self):
-        try:
-            self.trader.ib.connect("127.0.0.1", 7497, 1)
-            threading.Thread(target=self.trader.ib.run).start()
-            self.update_status("Connecting to IB...")
-            self.trader.ib.is_connected = True #todo
+        """Connect on a background thread; refresh shows the outcome"""
+        self.connect_btn.configure(state='disabled')
+        self.update_status("Connecting to IB...")
+        threading.Thread(target=self.connect_worker, daemon=True).start()
+
+    def connect_worker(self):
+        if not self.trader.ib.connect_and_init("127.0.0.1", 7497, 1):
+            self.connect_failed = True
+
+    def check_connection(self):
+        """Follow IBConnection's state, including drops and automatic reconnects"""
+        ib = self.trader.ib
+        if self.connect_failed:
+            self.connect_failed = False
+            self.update_status("Could not connect to IB", error=True)
+            self.connect_btn.configure(state='normal')
+        if ib.is_connected == self.shown_connected:
+            return
+        self.shown_connected = ib.is_connected
+        if ib.is_connected:
+            self.update_status("Connected to IB")
             self.connect_btn.configure(state='disabled')
-        except Exception as e:
-            self.update_status(f"Connection error: {str(e)}", error=True)
+        elif ib.reconnect:
+            self.update_status("Connection to IB lost, reconnecting...", error=True)
+        else:
+            self.update_status("Connection to IB lost", error=True)
+            self.connect_btn.configure(state='normal')
 
     def set_symbol(self):
         symbol = self.symbol_var.get().strip().upper()
         if symbol:
+            if self.price_symbol:
+                self.trader.ib.remove_tick_listener(self.price_symbol, self.on_price_tick)
             self.trader.ib.symbol = symbol
+            self.trader.symbol = symbol
             self.trader.ib.start_price_stream(symbol)
+            self.trader.ib.add_tick_listener(symbol, self.on_price_tick)
+            self.price_symbol = symbol
             self.log_message(f"Started price stream for {symbol}")
         else:
             messagebox.showerror("Error", "Please enter a valid symbol")
@@ -138,11 +221,19 @@ class TradingGUI:
             messagebox.showerror("Error", "Please set reference price first")
             return
 
-        self.trader.start_trading()
+        # The trading loop blocks, keep it off the Tk thread
+        threading.Thread(target=self.run_trading, daemon=True).start()
         self.start_btn.configure(state='disabled')
         self.stop_btn.configure(state='normal')
         self.log_message("Trading started")
 
+    def run_trading(self):
+        try:
+            self.trader.start_trading()
+        except Exception as e:
+            # Reported by refresh() on the Tk thread
+            self.trading_error = str(e)
+
     def stop_trading(self):
         self.trader.stop_trading()
         self.start_btn.configure(state='normal')
@@ -154,19 +245,112 @@ class TradingGUI:
         self.status_label.configure(text=message, style=style)
         self.log_message(message)
 
+    def on_price_tick(self, price):
+        """Called on the IB reader thread; only records the latest price"""
+        self.latest_price = price
+        self.price_dirty = True
+
+    def refresh(self):
+        """Redraw at most refresh_rate times per second on the Tk thread"""
+        try:
+            self.flush_log()
+            self.check_connection()
+            if self.trading_error:
+                self.update_status(f"Trading error: {self.trading_error}", error=True)
+                self.trading_error = None
+                self.stop_trading()
+            if self.price_dirty:
+                self.price_dirty = False
+                self.update_price(self.latest_price)
+            else:
+                self.update_positions()
+        except Exception as e:
+            self.logger.error(f"GUI refresh error: {str(e)}")
+        self.root.after(self.refresh_interval_ms, self.refresh)
+
     def update_price(self, price):
         self.current_price_label.configure(text=f"{price:.2f}")
+        self.update_pnl(price)
         self.update_positions()
 
+    def update_pnl(self, price):
+        """Show running totals; O(1), from the position book's aggregates"""
+        totals = self.trader.pnl_summary(price)
+        self.pnl_label.configure(
+            text=f"Shares: {totals['shares']}  Value: {totals['market_value']:.2f}  "
+                 f"Unrealized: {totals['unrealized']:.2f}  Realized: {totals['realized']:.2f}")
+
     def update_positions(self):
-        self.position_text.delete(1.0, tk.END)
-        for pos in self.trader.positions:
-            self.position_text.insert(tk.END,
-                                      f"Shares: {pos['shares']}, Price: {pos['price']:.2f}, Time: {pos['time'].strftime('%H:%M:%S')}\n")
+        """Apply changed lots to the positions table row by row"""
+        version = self.trader.positions.version
+        if version == self.rendered_version:
+            return
+        self.rendered_version = version
+        table = self.position_table
+        rendered = self.rendered_positions
+        current = {
+            lot.lot_id: (lot.lot_id, lot.shares, f"{lot.price:.2f}", f"{lot.stop_price:.2f}",
+                         f"{lot.target_price:.2f}", lot.timestamp.strftime('%H:%M:%S'))
+            for lot in self.trader.positions
+        }
+        # Deletes first, so insert positions count only rows that stay
+        for lot_id in rendered.keys() - current.keys():
+            table.delete(str(lot_id))
+        for index, (lot_id, values) in enumerate(current.items()):
+            previous = rendered.get(lot_id)
+            if previous is None:
+                table.insert('', index, iid=str(lot_id), values=values)
+            elif previous != values:
+                table.item(str(lot_id), values=values)
+        self.rendered_positions = current
 
     def log_message(self, message):
-        self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')}: {message}\n")
+        """Add a line to the log view; safe from any thread"""
+        self.log_pending.append(f"{datetime.now().strftime('%H:%M:%S')}: {message}")
+
+    def log_matches(self, line):
+        return not self.log_filter or self.log_filter in line.lower()
+
+    def flush_log(self):
+        """Move pending messages into the ring and append those matching the filter"""
+        if not self.log_pending:
+            return
+        shown = []
+        while self.log_pending:
+            line = self.log_pending.popleft()
+            self.log_lines.append(line)
+            if self.log_matches(line):
+                shown.append(line)
+        # The view never holds more than the ring
+        shown = shown[-self.log_lines.maxlen:]
+        if not shown:
+            return
+        self.log_text.configure(state='normal')
+        self.log_text.insert(tk.END, "\n".join(shown) + "\n")
+        self.log_view_lines += len(shown)
+        excess = self.log_view_lines - self.log_lines.maxlen
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_view_lines -= excess
+        self.log_text.configure(state='disabled')
+        self.log_text.see(tk.END)
+
+    def apply_log_filter(self):
+        """Redraw the log view from the ring with the filter's matching lines"""
+        self.flush_log()
+        self.log_filter = self.log_filter_var.get().strip().lower()
+        shown = [line for line in self.log_lines if self.log_matches(line)]
+        self.log_text.configure(state='normal')
+        self.log_text.delete("1.0", tk.END)
+        if shown:
+            self.log_text.insert(tk.END, "\n".join(shown) + "\n")
+        self.log_view_lines = len(shown)
+        self.log_text.configure(state='disabled')
         self.log_text.see(tk.END)
 
     def run(self):
-        self.root.mainloop()
\ No newline at end of file
+        try:
+            self.root.mainloop()
+        finally:
+            for name in VIEW_LOGGERS:
+                logging.getLogger(name).removeHandler(self.log_handler)
\ No newline at end of file
@@ -0,0 +1,364 @@
+"""
+Bulk historical bar loader with a local cache.
+
+Long ranges are split into reqHistoricalData chunks that are sent
+concurrently, within IB's pacing limits. Bars are cached as one .npz file
+of columns per symbol, bar size and UTC day, so a repeat load of complete
+days never touches the network. Usage:
+
+    python historical.py AAPL MSFT --start 2024-01-02 --end 2024-01-31 --bar-size "1 min"
+"""
+import argparse
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from ib_connection import HistoricalDataError, IBConnection
+
+DAY = 86_400
+
+# Bar size -> (seconds per bar, longest request in seconds). Requests never
+# span more than one UTC day, the unit the cache is keyed by.
+BAR_SIZES = {
+    '1 secs': (1, 1800),
+    '5 secs': (5, 3600),
+    '10 secs': (10, 14400),
+    '15 secs': (15, 14400),
+    '30 secs': (30, 28800),
+    '1 min': (60, DAY),
+    '2 mins': (120, DAY),
+    '3 mins': (180, DAY),
+    '5 mins': (300, DAY),
+    '10 mins': (600, DAY),
+    '15 mins': (900, DAY),
+    '20 mins': (1200, DAY),
+    '30 mins': (1800, DAY),
+    '1 hour': (3600, DAY),
+}
+# Bars of 30 seconds or less count towards the 60 requests per 10 minutes limit
+SMALL_BAR_SECONDS = 30
+# Seconds between checks while requests are held back by pacing
+PACING_POLL = 0.05
+
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume', 'average', 'count')
+
+
+def empty_columns():
+    return {name: np.empty(0, dtype=np.int64 if name in ('time', 'count') else np.float64)
+            for name in COLUMNS}
+
+
+def bars_to_columns(bars):
+    """Convert BarData from reqHistoricalData (formatDate 2) to NumPy columns"""
+    return {
+        'time': np.array([int(bar.date) for bar in bars], dtype=np.int64),
+        'open': np.array([bar.open for bar in bars], dtype=np.float64),
+        'high': np.array([bar.high for bar in bars], dtype=np.float64),
+        'low': np.array([bar.low for bar in bars], dtype=np.float64),
+        'close': np.array([bar.close for bar in bars], dtype=np.float64),
+        'volume': np.array([bar.volume for bar in bars], dtype=np.float64),
+        'average': np.array([bar.average for bar in bars], dtype=np.float64),
+        'count': np.array([bar.barCount for bar in bars], dtype=np.int64),
+    }
+
+
+def concat_columns(parts):
+    """Join column dicts, sorted by time with duplicate bars dropped"""
+    parts = [part for part in parts if len(part['time'])]
+    if not parts:
+        return empty_columns()
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+    _, first = np.unique(columns['time'], return_index=True)
+    return {name: values[first] for name, values in columns.items()}
+
+
+def slice_columns(columns, start, end):
+    """Bars with start <= time < end (epoch seconds)"""
+    times = columns['time']
+    lo, hi = np.searchsorted(times, start), np.searchsorted(times, end)
+    return {name: values[lo:hi] for name, values in columns.items()}
+
+
+def bar_prices(columns):
+    """Return (closes, epoch-nanosecond timestamps), the arrays BacktestEngine.run takes"""
+    return columns['close'], columns['time'] * 1_000_000_000
+
+
+def to_epoch(value):
+    """Epoch seconds from a datetime (naive means UTC) or a 'YYYY-MM-DD[ HH:MM:SS]' string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+class PacingLimiter:
+    """
+    Client-side version of IB's historical data pacing rules: at most burst
+    requests per contract and data type in burst_window seconds, and for
+    small bars at most max_requests in any window seconds.
+    """
+
+    def __init__(self, max_requests=60, window=600.0, burst=5, burst_window=2.0):
+        self.max_requests = max_requests
+        self.window = window
+        self.burst = burst
+        self.burst_window = burst_window
+        self.small_requests = deque()
+        self.recent = {}
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+
+    def delay(self, key, small_bars):
+        """Seconds until a request for key is allowed"""
+        now = self.clock()
+        recent = self.recent.setdefault(key, deque())
+        while recent and recent[0] <= now - self.burst_window:
+            recent.popleft()
+        while self.small_requests and self.small_requests[0] <= now - self.window:
+            self.small_requests.popleft()
+        delay = 0.0
+        if len(recent) >= self.burst:
+            delay = recent[0] + self.burst_window - now
+        if small_bars and len(self.small_requests) >= self.max_requests:
+            delay = max(delay, self.small_requests[0] + self.window - now)
+        return delay
+
+    def acquire(self, key, small_bars=True):
+        """Block until a request for key is allowed, then count it"""
+        while True:
+            delay = self.delay(key, small_bars)
+            if delay <= 0:
+                break
+            self.sleep(delay)
+        now = self.clock()
+        self.recent[key].append(now)
+        if small_bars:
+            self.small_requests.append(now)
+
+
+class HistoricalLoader:
+    """
+    Load bars for a symbol over any range, cache first.
+
+    Missing UTC days are split into chunks of at most the longest request
+    IB allows for the bar size, and up to max_in_flight chunks are
+    outstanding at once. A pacing violation puts the chunk back with a
+    delay; other errors abort the load. Only days that have ended are
+    cached, so today's partial data is always fetched again.
+    """
+
+    def __init__(self, ib, cache_dir='history', max_in_flight=10, pacing=None,
+                 timeout=60.0, retries=3, retry_delay=15.0):
+        self.ib = ib
+        self.cache_dir = cache_dir
+        self.max_in_flight = max_in_flight
+        self.pacing = pacing or PacingLimiter()
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.requests = 0
+        self.cache_hits = 0
+        self.logger = logging.getLogger('HistoricalLoader')
+
+    def cache_path(self, symbol, bar_size, what_to_show, use_rth, day):
+        series = f"{bar_size.replace(' ', '')}-{what_to_show}{'-rth' if use_rth else ''}"
+        return os.path.join(self.cache_dir, symbol, series, f"{day:%Y%m%d}.npz")
+
+    def days(self, start, end):
+        """UTC dates covering [start, end) in epoch seconds"""
+        first = datetime.fromtimestamp(start - start % DAY, timezone.utc)
+        return [first + timedelta(days=i) for i in range((end - 1) // DAY - start // DAY + 1)]
+
+    def missing_days(self, symbol, start, end, bar_size='1 min', what_to_show='TRADES', use_rth=False):
+        start, end = to_epoch(start), to_epoch(end)
+        return [day for day in self.days(start, end)
+                if not os.path.exists(self.cache_path(symbol, bar_size, what_to_show, use_rth, day))]
+
+    def load(self, symbol, start, end, bar_size='1 min', what_to_show='TRADES', use_rth=False):
+        """
+        Bars for symbol with start <= time < end
+        start, end: datetimes (naive means UTC), ISO date strings or epoch seconds
+        Returns: dict of NumPy columns (see COLUMNS), 'time' in epoch seconds
+        """
+        return self.load_many([symbol], start, end, bar_size, what_to_show, use_rth)[symbol]
+
+    def load_many(self, symbols, start, end, bar_size='1 min', what_to_show='TRADES', use_rth=False):
+        """
+        load for several symbols at once. Their missing days share one request
+        pipeline, so while one symbol waits on pacing the others keep going.
+        Returns: {symbol: columns}
+        """
+        if bar_size not in BAR_SIZES:
+            raise ValueError(f"Unsupported bar size {bar_size!r}; one of {', '.join(BAR_SIZES)}")
+        start, end = to_epoch(start), to_epoch(end)
+        started = time.perf_counter()
+        parts = {symbol: [] for symbol in symbols}
+        missing = []
+        for symbol in symbols:
+            for day in self.days(start, end):
+                path = self.cache_path(symbol, bar_size, what_to_show, use_rth, day)
+                if os.path.exists(path):
+                    with np.load(path) as data:
+                        parts[symbol].append({name: data[name] for name in COLUMNS})
+                    self.cache_hits += 1
+                else:
+                    missing.append((symbol, day))
+        cached = sum(len(symbol_parts) for symbol_parts in parts.values())
+        if missing:
+            for (symbol, _), columns in self.fetch(missing, bar_size, what_to_show, use_rth).items():
+                parts[symbol].append(columns)
+
+        result = {symbol: slice_columns(concat_columns(symbol_parts), start, end)
+                  for symbol, symbol_parts in parts.items()}
+        self.logger.info(f"Loaded {sum(len(columns['time']) for columns in result.values())} {bar_size} bars "
+                         f"of {', '.join(symbols)}: {len(missing)} days fetched, {cached} cached, "
+                         f"{time.perf_counter() - started:.2f}s")
+        return result
+
+    def fetch(self, days, bar_size, what_to_show='TRADES', use_rth=False):
+        """
+        Request (symbol, UTC day) pairs from TWS and cache the days that have ended
+        Returns: {(symbol, day): columns}
+        """
+        if self.ib is None or not self.ib.is_connected:
+            raise ConnectionError(f"Not connected to IB; {len(days)} symbol days are not cached")
+        bar_seconds, chunk_seconds = BAR_SIZES[bar_size]
+        small_bars = bar_seconds <= SMALL_BAR_SECONDS
+        contracts = {}
+        now = time.time()
+
+        # [symbol, day, chunk start, chunk end, attempt, not before], symbols interleaved
+        by_symbol = {}
+        for symbol, day in days:
+            if symbol not in contracts:
+                contracts[symbol] = self.ib.create_contract(symbol)
+            day_start = int(day.timestamp())
+            for chunk_start in range(day_start, min(day_start + DAY, int(now)), chunk_seconds):
+                chunk_end = min(chunk_start + chunk_seconds, day_start + DAY)
+                by_symbol.setdefault(symbol, []).append([symbol, day, chunk_start, chunk_end, 0, 0.0])
+        pending = [chunk for chunks in itertools.zip_longest(*by_symbol.values()) for chunk in chunks if chunk]
+        results = {key: [] for key in days}
+        in_flight = {}
+
+        while pending or in_flight:
+            while len(in_flight) < self.max_in_flight:
+                index = self._ready_chunk(pending, what_to_show, small_bars)
+                if index is None:
+                    break
+                chunk = pending.pop(index)
+                symbol, _, chunk_start, chunk_end, _, _ = chunk
+                self.pacing.acquire((symbol, what_to_show), small_bars)
+                end_time = datetime.fromtimestamp(chunk_end, timezone.utc).strftime('%Y%m%d %H:%M:%S UTC')
+                future = self.ib.request_historical_bars(contracts[symbol], end_time,
+                                                         f"{chunk_end - chunk_start} S",
+                                                         bar_size, what_to_show, use_rth)
+                in_flight[future] = (chunk, time.monotonic())
+                self.requests += 1
+
+            # Poll while chunks are held back by pacing or a retry delay
+            poll = PACING_POLL if pending else self.timeout
+            if in_flight:
+                done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(poll)
+                done = ()
+            if not done and in_flight:
+                oldest = min(sent for _, sent in in_flight.values())
+                if time.monotonic() - oldest > self.timeout:
+                    raise TimeoutError(f"No historical data reply within {self.timeout}s")
+            for future in done:
+                chunk, _ = in_flight.pop(future)
+                symbol, day, chunk_start, chunk_end, attempt, _ = chunk
+                try:
+                    bars = future.result()
+                except HistoricalDataError as e:
+                    if not e.pacing_violation or attempt >= self.retries:
+                        raise
+                    self.logger.warning(f"Pacing violation for {symbol}, retrying in {self.retry_delay}s")
+                    chunk[4] = attempt + 1
+                    chunk[5] = time.monotonic() + self.retry_delay
+                    pending.append(chunk)
+                    continue
+                results[symbol, day].append(slice_columns(bars_to_columns(bars), chunk_start, chunk_end))
+
+        fetched = {}
+        for (symbol, day), parts in results.items():
+            fetched[symbol, day] = columns = concat_columns(parts)
+            if int(day.timestamp()) + DAY <= now:
+                self.write_cache(self.cache_path(symbol, bar_size, what_to_show, use_rth, day), columns)
+        return fetched
+
+    def _ready_chunk(self, pending, what_to_show, small_bars):
+        """Index of the first pending chunk that may be sent now, or None"""
+        now = time.monotonic()
+        blocked = set()
+        for index, chunk in enumerate(pending):
+            symbol = chunk[0]
+            if chunk[5] > now or symbol in blocked:
+                continue
+            if self.pacing.delay((symbol, what_to_show), small_bars) <= 0:
+                return index
+            blocked.add(symbol)
+        return None
+
+    def write_cache(self, path, columns):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--start', required=True, help="UTC date or datetime, e.g. 2024-01-02")
+    parser.add_argument('--end', required=True, help="exclusive UTC date or datetime")
+    parser.add_argument('--bar-size', default='1 min', choices=list(BAR_SIZES))
+    parser.add_argument('--what', default='TRADES', help="whatToShow: TRADES, MIDPOINT, BID, ASK, ...")
+    parser.add_argument('--rth', action='store_true', help="regular trading hours only")
+    parser.add_argument('--cache-dir', default='history')
+    parser.add_argument('--max-in-flight', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7497)
+    parser.add_argument('--client-id', type=int, default=7, help="separate from the trading client's ID")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    symbols = [symbol.upper() for symbol in args.symbols]
+    loader = HistoricalLoader(None, args.cache_dir, args.max_in_flight)
+    if any(loader.missing_days(symbol, args.start, args.end, args.bar_size, args.what, args.rth)
+           for symbol in symbols):
+        # Only connect when something has to be downloaded
+        loader.ib = IBConnection()
+        if not loader.ib.connect_and_init(args.host, args.port, args.client_id):
+            return 1
+    try:
+        result = loader.load_many(symbols, args.start, args.end, args.bar_size, args.what, args.rth)
+    finally:
+        if loader.ib is not None:
+            loader.ib.disconnect()
+    for symbol, columns in result.items():
+        if len(columns['time']):
+            first = datetime.fromtimestamp(columns['time'][0], timezone.utc)
+            last = datetime.fromtimestamp(columns['time'][-1], timezone.utc)
+            print(f"{symbol}: {len(columns['time'])} bars from {first:%Y-%m-%d %H:%M} "
+                  f"to {last:%Y-%m-%d %H:%M} UTC")
+        else:
+            print(f"{symbol}: no bars")
+    print(f"{loader.requests} requests, {loader.cache_hits} cached symbol days")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,34 +1,148 @@
+from ibapi import comm
 from ibapi.client import EClient
+from ibapi.message import OUT
+from ibapi.server_versions import MIN_SERVER_VER_ORDER_CONTAINER
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
-from ibapi.order import Order
+from ibapi.execution import ExecutionFilter
+from concurrent.futures import Future
+import itertools
 import threading
 import time
-import queue
 import logging
+from market_data import QuoteTable
+from latency import LatencyTracker
+from order_ids import OrderIdAllocator
+from order_store import OrderStore
+from scheduler import OutboundScheduler, PRIORITY_CANCEL, PRIORITY_ORDER, PRIORITY_DATA
+
+# Order states after which TWS sends no further updates
+TERMINAL_ORDER_STATUSES = ('Filled', 'Cancelled', 'ApiCancelled', 'Inactive')
+# TWS error codes that reject an order outright
+ORDER_REJECT_CODES = (103, 201, 203)
+DUPLICATE_ORDER_ID = 103
+# Outbound message id -> scheduler priority; anything else is a data request
+MESSAGE_PRIORITIES = {
+    OUT.CANCEL_ORDER: PRIORITY_CANCEL,
+    OUT.REQ_GLOBAL_CANCEL: PRIORITY_CANCEL,
+    OUT.PLACE_ORDER: PRIORITY_ORDER,
+}
+# Price tickType -> the size tickType ibapi's decoder reports right after it,
+# from the same message: bid, ask and last
+PAIRED_SIZE_TICKS = {1: 0, 2: 3, 4: 5}
+# Historical data farm errors, including "no data" and pacing violations
+HISTORICAL_DATA_ERROR = 162
+# Sent by TWS about its own link to IB: lost, restored with market data
+# subscriptions dropped, restored with subscriptions kept
+CONNECTIVITY_LOST = 1100
+CONNECTIVITY_RESTORED_DATA_LOST = 1101
+CONNECTIVITY_RESTORED = 1102
+# ibapi's "Not connected", used to fail requests cut off by a lost socket
+NOT_CONNECTED = 504
+# ibapi's "Couldn't connect to TWS"; expected while reconnecting
+CONNECT_FAIL = 502
+
+
+class HistoricalDataError(Exception):
+    """A reqHistoricalData request failed; code and message are from TWS"""
+
+    def __init__(self, code, message):
+        super().__init__(f"Error {code}: {message}")
+        self.code = code
+        self.message = message
+
+    @property
+    def pacing_violation(self):
+        return 'pacing violation' in self.message.lower()
+
 
 class IBConnection(EClient, EWrapper):
-    def __init__(self):
+    def __init__(self, order_ttl=300.0, max_terminal_orders=10000, order_archive=None,
+                 message_rate=40.0, message_burst=10, reconnect=True, reconnect_delay=0.5,
+                 reconnect_max_delay=30.0):
         EClient.__init__(self, self)
-        self.next_order_id = None
-        self.orders = {}
-        self.order_id_ready = threading.Event()
+        # Every request leaves through here, within the gateway's message rate
+        self.scheduler = OutboundScheduler(self._write, message_rate, message_burst)
+        self.order_ids = OrderIdAllocator()
+        # Held from taking an order ID to queueing its placeOrder, so orders
+        # from several threads reach TWS in ID order (it rejects a lower ID
+        # sent after a higher one)
+        self.submit_lock = threading.Lock()
+        # Order ID whose placeOrder is being issued; EClient reports a closed
+        # socket for it synchronously as error 504
+        self.placing = None
+        # Finished orders are evicted after order_ttl seconds or beyond
+        # max_terminal_orders, and appended to order_archive if set
+        self.orders = OrderStore(order_ttl, max_terminal_orders, order_archive)
+        self.order_futures = {}
+        self.order_id_ready = self.order_ids.ready
         self.logger = logging.getLogger('IBConnection')
-        self.current_price = 0
+        # Per-tick messages; rate limited when async logging is set up
+        self.tick_logger = logging.getLogger('IBConnection.ticks')
         self.symbol = None
         self.is_connected = False
         self.data = {}
         self.contract = None
-        self.gui = None
+        # Market data subscriptions: reqId -> symbol and symbol -> reqId
+        self.quotes = QuoteTable()
+        self.subscriptions = {}
+        self.req_ids = {}
+        self.req_slots = {}
+        self.contracts = {}
+        # Shared by every request type; next() on a count is atomic, so callers on
+        # different threads never draw the same reqId
+        self.req_id_counter = itertools.count(1)
+        self.tick_listeners = {}
+        # Symbols streamed tick by tick: symbol -> (BidAsk reqId, AllLast reqId)
+        self.tick_by_tick = {}
+        self.recorder = None
+        # Monotonic arrival time of the tick currently being dispatched
+        self.last_tick_ns = 0
+        # (reqId, size tickType, price tickType, price) of a price waiting for
+        # the size tick decoded from the same message
+        self.pending_tick = None
+        self.latency = LatencyTracker()
+        # Broker state collected by request_broker_state
+        self.broker_positions = {}
+        self.broker_open_orders = {}
+        self.broker_state_done = {}
+        # reqHistoricalData requests in flight: reqId -> {'bars', 'future'}
+        self.historical_requests = {}
+        # Reconnect supervision. A dropped socket starts a supervisor thread
+        # that retries every reconnect_delay seconds, doubling up to
+        # reconnect_max_delay; disconnect() stops it
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.address = None
+        self.connecting = False
+        self.close_requested = threading.Event()
+        self.reader_thread = None
+        self.supervisor = None
+        self.reconnects = 0
+        # Callables invoked with the broker state fetched after each reconnect
+        self.reconnect_listeners = []
 
     def connect_and_init(self, host='127.0.0.1', port=7497, client_id=1):
         """Connect to TWS and initialize order ID"""
+        self.address = (host, port, client_id)
+        self.close_requested.clear()
+        return self.open_session(host, port, client_id)
+
+    def open_session(self, host, port, client_id):
+        """One connection attempt; returns True once TWS has sent a valid order ID"""
+        self.connecting = True
         try:
+            self.order_id_ready.clear()
+            self.scheduler.start()
             # Connect to TWS
             self.connect(host, port, client_id)
+            if not self.isConnected():
+                raise ConnectionError(f"Could not connect to {host}:{port}")
             # Start the client thread
-            thread = threading.Thread(target=self.run)
+            thread = threading.Thread(target=self.run, name='ib-reader')
             thread.daemon = True
+            self.reader_thread = thread
             thread.start()
 
             # Wait for nextValidId to be received
@@ -45,55 +159,466 @@ class IBConnection(EClient, EWrapper):
             self.logger.error(f"Connection error: {str(e)}")
             self.is_connected = False
             return False
+        finally:
+            self.connecting = False
+
+    def sendMsg(self, msg):
+        """Queue an encoded request with the outbound scheduler instead of writing it directly"""
+        msg_id = int(msg[:msg.index('\0')])
+        priority = MESSAGE_PRIORITIES.get(msg_id, PRIORITY_DATA)
+        key = None
+        if msg_id == OUT.PLACE_ORDER:
+            # msgId, [version before order containers,] orderId, ...
+            fields = msg.split('\0', 3)
+            key = int(fields[1] if self.serverVersion() >= MIN_SERVER_VER_ORDER_CONTAINER else fields[2])
+        elif msg_id == OUT.CANCEL_ORDER:
+            key = int(msg.split('\0', 3)[2])  # msgId, version, orderId
+        self.scheduler.submit(priority, comm.make_msg(msg), key)
+
+    def _write(self, data, priority=PRIORITY_DATA, key=None):
+        conn = self.conn
+        if conn is not None:
+            # Stamped first: the reader thread can see the ack before sendMsg returns
+            if priority == PRIORITY_ORDER:
+                self.latency.order_written(key, time.perf_counter_ns())
+            conn.sendMsg(data)
+
+    def disconnect(self):
+        # EClient calls this itself when a connect attempt fails and when the
+        # reader loop ends on a dropped socket; any other call is a request
+        # to close, which also stops reconnecting
+        if not self.connecting and threading.current_thread() is not self.reader_thread:
+            self.close_requested.set()
+        # Orders still queued never reached TWS
+        for order_id in self.scheduler.stop():
+            if order_id in self.order_futures:
+                self.reject_order(order_id, "Not sent: connection closed")
+        EClient.disconnect(self)
+
+    def stop_reconnecting(self):
+        """Stop a reconnect supervisor that is still retrying, without touching the socket"""
+        self.close_requested.set()
+
+    def connectionClosed(self):
+        """Called by EClient whenever the socket closes, asked for or not; may repeat"""
+        was_connected, self.is_connected = self.is_connected, False
+        if not was_connected or self.connecting or self.close_requested.is_set():
+            return
+        self.logger.error("Connection to TWS lost")
+        for req_id in list(self.historical_requests):
+            request = self.historical_requests.pop(req_id, None)
+            if request is not None:
+                request['future'].set_exception(HistoricalDataError(NOT_CONNECTED, "Connection to TWS lost"))
+        if self.reconnect and self.address and not (self.supervisor and self.supervisor.is_alive()):
+            self.supervisor = threading.Thread(target=self.supervise, name='ib-reconnect', daemon=True)
+            self.supervisor.start()
+
+    def supervise(self):
+        """
+        Reconnect with exponential backoff until connected or disconnect() is
+        called, then restore market data and settle orders against one
+        bulk request_broker_state
+        """
+        lost = time.monotonic()
+        # The old reader thread resets the client on its way out
+        if self.reader_thread is not None:
+            self.reader_thread.join(timeout=5)
+        delay = self.reconnect_delay
+        attempts = 0
+        while not self.close_requested.is_set():
+            attempts += 1
+            if self.open_session(*self.address):
+                break
+            self.logger.warning(f"Reconnect attempt {attempts} failed, retrying in {delay:.1f}s")
+            if self.close_requested.wait(delay):
+                return
+            delay = min(delay * 2, self.reconnect_max_delay)
+        if self.close_requested.is_set():
+            return
+
+        # Orders first: resubscribing queues a request per symbol within the message rate
+        broker_state = None
+        try:
+            broker_state = self.request_broker_state()
+            settled = self.settle_orders(broker_state)
+        except TimeoutError as e:
+            self.logger.error(f"Reconciliation after reconnect failed: {str(e)}")
+            settled = 0
+        restored = self.restore_subscriptions()
+        self.reconnects += 1
+        self.logger.info(f"Reconnected in {time.monotonic() - lost:.2f}s after {attempts} attempts: "
+                         f"{restored} subscriptions restored, {settled} orders settled")
+        if broker_state is not None:
+            for listener in list(self.reconnect_listeners):
+                try:
+                    listener(broker_state)
+                except Exception as e:
+                    self.logger.error(f"Reconnect listener failed: {str(e)}")
+
+    def restore_subscriptions(self):
+        """
+        Re-issue every market data and tick-by-tick request under its
+        original reqId, so quote slots, listeners and recordings carry on
+        Returns: number of symbols resubscribed
+        """
+        for symbol, req_id in list(self.req_ids.items()):
+            self.reqMktData(req_id, self.contracts[symbol], "", False, False, [])
+        for symbol, (bid_ask_id, all_last_id) in list(self.tick_by_tick.items()):
+            contract = self.contracts[symbol]
+            self.reqTickByTickData(bid_ask_id, contract, "BidAsk", 0, False)
+            self.reqTickByTickData(all_last_id, contract, "AllLast", 0, False)
+        return len(self.req_ids)
+
+    def settle_orders(self, broker_state):
+        """
+        Resolve the futures of orders that finished while disconnected: any
+        order the broker no longer lists as open is done, filled by whatever
+        executions it reported
+        Returns: number of orders settled
+        """
+        open_orders = broker_state['open_orders']
+        executions = broker_state['executions']
+        settled = 0
+        for order_id in list(self.order_futures):
+            if order_id in open_orders:
+                continue
+            fills = executions.get(order_id, [])
+            filled = sum(fill['shares'] for fill in fills)
+            average = sum(fill['shares'] * fill['price'] for fill in fills) / filled if filled else 0.0
+            # The last status seen gives the order size; without one, fills are all we know
+            previous = self.orders.get(order_id)
+            quantity = previous.filled + previous.remaining if previous else filled
+            status = 'Filled' if filled and filled >= quantity else 'Cancelled'
+            record = self.orders.update(order_id, status, filled, max(0.0, quantity - filled),
+                                        average, 'reconnected', True)
+            self.resolve_order(order_id, record.as_dict())
+            self.logger.info(f"Order {order_id} finished while disconnected: {status}, {filled} filled")
+            settled += 1
+        return settled
+
+    def add_reconnect_listener(self, callback):
+        """Register a callable invoked with request_broker_state's result after each reconnect"""
+        if callback not in self.reconnect_listeners:
+            self.reconnect_listeners.append(callback)
+
+    def remove_reconnect_listener(self, callback):
+        if callback in self.reconnect_listeners:
+            self.reconnect_listeners.remove(callback)
 
     def nextValidId(self, orderId: int):
-        """Called by TWS with next valid order ID"""
-        self.next_order_id = orderId
+        """Called by TWS with next valid order ID, on connect and after reqIds"""
         self.logger.info(f"Received next valid order ID: {orderId}")
+        self.order_ids.sync(orderId)
+
+    @property
+    def next_order_id(self):
+        return self.order_ids.peek()
 
     def get_next_order_id(self):
         """Get and increment next valid order ID"""
-        if self.next_order_id is None:
+        order_id = self.order_ids.next()
+        if order_id is None:
             self.logger.error("No valid order ID available")
-            return None
+        return order_id
 
-        current_id = self.next_order_id
-        self.next_order_id += 1
-        return current_id
+    def resync_order_ids(self):
+        """Ask TWS for the next valid ID; nextValidId moves the allocator forward"""
+        self.reqIds(-1)
+
+    def submit_order(self, contract, order, tick_ns=0, decision_ns=0):
+        """
+        Place an order without waiting for it
+        tick_ns: perf_counter_ns arrival time of the tick that triggered it
+        decision_ns: perf_counter_ns time the order was decided on; now if 0
+        Returns: (order_id, future); the future resolves with the final
+        order status dict once the order is filled, cancelled or rejected
+        """
+        if not decision_ns:
+            decision_ns = time.perf_counter_ns()
+        with self.submit_lock:
+            order_id = self.get_next_order_id()
+            if order_id is None:
+                return None, None
+            future = Future()
+            # Register before sending so a fast fill cannot be missed
+            self.order_futures[order_id] = future
+            # Before placeOrder: an idle scheduler writes the order on this thread
+            self.latency.order_submitted(order_id, tick_ns, decision_ns, time.perf_counter_ns())
+            self.placing = order_id
+            try:
+                self.placeOrder(order_id, contract, order)
+            finally:
+                self.placing = None
+        return order_id, future
 
     def orderStatus(self, orderId, status, filled, remaining,
                    avgFillPrice, permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
         """Store order status updates"""
-        self.orders[orderId] = {
-            'status': status,
-            'filled': filled,
-            'remaining': remaining,
-            'avgFillPrice': avgFillPrice,
-            'whyHeld': whyHeld
+        terminal = status in TERMINAL_ORDER_STATUSES
+        record = self.orders.update(orderId, status, float(filled), float(remaining),
+                                    avgFillPrice, whyHeld, terminal)
+        self.latency.order_status(orderId, status, time.perf_counter_ns(), terminal)
+        self.logger.info("Order %s status: %s, Filled: %s @ %s", orderId, status, filled, avgFillPrice)
+        if terminal:
+            self.resolve_order(orderId, record.as_dict())
+        elif 'open_orders' in self.broker_state_done and not self.broker_state_done['open_orders'].is_set():
+            # reqOpenOrders replies carry an orderStatus for each working order
+            self.broker_open_orders.setdefault(orderId, {'status': status})
+
+    def reject_order(self, order_id, reason):
+        """Finish an order TWS will never report on with status 'Error'"""
+        previous = self.orders.get(order_id)
+        record = self.orders.update(
+            order_id, 'Error',
+            previous.filled if previous else 0.0,
+            previous.remaining if previous else 0.0,
+            previous.avg_fill_price if previous else 0.0,
+            reason, True
+        )
+        self.resolve_order(order_id, record.as_dict())
+
+    def resolve_order(self, order_id, order_status):
+        self.latency.order_done(order_id)
+        future = self.order_futures.pop(order_id, None)
+        if future is not None and not future.done():
+            future.set_result(order_status)
+
+    def execDetails(self, reqId, contract, execution):
+        """Keep each partial or complete fill reported by TWS"""
+        added = self.orders.add_execution(execution.orderId, {
+            'execId': execution.execId,
+            'shares': float(execution.shares),
+            'price': execution.price,
+            'time': execution.time
+        })
+        # Live reports and reqExecutions replies overlap
+        if not added:
+            return
+        self.logger.info("Execution %s for order %s: %s %s @ %s", execution.execId,
+                         execution.orderId, execution.shares, contract.symbol, execution.price)
+
+    def execDetailsEnd(self, reqId):
+        self.broker_state_done['executions'].set()
+
+    def position(self, account, contract, position, avgCost):
+        self.broker_positions[contract.symbol] = (float(position), avgCost)
+
+    def positionEnd(self):
+        self.broker_state_done['positions'].set()
+
+    def openOrder(self, orderId, contract, order, orderState):
+        self.broker_open_orders[orderId] = {
+            'symbol': contract.symbol,
+            'action': order.action,
+            'quantity': float(order.totalQuantity),
+            'parent_id': order.parentId,
+            'status': orderState.status
+        }
+
+    def openOrderEnd(self):
+        self.broker_state_done['open_orders'].set()
+
+    def request_broker_state(self, timeout=10.0):
+        """
+        Request positions, open orders and today's executions in one round
+        trip and wait for all three end markers
+        Returns: dict with 'positions' {symbol: (shares, avg_cost)},
+        'open_orders' {order_id: ...} and 'executions' {order_id: [fills]}
+        """
+        self.broker_positions = {}
+        self.broker_open_orders = {}
+        self.broker_state_done = {name: threading.Event() for name in ('positions', 'open_orders', 'executions')}
+        req_id = next(self.req_id_counter)
+        self.reqPositions()
+        self.reqOpenOrders()
+        self.reqExecutions(req_id, ExecutionFilter())
+
+        deadline = time.monotonic() + timeout
+        for name, done in self.broker_state_done.items():
+            if not done.wait(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"Timeout waiting for broker {name}")
+        self.cancelPositions()
+        return {
+            'positions': dict(self.broker_positions),
+            'open_orders': dict(self.broker_open_orders),
+            'executions': self.orders.executions(),
         }
-        self.logger.info(f"Order {orderId} status: {status}, Filled: {filled} @ {avgFillPrice}")
+
+    def request_historical_bars(self, contract, end, duration, bar_size, what_to_show='TRADES', use_rth=False):
+        """
+        Request one chunk of historical bars without waiting
+        end: endDateTime such as '20240105 16:00:00 UTC'
+        duration: durationStr such as '1800 S'
+        Returns: future resolved with a list of BarData (empty when TWS has
+        no data for the range), or failed with HistoricalDataError
+        """
+        req_id = next(self.req_id_counter)
+        future = Future()
+        # Register before sending so the reply cannot be missed
+        self.historical_requests[req_id] = {'bars': [], 'future': future}
+        # formatDate 2: bar times as epoch seconds
+        self.reqHistoricalData(req_id, contract, end, duration, bar_size, what_to_show,
+                               int(use_rth), 2, False, [])
+        return future
+
+    def historicalData(self, reqId, bar):
+        request = self.historical_requests.get(reqId)
+        if request is not None:
+            request['bars'].append(bar)
+
+    def historicalDataEnd(self, reqId, start, end):
+        request = self.historical_requests.pop(reqId, None)
+        if request is not None:
+            request['future'].set_result(request['bars'])
 
     def get_order_status(self, order_id):
-        """Get current status for an order"""
-        return self.orders.get(order_id)
+        """
+        Get current status for an order
+        Returns: status dict, or None if unknown or already evicted
+        """
+        record = self.orders.get(order_id)
+        return record.as_dict() if record else None
 
     def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
         """Handle error messages from TWS"""
+        request = self.historical_requests.pop(reqId, None)
+        if request is not None:
+            # Weekends and holidays: an empty result, not a failure
+            if errorCode == HISTORICAL_DATA_ERROR and 'returned no data' in errorString:
+                self.logger.debug(f"No historical data for reqId {reqId}")
+                request['future'].set_result([])
+            else:
+                self.logger.error(f"Error {errorCode}: {errorString}")
+                request['future'].set_exception(HistoricalDataError(errorCode, errorString))
+            return
+        if errorCode == CONNECT_FAIL and self.connecting:
+            # open_session reports the failed attempt itself
+            self.logger.debug(f"Error {errorCode}: {errorString}")
+            return
+        if errorCode == CONNECTIVITY_RESTORED_DATA_LOST:
+            self.logger.warning(f"Error {errorCode}: {errorString}")
+            self.restore_subscriptions()
+            return
+        if errorCode in (CONNECTIVITY_LOST, CONNECTIVITY_RESTORED):
+            self.logger.warning(f"Error {errorCode}: {errorString}")
+            return
         self.logger.error(f"Error {errorCode}: {errorString}")
+        # A 504 for any other request (a cancel, market data) leaves orders alone
+        rejected = errorCode in ORDER_REJECT_CODES or (errorCode == NOT_CONNECTED and reqId == self.placing)
+        if rejected and reqId in self.order_futures:
+            self.reject_order(reqId, errorString)
+        if errorCode == DUPLICATE_ORDER_ID:
+            self.resync_order_ids()
+
+    @property
+    def current_price(self):
+        """Last price of the primary symbol set via start_price_stream"""
+        return self.quotes.get(self.symbol)
+
+    def get_last_price(self, symbol):
+        return self.quotes.get(symbol)
 
     def start_price_stream(self, symbol):
+        """Make symbol the primary instrument and subscribe to its prices"""
         if not self.is_connected:
             self.logger.error("Not connected to IB")
             return
         self.symbol = symbol
         self.contract = self.create_contract(symbol)
+        self.subscribe(symbol)
+
+    def subscribe(self, symbol, tick_by_tick=False):
+        """
+        Request streaming market data for symbol; returns its reqId
+        tick_by_tick: also stream unaggregated BidAsk and AllLast ticks,
+        which then drive the tick listeners
+        """
+        if not self.is_connected:
+            self.logger.error("Not connected to IB")
+            return None
+        req_id = self.req_ids.get(symbol)
+        if req_id is not None:
+            if tick_by_tick:
+                self.subscribe_tick_by_tick(symbol)
+            return req_id
+
+        req_id = next(self.req_id_counter)
+        contract = self.create_contract(symbol)
+        # Register before requesting so the first tick can be routed
+        self.contracts[symbol] = contract
+        self.req_slots[req_id] = self.quotes.add_symbol(symbol)
+        self.subscriptions[req_id] = symbol
+        self.req_ids[symbol] = req_id
+        if self.recorder:
+            self.recorder.set_symbol(req_id, symbol)
 
         # Add debug logging
-        self.logger.info(f"Requesting market data for {symbol}")
+        self.logger.info(f"Requesting market data for {symbol} (reqId {req_id})")
         # Request all tick types
         # generic_tick_list = "233"  # Request all price data
         generic_tick_list = ""  # Request all price data
-        self.reqMktData(1, self.contract, generic_tick_list, False, False, [])
+        self.reqMktData(req_id, contract, generic_tick_list, False, False, [])
+        if tick_by_tick:
+            self.subscribe_tick_by_tick(symbol)
+        return req_id
+
+    def subscribe_tick_by_tick(self, symbol):
+        """
+        Stream every BidAsk and AllLast tick for an already subscribed
+        symbol. reqMktData keeps supplying high, low, close and volume.
+        """
+        if symbol in self.tick_by_tick:
+            return
+        slot = self.quotes.slots[symbol]
+        contract = self.contracts[symbol]
+        req_ids = (next(self.req_id_counter), next(self.req_id_counter))
+        for req_id in req_ids:
+            self.req_slots[req_id] = slot
+            self.subscriptions[req_id] = symbol
+            if self.recorder:
+                self.recorder.set_symbol(req_id, symbol)
+        # Registered first: from here on tickPrice stops driving the listeners
+        self.tick_by_tick[symbol] = req_ids
+        self.logger.info(f"Requesting tick-by-tick data for {symbol} (reqIds {req_ids[0]}, {req_ids[1]})")
+        self.reqTickByTickData(req_ids[0], contract, "BidAsk", 0, False)
+        self.reqTickByTickData(req_ids[1], contract, "AllLast", 0, False)
+
+    def unsubscribe(self, symbol):
+        req_id = self.req_ids.pop(symbol, None)
+        if req_id is None:
+            return
+        self.cancelMktData(req_id)
+        self.subscriptions.pop(req_id, None)
+        self.req_slots.pop(req_id, None)
+        for tick_req_id in self.tick_by_tick.pop(symbol, ()):
+            self.cancelTickByTickData(tick_req_id)
+            self.subscriptions.pop(tick_req_id, None)
+            self.req_slots.pop(tick_req_id, None)
+        self.logger.info(f"Cancelled market data for {symbol} (reqId {req_id})")
+
+    def start_recording(self, directory):
+        """Append every tick to per-day binary files under directory"""
+        from tick_recorder import TickRecorder
+        recorder = TickRecorder(directory)
+        for req_id, symbol in self.subscriptions.items():
+            recorder.set_symbol(req_id, symbol)
+        self.recorder = recorder
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+
+    def add_tick_listener(self, symbol, callback):
+        """Register a callable invoked with every last-price tick for symbol"""
+        listeners = self.tick_listeners.setdefault(symbol, [])
+        if callback not in listeners:
+            listeners.append(callback)
+
+    def remove_tick_listener(self, symbol, callback):
+        listeners = self.tick_listeners.get(symbol)
+        if listeners and callback in listeners:
+            listeners.remove(callback)
 
     def create_contract(self, symbol, sec_type="STK", exchange="SMART", currency="USD"):
         contract = Contract()
@@ -104,8 +629,20 @@ class IBConnection(EClient, EWrapper):
         return contract
 
     def tickPrice(self, reqId, tickType, price, attrib):
+        self.last_tick_ns = time.perf_counter_ns()
+        slot = self.req_slots.get(reqId)
+        if slot is None:
+            return
+        symbol = self.subscriptions[reqId]
+        size_type = PAIRED_SIZE_TICKS.get(tickType)
+        if size_type is not None:
+            # The decoder reports this tick's size in the tickSize call that
+            # follows; the tick is recorded with it, and a trade dispatched, there
+            self.pending_tick = (reqId, size_type, tickType, price)
+        elif self.recorder:
+            self.recorder.record(reqId, tickType, price)
 
-        self.logger.info(f"Received tick: Type={tickType}, Price={price}")
+        self.tick_logger.debug("Received tick: %s Type=%s, Price=%s", symbol, tickType, price)
 
         # IB sends different types of price updates:
         # 1 = Bid
@@ -114,8 +651,54 @@ class IBConnection(EClient, EWrapper):
         # 6 = High
         # 7 = Low
         # 9 = Close
+        self.quotes.update(slot, tickType, price)
         if tickType == 4:  # Last price
-            self.current_price = price
-            self.logger.info(f"Updated current price to: {price}")
-            if self.gui:
-                self.gui.update_price(price)
\ No newline at end of file
+            self.tick_logger.info("Updated %s price to: %s", symbol, price)
+
+    def tickSize(self, reqId, tickType, size):
+        slot = self.req_slots.get(reqId)
+        if slot is None:
+            return
+        size = float(size)
+        # 0 = Bid size, 3 = Ask size, 5 = Last size, 8 = Volume
+        self.quotes.update_size(slot, tickType, size)
+        pending = self.pending_tick
+        if pending is None or pending[0] != reqId or pending[1] != tickType:
+            if self.recorder:
+                self.recorder.record(reqId, tickType, float('nan'), size)
+            return
+        self.pending_tick = None
+        _, _, price_type, price = pending
+        if self.recorder:
+            # One record per quote or trade, as tick-by-tick data is recorded
+            self.recorder.record(reqId, price_type, price, size)
+        # Tick-by-tick symbols get their trades from tickByTickAllLast instead;
+        # listeners run here so quotes.last_size is current
+        symbol = self.subscriptions[reqId]
+        if price_type == 4 and symbol not in self.tick_by_tick:
+            for listener in self.tick_listeners.get(symbol, ()):
+                listener(price)
+
+    def tickByTickBidAsk(self, reqId, timestamp, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        slot = self.req_slots.get(reqId)
+        if slot is None:
+            return
+        if self.recorder:
+            # Recorded as ordinary bid and ask ticks so replay tools read them unchanged
+            self.recorder.record(reqId, 1, bidPrice, float(bidSize))
+            self.recorder.record(reqId, 2, askPrice, float(askSize))
+        self.quotes.update_bid_ask(slot, bidPrice, askPrice, float(bidSize), float(askSize))
+
+    def tickByTickAllLast(self, reqId, tickType, timestamp, price, size, tickAttribLast,
+                          exchange, specialConditions):
+        self.last_tick_ns = time.perf_counter_ns()
+        slot = self.req_slots.get(reqId)
+        if slot is None:
+            return
+        symbol = self.subscriptions[reqId]
+        if self.recorder:
+            self.recorder.record(reqId, 4, price, float(size))
+        self.quotes.update_last(slot, price, float(size))
+        self.tick_logger.info("Trade %s: %s @ %s", symbol, size, price)
+        for listener in self.tick_listeners.get(symbol, ()):
+            listener(price)
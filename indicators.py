@@ -0,0 +1,221 @@
+from collections import deque
+import math
+
+
+class Bar:
+    """OHLCV bar; pv is the running sum of price * size for the VWAP"""
+
+    __slots__ = ('start', 'end', 'open', 'high', 'low', 'close', 'volume', 'pv', 'ticks')
+
+    def __init__(self, start, end, price, size):
+        self.start = start
+        self.end = end
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = size
+        self.pv = price * size
+        self.ticks = 1
+
+    @property
+    def vwap(self):
+        return self.pv / self.volume if self.volume else self.close
+
+    def __repr__(self):
+        return (f"Bar({self.start:.0f}, O={self.open:.4f} H={self.high:.4f} "
+                f"L={self.low:.4f} C={self.close:.4f} V={self.volume:g})")
+
+
+class BarAggregator:
+    """
+    Build time bars from ticks with constant work per tick.
+
+    Bars are aligned to multiples of interval (seconds since the epoch), so
+    every aggregator with the same interval agrees on bar boundaries. A tick
+    at or past the current bar's end closes it; intervals with no ticks
+    produce no bar.
+    """
+
+    def __init__(self, interval=60.0, on_bar=None):
+        self.interval = interval
+        self.on_bar = on_bar
+        self.bar = None
+        self.bar_end = -math.inf
+
+    def update(self, price, size, timestamp):
+        """Add one tick; returns the bar it closed, if any"""
+        bar = self.bar
+        if timestamp < self.bar_end:
+            if price > bar.high:
+                bar.high = price
+            elif price < bar.low:
+                bar.low = price
+            bar.close = price
+            bar.volume += size
+            bar.pv += price * size
+            bar.ticks += 1
+            return None
+
+        start = timestamp - timestamp % self.interval
+        self.bar_end = start + self.interval
+        self.bar = Bar(start, self.bar_end, price, size)
+        if bar is not None and self.on_bar:
+            self.on_bar(bar)
+        return bar
+
+    def extend(self, prices, sizes=None):
+        """
+        Fold a batch of ticks that all fall inside the current bar, e.g. the
+        quiet stretches the backtest skips; prices and sizes are NumPy arrays
+        """
+        bar = self.bar
+        if bar is None or not len(prices):
+            return
+        bar.high = max(bar.high, float(prices.max()))
+        bar.low = min(bar.low, float(prices.min()))
+        bar.close = float(prices[-1])
+        if sizes is not None:
+            bar.volume += float(sizes.sum())
+            bar.pv += float((prices * sizes).sum())
+        bar.ticks += len(prices)
+
+
+class EMA:
+    """Exponential moving average; seeded with the mean of the first period values"""
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.value = None
+        self.count = 0
+        self.seed_total = 0.0
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def update(self, value):
+        self.count += 1
+        if self.count < self.period:
+            self.seed_total += value
+            return None
+        if self.count == self.period:
+            self.value = (self.seed_total + value) / self.period
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RollingStats:
+    """
+    Mean and sample standard deviation over the last window values.
+
+    Keeps running sums; they are recomputed from the window once per
+    window updates so floating point error cannot accumulate.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.updates = 0
+
+    @property
+    def ready(self):
+        return len(self.values) >= self.window
+
+    def update(self, value):
+        values = self.values
+        values.append(value)
+        self.total += value
+        self.total_squares += value * value
+        if len(values) > self.window:
+            old = values.popleft()
+            self.total -= old
+            self.total_squares -= old * old
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.total = math.fsum(values)
+            self.total_squares = math.fsum(v * v for v in values)
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else 0.0
+
+    @property
+    def std(self):
+        count = len(self.values)
+        if count < 2:
+            return 0.0
+        variance = (self.total_squares - self.total * self.total / count) / (count - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+
+class ATR:
+    """Average true range with Wilder smoothing, updated once per bar"""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.value = None
+        self.count = 0
+        self.seed_total = 0.0
+        self.prev_close = None
+
+    @property
+    def ready(self):
+        return self.value is not None
+
+    def update(self, high, low, close):
+        if self.prev_close is None:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        self.count += 1
+        if self.value is None:
+            self.seed_total += true_range
+            if self.count == self.period:
+                self.value = self.seed_total / self.period
+        else:
+            self.value += (true_range - self.value) / self.period
+        return self.value
+
+
+class BarIndicators:
+    """
+    Bars plus the indicators StockTrader uses for volatility-based levels:
+    EMA of closes, rolling mean/std of log returns and ATR. Indicators only
+    change when a bar closes, so a tick costs one BarAggregator.update.
+    """
+
+    def __init__(self, bar_seconds=60.0, ema_period=20, volatility_window=20, atr_period=14):
+        self.bars = BarAggregator(bar_seconds)
+        self.ema = EMA(ema_period)
+        self.returns = RollingStats(volatility_window)
+        self.atr = ATR(atr_period)
+        self.last_close = None
+
+    def update(self, price, size, timestamp):
+        """Add one tick; returns the closed bar after updating the indicators"""
+        bar = self.bars.update(price, size, timestamp)
+        if bar is not None:
+            self.on_bar(bar)
+        return bar
+
+    def on_bar(self, bar):
+        self.ema.update(bar.close)
+        self.atr.update(bar.high, bar.low, bar.close)
+        if self.last_close:
+            self.returns.update(math.log(bar.close / self.last_close))
+        self.last_close = bar.close
+
+    def summary(self):
+        return {
+            'ema': self.ema.value,
+            'atr': self.atr.value,
+            'return_mean': self.returns.mean,
+            'return_std': self.returns.std,
+            'bar': self.bars.bar,
+        }
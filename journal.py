@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+def empty_state():
+    return {
+        'seq': 0,
+        'lots': {},          # lot_id -> [shares, price, epoch seconds]
+        'next_lot_id': 1,
+        'orders': {},        # order_id -> {'action', 'quantity', 'lots'}
+        'reference_price': 0.0,
+        'total_trades': 0,
+        'total_profit': 0.0,
+    }
+
+
+def apply_event(state, event):
+    """Fold one journal event into state; the single reducer for writes and replay"""
+    kind = event['k']
+    if kind == 'open':
+        state['lots'][event['lot']] = [event['shares'], event['price'], event['ts']]
+        state['next_lot_id'] = max(state['next_lot_id'], event['lot'] + 1)
+    elif kind == 'reduce':
+        lot = state['lots'].get(event['lot'])
+        if lot is not None:
+            lot[0] -= event['shares']
+            if lot[0] <= 0:
+                del state['lots'][event['lot']]
+    elif kind == 'stats':
+        state['total_trades'] = event['trades']
+        state['total_profit'] = event['profit']
+    elif kind == 'ref':
+        state['reference_price'] = event['price']
+    elif kind == 'order':
+        state['orders'][event['id']] = {
+            'action': event['action'], 'quantity': event['qty'], 'lots': event['lots']
+        }
+    elif kind == 'done':
+        state['orders'].pop(event['id'], None)
+    state['seq'] = event['s']
+
+
+class StateJournal:
+    """
+    Append-only journal of one strategy's position and order events.
+
+    Each event is one compact JSON line, flushed as it is written (and
+    fsynced if fsync is set). Every snapshot_every events the folded state
+    is written atomically to a snapshot file and the journal starts over,
+    so a restart reads one small snapshot and replays at most
+    snapshot_every lines. Events carry a sequence number: lines already
+    covered by the snapshot are skipped, and a torn final line from a crash
+    mid-write is truncated away on load.
+    """
+
+    def __init__(self, directory, name, snapshot_every=10000, fsync=False):
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, f"{name}.journal")
+        self.snapshot_path = os.path.join(directory, f"{name}.snapshot.json")
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('StateJournal')
+        self.state = self.load()
+        self.since_snapshot = 0
+        self.file = open(self.journal_path, 'a')
+
+    def load(self):
+        """Rebuild state from the snapshot plus the journal tail"""
+        started = time.perf_counter()
+        state = empty_state()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                state.update(json.load(f))
+            # JSON object keys are strings
+            state['lots'] = {int(k): v for k, v in state['lots'].items()}
+            state['orders'] = {int(k): v for k, v in state['orders'].items()}
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb+') as f:
+                complete = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn by a crash mid-write; cut it off below so the
+                        # next append starts on a fresh line
+                        break
+                    complete += len(line)
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        self.logger.warning(f"Skipping unreadable journal line in {self.journal_path}")
+                        continue
+                    if event['s'] > state['seq']:
+                        apply_event(state, event)
+                        replayed += 1
+                if f.seek(0, os.SEEK_END) > complete:
+                    self.logger.warning(f"Dropping torn final line of {self.journal_path}")
+                    f.truncate(complete)
+        self.logger.info(
+            f"Loaded {len(state['lots'])} lots and {len(state['orders'])} open orders "
+            f"({replayed} events replayed) in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return state
+
+    def append(self, kind, **fields):
+        with self.lock:
+            event = {'s': self.state['seq'] + 1, 'k': kind, **fields}
+            apply_event(self.state, event)
+            self.file.write(json.dumps(event, separators=(',', ':')) + '\n')
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.since_snapshot += 1
+            if self.since_snapshot >= self.snapshot_every:
+                self._snapshot()
+
+    def snapshot(self):
+        with self.lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Events up to state['seq'] are in the snapshot now
+        self.file.close()
+        self.file = open(self.journal_path, 'w')
+        self.since_snapshot = 0
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._snapshot()
+                self.file.close()
@@ -0,0 +1,222 @@
+from array import array
+import json
+import logging
+import threading
+import time
+
+# Sub-buckets per power of two: relative error of any reported value <= 1/32
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+BUCKET_COUNT = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+# Order lifecycle stages, in nanoseconds between monotonic timestamps
+STAGES = (
+    'tick_queue',        # tickPrice -> strategy thread starts evaluating the tick
+    'tick_to_decision',  # tickPrice -> strategy submits an order
+    'decision_to_send',  # order submitted -> placeOrder written to the socket
+    'tick_to_send',      # tickPrice -> placeOrder written to the socket
+    'send_queue',        # placeOrder called -> written, i.e. the outbound rate limiter's wait
+    'send_to_ack',       # placeOrder written -> first Submitted/PreSubmitted status
+    'send_to_fill',      # placeOrder written -> Filled status
+)
+ACK_STATUSES = ('PreSubmitted', 'Submitted')
+
+
+def _bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + ((value >> shift) - SUB_BUCKETS)
+
+
+def _bucket_value(index):
+    """Upper edge of a bucket, the value reported for percentiles"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-size log-linear histogram of non-negative integer latencies (ns).
+
+    Recording is O(1) and allocation free; two histograms merge by adding
+    their bucket counts, so per-thread or per-process histograms can be
+    combined without losing percentile accuracy.
+    """
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        target = max(1, int(fraction * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, scale=1000.0):
+        """Percentiles in microseconds by default"""
+        return {
+            'count': self.count,
+            'mean': self.mean() / scale,
+            'min': (self.min or 0) / scale,
+            'p50': self.percentile(0.50) / scale,
+            'p99': self.percentile(0.99) / scale,
+            'p999': self.percentile(0.999) / scale,
+            'max': self.max / scale,
+        }
+
+
+class LatencyTracker:
+    """
+    Per-stage latency histograms for the tick -> decision -> order -> fill
+    path.
+
+    Timestamps come from time.perf_counter_ns() and are attached to each
+    order when it is submitted. The send stages close when the outbound
+    scheduler hands the order to the socket, which may be after a
+    rate-limit wait; orderStatus callbacks close out the ack and fill
+    stages. snapshot() is the in-process stats API; start_dump() appends a
+    snapshot to a JSON-lines file at a fixed interval.
+    """
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.orders = {}
+        self.lock = threading.Lock()
+        self.dump_stop = None
+        self.logger = logging.getLogger('LatencyTracker')
+
+    def record(self, stage, nanoseconds):
+        with self.lock:
+            self.histograms[stage].record(nanoseconds)
+
+    def order_submitted(self, order_id, tick_ns, decision_ns, queued_ns):
+        """Called just before placeOrder; order_written closes the send stages"""
+        with self.lock:
+            if tick_ns:
+                self.histograms['tick_to_decision'].record(decision_ns - tick_ns)
+            # [tick_ns, decision_ns, queued_ns, sent_ns, acknowledged]
+            self.orders[order_id] = [tick_ns, decision_ns, queued_ns, 0, False]
+
+    def order_written(self, order_id, sent_ns):
+        """Called just before placeOrder is written to the socket; later writes (modifications) are ignored"""
+        with self.lock:
+            entry = self.orders.get(order_id)
+            if entry is None or entry[3]:
+                return
+            tick_ns, decision_ns, queued_ns = entry[0], entry[1], entry[2]
+            if tick_ns:
+                self.histograms['tick_to_send'].record(sent_ns - tick_ns)
+            self.histograms['decision_to_send'].record(sent_ns - decision_ns)
+            self.histograms['send_queue'].record(sent_ns - queued_ns)
+            entry[3] = sent_ns
+
+    def order_status(self, order_id, status, now_ns, terminal):
+        with self.lock:
+            entry = self.orders.get(order_id)
+            if entry is None:
+                return
+            sent_ns, acknowledged = entry[3], entry[4]
+            # Statuses of orders never written (dropped on disconnect) time nothing
+            if sent_ns:
+                if not acknowledged and (status in ACK_STATUSES or status == 'Filled'):
+                    self.histograms['send_to_ack'].record(now_ns - sent_ns)
+                    entry[4] = True
+                if status == 'Filled':
+                    self.histograms['send_to_fill'].record(now_ns - sent_ns)
+            if terminal:
+                del self.orders[order_id]
+
+    def order_done(self, order_id):
+        """Forget an order finished without a terminal orderStatus (rejected, settled on reconnect)"""
+        with self.lock:
+            self.orders.pop(order_id, None)
+
+    def merge(self, other):
+        return self.merge_histograms(other.histograms)
+
+    def merge_histograms(self, histograms):
+        """Add {stage: LatencyHistogram}, e.g. drained from a tracker in another process"""
+        with self.lock:
+            for stage, histogram in histograms.items():
+                self.histograms[stage].merge(histogram)
+        return self
+
+    def drain(self):
+        """Return {stage: LatencyHistogram} recorded since the last drain, leaving empty histograms"""
+        with self.lock:
+            histograms = self.histograms
+            self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        return {stage: histogram for stage, histogram in histograms.items() if histogram.count}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+
+    def snapshot(self):
+        """Return {stage: {count, mean, min, p50, p99, p999, max}} in microseconds"""
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def dump(self, path):
+        record = {'time': time.time(), 'stages': self.snapshot()}
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def start_dump(self, path, interval=60.0):
+        """Append a snapshot to path every interval seconds on a daemon thread"""
+        self.stop_dump()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    self.logger.error(f"Latency dump failed: {str(e)}")
+
+        threading.Thread(target=run, daemon=True).start()
+        self.dump_stop = stop
+
+    def stop_dump(self):
+        if self.dump_stop:
+            self.dump_stop.set()
+            self.dump_stop = None
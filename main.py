@@ -1,39 +1,119 @@
+"""
+Trading bot entry point.
+
+Headless, one strategy per symbol from a JSON config and/or the CLI:
+
+    python main.py --config trading.json
+    python main.py --symbol AAPL --symbol MSFT --port 4002
+    python main.py --config trading.json --workers 4   # strategies in 4 processes
+
+Interactive, also the default when no strategies are configured
+(tkinter is only imported in this mode):
+
+    python main.py --gui
+"""
+import argparse
 import logging
-from ib_connection import IBConnection
-from trader import StockTrader
-from gui import TradingGUI
-
-
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('trading.log'),
-            logging.StreamHandler()
-        ]
+import signal
+import time
+
+from async_logging import setup_async_logging
+from service import TradingService, load_config
+
+
+def setup_logging(config):
+    # File and console I/O happen on a background thread; per-tick messages
+    # are limited to tick_log_rate per second per message
+    return setup_async_logging(
+        level=getattr(logging, config['log_level'].upper()),
+        log_file=config['log_file'],
+        tick_log_rate=config['tick_log_rate']
     )
 
 
-def main():
-    setup_logging()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', help="JSON config file, see config.example.json")
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--client-id', type=int)
+    parser.add_argument('--symbol', action='append', help="trade symbol with default parameters; repeatable")
+    parser.add_argument('--log-level')
+    parser.add_argument('--log-file')
+    parser.add_argument('--record-dir', help="record raw ticks to this directory")
+    parser.add_argument('--latency-dump', help="append latency snapshots to this JSON-lines file")
+    parser.add_argument('--journal-dir', help="keep per-symbol state journals here for warm restarts")
+    parser.add_argument('--workers', type=int, help="run strategies in this many worker processes")
+    parser.add_argument('--gui', action='store_true', help="run the Tk interface instead of headless")
+    return parser.parse_args(argv)
+
+
+def run_gui(service, logger):
+    # tkinter is only needed here, keep it off the headless import path
+    from gui import TradingGUI
+    from trader import StockTrader
+
+    if not service.connect():
+        logger.warning("Could not connect to IB at startup; use Connect in the GUI")
+    trader = StockTrader(service.ib)
+    # The GUI shows the connection state, and follows reconnects, on its own
+    gui = TradingGUI(trader)
+    logger.info("Starting trading application")
+    gui.run()
+    trader.stop_trading()
+    service.shutdown()
+
+
+def run_headless(service, logger, started):
+    if not service.connect():
+        logger.error("Failed to connect to IB")
+        return 1
+    service.start_strategies()
+    logger.info(f"Startup complete in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: service.stop())
+    service.run()
+    return 0
+
+
+def main(argv=None):
+    started = time.perf_counter()
+    args = parse_args(argv)
+    overrides = {
+        'host': args.host,
+        'port': args.port,
+        'client_id': args.client_id,
+        'log_level': args.log_level,
+        'log_file': args.log_file,
+        'record_dir': args.record_dir,
+        'latency_dump': args.latency_dump,
+        'journal_dir': args.journal_dir,
+        'workers': args.workers,
+    }
+    if args.symbol:
+        overrides['strategies'] = [{'symbol': symbol} for symbol in args.symbol]
+    config = load_config(args.config, overrides)
+    setup_logging(config)
     logger = logging.getLogger('main')
 
+    gui = args.gui or not config['strategies']
+    if config['workers'] and not gui:
+        # Imported only here: the multi-process mode also needs numpy
+        from process_service import ProcessTradingService
+        service = ProcessTradingService(config)
+    else:
+        service = TradingService(config)
     try:
-        # Create instances
-        ib = IBConnection()
-        # if not ib_connection.connect_and_init():
-        #     logger.error("Failed to connect to IB")
-        #     return
-        trader = StockTrader(ib)
-        gui = TradingGUI(trader)
-
-        # Start the application
-        logger.info("Starting trading application")
-        gui.run()
-        ib.connect_and_init()
+        if gui:
+            run_gui(service, logger)
+            return 0
+        return run_headless(service, logger, started)
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
+        service.shutdown()
+        return 1
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+from array import array
+import time
+
+
+class QuoteTable:
+    """
+    Column-oriented quote storage shared by every subscribed symbol.
+
+    Each symbol owns one slot; each field is a flat array('d') column, so a
+    tick is a single in-place float store instead of a new dict. Prices and
+    sizes together make a level-1 book: bid, ask and last with their sizes.
+    """
+
+    # IB tickType -> column name
+    TICK_FIELDS = {
+        1: 'bid',
+        2: 'ask',
+        4: 'last',
+        6: 'high',
+        7: 'low',
+        9: 'close',
+    }
+    # IB size tickType -> column name
+    TICK_SIZE_FIELDS = {
+        0: 'bid_size',
+        3: 'ask_size',
+        5: 'last_size',
+        8: 'volume',
+    }
+    COLUMNS = ('bid', 'ask', 'last', 'high', 'low', 'close',
+               'bid_size', 'ask_size', 'last_size', 'volume', 'updated')
+
+    def __init__(self):
+        self.slots = {}
+        self.symbols = []
+        for name in self.COLUMNS:
+            setattr(self, name, array('d'))
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.slots
+
+    def add_symbol(self, symbol):
+        """Return the slot for symbol, allocating one if needed"""
+        slot = self.slots.get(symbol)
+        if slot is not None:
+            return slot
+        slot = len(self.symbols)
+        for name in self.COLUMNS:
+            getattr(self, name).append(0.0)
+        self.symbols.append(symbol)
+        self.slots[symbol] = slot
+        return slot
+
+    def update(self, slot, tick_type, price):
+        """Store a price tick; returns the column name or None if ignored"""
+        name = self.TICK_FIELDS.get(tick_type)
+        if name is None:
+            return None
+        getattr(self, name)[slot] = price
+        self.updated[slot] = time.time()
+        return name
+
+    def update_size(self, slot, tick_type, size):
+        """Store a size tick; returns the column name or None if ignored"""
+        name = self.TICK_SIZE_FIELDS.get(tick_type)
+        if name is None:
+            return None
+        getattr(self, name)[slot] = size
+        self.updated[slot] = time.time()
+        return name
+
+    def update_bid_ask(self, slot, bid, ask, bid_size, ask_size):
+        """Store a whole top of book at once, as tick-by-tick BidAsk reports it"""
+        self.bid[slot] = bid
+        self.ask[slot] = ask
+        self.bid_size[slot] = bid_size
+        self.ask_size[slot] = ask_size
+        self.updated[slot] = time.time()
+
+    def update_last(self, slot, price, size):
+        """Store a trade, as tick-by-tick AllLast reports it"""
+        self.last[slot] = price
+        self.last_size[slot] = size
+        self.updated[slot] = time.time()
+
+    def bid_ask(self, symbol):
+        """Return (bid, ask); zeros until both sides have been quoted"""
+        slot = self.slots.get(symbol)
+        if slot is None:
+            return 0.0, 0.0
+        return self.bid[slot], self.ask[slot]
+
+    def get(self, symbol, field='last'):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            return 0.0
+        return getattr(self, field)[slot]
+
+    def snapshot(self, symbol):
+        """Return a dict copy of every column for one symbol"""
+        slot = self.slots[symbol]
+        return {name: getattr(self, name)[slot] for name in self.COLUMNS}
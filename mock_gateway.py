@@ -0,0 +1,535 @@
+import calendar
+import logging
+import math
+import random
+import socket
+import struct
+import threading
+import time
+
+# Wire protocol version the mock negotiates. Message layouts below follow it,
+# so every client library that supports it sees the same field positions.
+SERVER_VERSION = 151
+
+# Incoming (client -> TWS) message ids
+REQ_MKT_DATA = 1
+CANCEL_MKT_DATA = 2
+PLACE_ORDER = 3
+CANCEL_ORDER = 4
+REQ_OPEN_ORDERS = 5
+REQ_EXECUTIONS = 7
+REQ_IDS = 8
+REQ_HISTORICAL_DATA = 20
+REQ_POSITIONS = 61
+CANCEL_POSITIONS = 64
+START_API = 71
+REQ_TICK_BY_TICK_DATA = 97
+CANCEL_TICK_BY_TICK_DATA = 98
+
+# Outgoing (TWS -> client) message ids
+TICK_PRICE = 1
+TICK_SIZE = 2
+ORDER_STATUS = 3
+ERR_MSG = 4
+NEXT_VALID_ID = 9
+EXECUTION_DATA = 11
+MANAGED_ACCTS = 15
+HISTORICAL_DATA = 17
+OPEN_ORDER_END = 53
+EXECUTION_DATA_END = 55
+POSITION_DATA = 61
+POSITION_END = 62
+TICK_BY_TICK = 99
+
+# Field positions in a REQ_HISTORICAL_DATA message at SERVER_VERSION
+HISTORICAL_SYMBOL_FIELD = 3
+HISTORICAL_END_FIELD = 15
+HISTORICAL_BAR_SIZE_FIELD = 16
+HISTORICAL_DURATION_FIELD = 17
+
+BAR_UNITS = {'sec': 1, 'secs': 1, 'min': 60, 'mins': 60, 'hour': 3600, 'hours': 3600}
+
+# Field position of the tick type name ("BidAsk", "AllLast", ...) in REQ_TICK_BY_TICK_DATA
+TICK_BY_TICK_TYPE_FIELD = 14
+
+# Field positions in a PLACE_ORDER message at SERVER_VERSION
+ORDER_ID_FIELD = 1
+ORDER_SYMBOL_FIELD = 3
+ORDER_ACTION_FIELD = 16
+ORDER_QUANTITY_FIELD = 17
+ORDER_TYPE_FIELD = 18
+ORDER_LMT_PRICE_FIELD = 19
+ORDER_AUX_PRICE_FIELD = 20
+ORDER_OCA_GROUP_FIELD = 22
+ORDER_TRANSMIT_FIELD = 27
+ORDER_PARENT_ID_FIELD = 28
+
+
+def encode_message(*fields):
+    payload = b''.join(str(field).encode('ascii') + b'\0' for field in fields)
+    return struct.pack('!I', len(payload)) + payload
+
+
+def _to_float(text, default=0.0):
+    try:
+        return float(text)
+    except ValueError:
+        return default
+
+
+class MockClientSession:
+    """One connected API client: parses its requests and sends replies"""
+
+    def __init__(self, gateway, sock, address):
+        self.gateway = gateway
+        self.sock = sock
+        self.address = address
+        self.send_lock = threading.Lock()
+        self.subscriptions = {}  # reqId -> symbol
+        self.tick_by_tick = {}  # reqId -> (symbol, tick type name)
+        self.client_id = None
+        self.connected = True
+        self.logger = logging.getLogger('MockClientSession')
+
+    def send(self, *fields):
+        data = encode_message(*fields)
+        with self.send_lock:
+            if not self.connected:
+                return
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.connected = False
+
+    def send_tick(self, req_id, tick_type, price, size=0):
+        # version 6 layout: msgId, version, reqId, tickType, price, size, attrMask
+        self.send(TICK_PRICE, 6, req_id, tick_type, price, size, 0)
+
+    def send_last_trade(self, req_id, price, size):
+        # msgId, reqId, tickType (2 = AllLast), time, price, size, attrMask, exchange, conditions
+        self.send(TICK_BY_TICK, req_id, 2, int(time.time()), price, int(size), 0, 'SMART', '')
+
+    def send_bid_ask(self, req_id, bid, ask, bid_size, ask_size):
+        # msgId, reqId, tickType (3 = BidAsk), time, bid, ask, bidSize, askSize, attrMask
+        self.send(TICK_BY_TICK, req_id, 3, int(time.time()), bid, ask, int(bid_size), int(ask_size), 0)
+
+    def send_error(self, req_id, code, message):
+        self.send(ERR_MSG, 2, req_id, code, message)
+
+    def send_order_status(self, order_id, status, filled, remaining, avg_price, last_price=0.0, why_held=''):
+        # No version field and a trailing mktCapPrice since server version 131
+        self.send(ORDER_STATUS, order_id, status, filled, remaining, avg_price,
+                  order_id, 0, last_price, self.client_id or 0, why_held, 0.0)
+
+    def send_execution(self, req_id, execution):
+        # No version field since server version 136 (lastLiquidity)
+        self.send(EXECUTION_DATA, req_id, execution['order_id'],
+                  0, execution['symbol'], 'STK', '', 0.0, '', '', 'SMART', 'USD', execution['symbol'], '',
+                  execution['exec_id'], execution['time'], self.gateway.account, 'SMART',
+                  execution['side'], execution['shares'], execution['price'], 0, self.client_id or 0, 0,
+                  execution['shares'], execution['price'], '', '', 0.0, '', 0)
+
+    def send_position(self, symbol, shares, avg_cost):
+        self.send(POSITION_DATA, 3, self.gateway.account, 0, symbol, 'STK', '', 0.0, '', '',
+                  'SMART', 'USD', symbol, '', shares, avg_cost)
+
+    def serve(self):
+        try:
+            self._handshake()
+            buffer = b''
+            while self.connected:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                while len(buffer) >= 4:
+                    size = struct.unpack('!I', buffer[:4])[0]
+                    if len(buffer) < 4 + size:
+                        break
+                    payload, buffer = buffer[4:4 + size], buffer[4 + size:]
+                    fields = [field.decode('ascii', 'replace') for field in payload.split(b'\0')[:-1]]
+                    if fields:
+                        self.handle(fields)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        with self.send_lock:
+            self.connected = False
+        try:
+            # shutdown, not just close, so blocked reads end and the client sees EOF
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.gateway.remove_session(self)
+
+    def _recv_exact(self, count):
+        data = b''
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise OSError("Client closed during handshake")
+            data += chunk
+        return data
+
+    def _handshake(self):
+        prefix = self._recv_exact(4)
+        if prefix != b'API\0':
+            raise OSError(f"Unexpected handshake prefix {prefix!r}")
+        size = struct.unpack('!I', self._recv_exact(4))[0]
+        versions = self._recv_exact(size).decode('ascii').split(' ')[0]
+        max_version = int(versions.lstrip('v').split('..')[-1])
+        if max_version < SERVER_VERSION:
+            raise OSError(f"Client API version {max_version} is older than {SERVER_VERSION}")
+        self.send(SERVER_VERSION, time.strftime('%Y%m%d %H:%M:%S UTC', time.gmtime()))
+
+    def handle(self, fields):
+        msg_id = int(fields[0])
+        if msg_id == START_API:
+            self.client_id = int(fields[2])
+            self.send(NEXT_VALID_ID, 1, self.gateway.next_order_id)
+            self.send(MANAGED_ACCTS, 1, self.gateway.account)
+        elif msg_id == REQ_IDS:
+            self.send(NEXT_VALID_ID, 1, self.gateway.next_order_id)
+        elif msg_id == REQ_MKT_DATA:
+            # msgId, version, reqId, conId, symbol, ...
+            req_id, symbol = int(fields[2]), fields[4]
+            self.subscriptions[req_id] = symbol
+            self.gateway.on_subscribe(self, req_id, symbol)
+        elif msg_id == CANCEL_MKT_DATA:
+            self.subscriptions.pop(int(fields[2]), None)
+        elif msg_id == REQ_TICK_BY_TICK_DATA:
+            # msgId, reqId, conId, symbol, ...
+            self.tick_by_tick[int(fields[1])] = (fields[3], fields[TICK_BY_TICK_TYPE_FIELD])
+        elif msg_id == CANCEL_TICK_BY_TICK_DATA:
+            self.tick_by_tick.pop(int(fields[1]), None)
+        elif msg_id == PLACE_ORDER:
+            self.gateway.on_place_order(self, fields)
+        elif msg_id == REQ_HISTORICAL_DATA:
+            self.gateway.on_historical_request(self, fields)
+        elif msg_id == CANCEL_ORDER:
+            # msgId, version, orderId
+            self.gateway.on_cancel_order(self, int(fields[2]))
+        elif msg_id == REQ_POSITIONS:
+            for symbol, (shares, avg_cost) in list(self.gateway.positions.items()):
+                self.send_position(symbol, shares, avg_cost)
+            self.send(POSITION_END, 1)
+        elif msg_id == REQ_OPEN_ORDERS:
+            # Working orders are reported with orderStatus only (no openOrder
+            # message) and now belong to this session
+            for order_id, (_, order) in list(self.gateway.open_orders.items()):
+                self.gateway.open_orders[order_id] = (self, order)
+                status = 'Submitted' if order['active'] else 'PreSubmitted'
+                self.send_order_status(order_id, status, 0, order['quantity'], 0.0)
+            self.send(OPEN_ORDER_END, 1)
+        elif msg_id == REQ_EXECUTIONS:
+            # msgId, version, reqId, filter...
+            req_id = int(fields[2])
+            for execution in list(self.gateway.executions):
+                self.send_execution(req_id, execution)
+            self.send(EXECUTION_DATA_END, 1, req_id)
+
+
+class MockGateway:
+    """
+    Local stand-in for TWS / IB Gateway speaking enough of the API protocol
+    for IBConnection: handshake, startApi/nextValidId, market data ticks and
+    order placement, acknowledgement and fills.
+
+    Orders are acknowledged with Submitted and, if fill_orders is set, filled
+    after fill_delay seconds at their limit price (or the last tick for other
+    order types). Brackets behave as at IB: orders sent with transmit False
+    wait (PreSubmitted) for the transmitting order of their group, children
+    become active only once their parent has filled, and a fill cancels the
+    rest of its OCA group. Every received order is appended to `orders` with
+    the monotonic time it arrived, for latency measurements. Fills update
+    `executions` and `positions`, which reqExecutions and reqPositions
+    report back, so a client can reconnect and reconcile.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fill_orders=True, fill_delay=0.0,
+                 next_order_id=1, account='DU000000', history_delay=0.0):
+        self.host = host
+        self.port = port
+        self.fill_orders = fill_orders
+        self.fill_delay = fill_delay
+        self.next_order_id = next_order_id
+        self.account = account
+        self.sessions = []
+        self.orders = []
+        self.open_orders = {}
+        self.last_prices = {}
+        self.executions = []
+        self.positions = {}  # symbol -> [shares, average cost]
+        # Seconds before each historical data reply, like the HMDS round trip
+        self.history_delay = history_delay
+        self.history_requests = []
+        self.order_received = threading.Condition()
+        self.subscribed = threading.Condition()
+        self.lock = threading.Lock()
+        self.server = None
+        self.running = False
+        self.logger = logging.getLogger('MockGateway')
+
+    def start(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        self.logger.info(f"Mock gateway listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        """Close the listener and drop every client; start() again to simulate a gateway restart"""
+        self.running = False
+        if self.server:
+            try:
+                self.server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server.close()
+        for session in list(self.sessions):
+            session.close()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = MockClientSession(self, sock, address)
+            with self.lock:
+                self.sessions.append(session)
+            threading.Thread(target=session.serve, daemon=True).start()
+
+    def remove_session(self, session):
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def on_subscribe(self, session, req_id, symbol):
+        with self.subscribed:
+            self.subscribed.notify_all()
+
+    def wait_for_subscription(self, symbol, timeout=5.0):
+        with self.subscribed:
+            return self.subscribed.wait_for(
+                lambda: any(symbol in s.subscriptions.values() for s in list(self.sessions)), timeout)
+
+    def publish(self, symbol, price, tick_type=4, size=100):
+        """Send one price tick to every client subscribed to symbol"""
+        if tick_type == 4:
+            self.last_prices[symbol] = price
+        for session in list(self.sessions):
+            for req_id, subscribed in list(session.subscriptions.items()):
+                if subscribed == symbol:
+                    session.send_tick(req_id, tick_type, price, size)
+            if tick_type == 4:
+                for req_id, (subscribed, kind) in list(session.tick_by_tick.items()):
+                    if subscribed == symbol and kind in ('Last', 'AllLast'):
+                        session.send_last_trade(req_id, price, size)
+
+    def publish_quote(self, symbol, bid, ask, bid_size=100, ask_size=100):
+        """Send a top-of-book update: bid and ask ticks, and BidAsk to tick-by-tick clients"""
+        for session in list(self.sessions):
+            for req_id, subscribed in list(session.subscriptions.items()):
+                if subscribed == symbol:
+                    session.send_tick(req_id, 1, bid, bid_size)
+                    session.send_tick(req_id, 2, ask, ask_size)
+            for req_id, (subscribed, kind) in list(session.tick_by_tick.items()):
+                if subscribed == symbol and kind == 'BidAsk':
+                    session.send_bid_ask(req_id, bid, ask, bid_size, ask_size)
+
+    def publish_many(self, symbol, prices, tick_type=4, size=100):
+        """Send a burst of ticks back to back, one socket write per client"""
+        for session in list(self.sessions):
+            req_ids = [r for r, s in list(session.subscriptions.items()) if s == symbol]
+            if not req_ids:
+                continue
+            data = b''.join(
+                encode_message(TICK_PRICE, 6, req_id, tick_type, price, size, 0)
+                for price in prices for req_id in req_ids
+            )
+            with session.send_lock:
+                session.sock.sendall(data)
+        if tick_type == 4 and len(prices):
+            self.last_prices[symbol] = prices[-1]
+
+    def stream(self, symbol, rate=100.0, start_price=100.0, volatility=0.0005, duration=None, seed=None):
+        """Publish a random walk at `rate` ticks per second on a background thread"""
+        stop = threading.Event()
+
+        def run():
+            rng = random.Random(seed)
+            price = start_price
+            interval = 1.0 / rate
+            next_time = time.monotonic()
+            end = next_time + duration if duration else math.inf
+            while not stop.is_set() and self.running and next_time < end:
+                self.publish(symbol, round(price, 4))
+                price *= math.exp(rng.gauss(0.0, volatility))
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
+
+    def on_place_order(self, session, fields):
+        received = time.perf_counter_ns()
+        order_id = int(fields[ORDER_ID_FIELD])
+        order = {
+            'order_id': order_id,
+            'symbol': fields[ORDER_SYMBOL_FIELD],
+            'action': fields[ORDER_ACTION_FIELD],
+            'quantity': _to_float(fields[ORDER_QUANTITY_FIELD]),
+            'order_type': fields[ORDER_TYPE_FIELD],
+            'lmt_price': _to_float(fields[ORDER_LMT_PRICE_FIELD]),
+            'aux_price': _to_float(fields[ORDER_AUX_PRICE_FIELD]),
+            'oca_group': fields[ORDER_OCA_GROUP_FIELD],
+            'parent_id': int(fields[ORDER_PARENT_ID_FIELD] or 0),
+            'transmit': fields[ORDER_TRANSMIT_FIELD] == '1',
+            'active': False,
+            'received_ns': received,
+        }
+        with self.order_received:
+            self.orders.append(order)
+            self.open_orders[order_id] = (session, order)
+            self.next_order_id = max(self.next_order_id, order_id + 1)
+            self.order_received.notify_all()
+
+        with self.lock:
+            if order['transmit'] and order['parent_id']:
+                # The transmitting child releases its parent and siblings
+                group = [entry for entry in self.open_orders.values()
+                         if entry[1]['order_id'] == order['parent_id'] or
+                         entry[1]['parent_id'] == order['parent_id']]
+            elif order['transmit']:
+                group = [(session, order)]
+            else:
+                group = []
+            for _, member in group:
+                member['transmit'] = True
+            # A child whose parent is still open waits for the parent's fill
+            activate = [member['order_id'] for _, member in group
+                        if not member['parent_id'] or member['parent_id'] not in self.open_orders]
+        if order_id not in activate:
+            session.send_order_status(order_id, 'PreSubmitted', 0, order['quantity'], 0.0)
+        for member_id in activate:
+            self.activate(member_id)
+
+    def activate(self, order_id):
+        """Make a transmitted order workable: acknowledge it and fill it if fill_orders is set"""
+        with self.lock:
+            entry = self.open_orders.get(order_id)
+            if entry is None or entry[1]['active']:
+                return
+            session, order = entry
+            order['active'] = True
+        session.send_order_status(order_id, 'Submitted', 0, order['quantity'], 0.0)
+        if self.fill_orders:
+            if self.fill_delay:
+                threading.Timer(self.fill_delay, self.fill, (order_id,)).start()
+            else:
+                self.fill(order_id)
+
+    def fill(self, order_id, price=None):
+        """Fill an open, active order completely"""
+        with self.lock:
+            entry = self.open_orders.get(order_id)
+            if entry is None or not entry[1]['active']:
+                return
+            del self.open_orders[order_id]
+        session, order = entry
+        if price is None:
+            price = order['lmt_price'] if order['order_type'] == 'LMT' else \
+                self.last_prices.get(order['symbol'], order['lmt_price'])
+        execution = {
+            'order_id': order_id,
+            'exec_id': f"{order_id:08d}.{len(self.executions) + 1:04d}",
+            'time': time.strftime('%Y%m%d  %H:%M:%S'),
+            'symbol': order['symbol'],
+            'side': 'BOT' if order['action'] == 'BUY' else 'SLD',
+            'shares': order['quantity'],
+            'price': price,
+        }
+        with self.lock:
+            self.executions.append(execution)
+            position = self.positions.setdefault(order['symbol'], [0.0, 0.0])
+            signed = order['quantity'] if order['action'] == 'BUY' else -order['quantity']
+            if signed > 0 and position[0] + signed > 0:
+                position[1] = (position[0] * position[1] + signed * price) / (position[0] + signed)
+            position[0] += signed
+            if not position[0]:
+                position[1] = 0.0
+            # One cancels all: the rest of the group goes, and children of the filled order start working
+            cancelled = []
+            if order['oca_group']:
+                cancelled = [other_id for other_id, (_, other) in self.open_orders.items()
+                             if other['oca_group'] == order['oca_group']]
+            cancelled = [self.open_orders.pop(other_id) for other_id in cancelled]
+            children = [child_id for child_id, (_, child) in self.open_orders.items()
+                        if child['parent_id'] == order_id and child['transmit']]
+        session.send_execution(-1, execution)
+        session.send_order_status(order_id, 'Filled', order['quantity'], 0, price, price)
+        for other_session, other in cancelled:
+            other_session.send_order_status(other['order_id'], 'Cancelled', 0, other['quantity'], 0.0)
+        for child_id in children:
+            self.activate(child_id)
+
+    def on_historical_request(self, session, fields):
+        """Reply with deterministic bars for the window; weekends have no data"""
+        req_id = int(fields[1])
+        symbol = fields[HISTORICAL_SYMBOL_FIELD]
+        end = calendar.timegm(time.strptime(fields[HISTORICAL_END_FIELD][:17], '%Y%m%d %H:%M:%S'))
+        count, unit = fields[HISTORICAL_BAR_SIZE_FIELD].split()
+        bar_seconds = int(count) * BAR_UNITS[unit]
+        duration = int(fields[HISTORICAL_DURATION_FIELD].split()[0])
+        with self.lock:
+            self.history_requests.append((symbol, end - duration, end))
+
+        bars = []
+        for start in range(end - duration, end, bar_seconds):
+            if time.gmtime(start).tm_wday >= 5:
+                continue
+            base = 100.0 + 5.0 * math.sin(start / 7200.0)
+            close = base + 0.1 * math.sin(start / 60.0)
+            bars += [start, base, max(base, close) + 0.05, min(base, close) - 0.05, close,
+                     100 + start % 50, (base + close) / 2, 10]
+
+        def reply():
+            if not bars:
+                session.send_error(req_id, 162, "Historical Market Data Service error message:"
+                                                "HMDS query returned no data")
+                return
+            session.send(HISTORICAL_DATA, req_id, '', '', len(bars) // 8, *bars)
+
+        if self.history_delay:
+            threading.Timer(self.history_delay, reply).start()
+        else:
+            reply()
+
+    def on_cancel_order(self, session, order_id):
+        """Cancel an open order along with its children"""
+        with self.lock:
+            cancelled = [other_id for other_id, (_, other) in self.open_orders.items()
+                         if other_id == order_id or other['parent_id'] == order_id]
+            cancelled = [self.open_orders.pop(other_id) for other_id in cancelled]
+        for other_session, order in cancelled:
+            other_session.send_order_status(order['order_id'], 'Cancelled', 0, order['quantity'], 0.0)
+
+    def wait_for_orders(self, count, timeout=5.0):
+        """Block until at least count orders were received in total"""
+        with self.order_received:
+            return self.order_received.wait_for(lambda: len(self.orders) >= count, timeout)
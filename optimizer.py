@@ -0,0 +1,189 @@
+"""
+Parallel parameter search over StockTrader trigger thresholds.
+
+Tick data is copied once into shared memory; worker processes map it as
+NumPy arrays and run BacktestEngine for each parameter combination, so
+tasks carry only a small parameter dict. Usage:
+
+    python optimizer.py ticks-20261017.bin --req-id 1 --workers 16
+    python optimizer.py --synthetic 5000000 --random 2000
+"""
+import argparse
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import BacktestEngine, synthetic_ticks
+from trader import STOP_LOSS_PERCENTAGE
+
+PARAMETERS = ('buy_trigger_percentage', 'sell_trigger_percentage', 'stop_loss_percentage',
+              'max_positions', 'position_size')
+
+DEFAULT_GRID = {
+    'buy_trigger_percentage': [-0.005, -0.0075, -0.01, -0.015, -0.02],
+    'sell_trigger_percentage': [0.005, 0.0075, 0.01, 0.015, 0.02],
+    'stop_loss_percentage': [-0.01, -0.02, -0.03, -0.05],
+    'max_positions': [1, 3, 5],
+    'position_size': [30],
+}
+
+# Per-process views of the shared tick arrays, set by _attach
+_shared = {}
+
+
+def grid(space):
+    """Every combination of the values in space (name -> list)"""
+    names = list(space)
+    for values in itertools.product(*(space[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def random_samples(space, count, seed=None):
+    """count random combinations; tuple values are (low, high) ranges, lists are choices"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                params[name] = rng.randint(low, high) if isinstance(low, int) else rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(values)
+        yield params
+
+
+def score_profit(result):
+    return result['total_profit']
+
+
+def score_profit_to_drawdown(result):
+    return result['total_profit'] / max(result['max_drawdown'], 1.0)
+
+
+def _attach(prices_name, timestamps_name, count):
+    """Pool initializer: map the parent's shared memory blocks read-only"""
+    logging.getLogger().setLevel(logging.WARNING)
+    prices_shm = shared_memory.SharedMemory(name=prices_name)
+    timestamps_shm = shared_memory.SharedMemory(name=timestamps_name)
+    prices = np.ndarray((count,), dtype=np.float64, buffer=prices_shm.buf)
+    timestamps = np.ndarray((count,), dtype=np.int64, buffer=timestamps_shm.buf)
+    prices.flags.writeable = False
+    timestamps.flags.writeable = False
+    # Keep the blocks referenced for the life of the worker
+    _shared.update(prices_shm=prices_shm, timestamps_shm=timestamps_shm,
+                   prices=prices, timestamps=timestamps)
+
+
+def _evaluate(params):
+    defaults = {'stop_loss_percentage': STOP_LOSS_PERCENTAGE}
+    engine = BacktestEngine(**{**defaults, **params})
+    result = engine.run(_shared['prices'], _shared['timestamps'])
+    # Ship back the summary only, not the full fill list
+    return params, {
+        'total_profit': result['total_profit'],
+        'realized_profit': result['realized_profit'],
+        'max_drawdown': result['max_drawdown'],
+        'total_trades': result['total_trades'],
+        'fills': len(result['trades']),
+    }
+
+
+class ParameterOptimizer:
+    """
+    Rank parameter combinations by backtest score using a process pool.
+
+    The tick arrays live in two shared memory blocks created by run() and
+    unlinked when it returns.
+    """
+
+    def __init__(self, prices, timestamps=None, workers=None, score=score_profit):
+        self.prices = np.ascontiguousarray(prices, dtype=np.float64)
+        if timestamps is None:
+            timestamps = np.arange(len(self.prices), dtype=np.int64)
+        self.timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        self.workers = workers or os.cpu_count()
+        self.score = score
+        self.logger = logging.getLogger('ParameterOptimizer')
+
+    def run(self, combinations, top=None):
+        """
+        Evaluate every parameter dict in combinations
+        Returns: list of result dicts (parameters, metrics and score), best first
+        """
+        combinations = list(combinations)
+        started = time.perf_counter()
+        prices_shm = shared_memory.SharedMemory(create=True, size=max(1, self.prices.nbytes))
+        timestamps_shm = shared_memory.SharedMemory(create=True, size=max(1, self.timestamps.nbytes))
+        try:
+            np.ndarray(self.prices.shape, dtype=np.float64, buffer=prices_shm.buf)[:] = self.prices
+            np.ndarray(self.timestamps.shape, dtype=np.int64, buffer=timestamps_shm.buf)[:] = self.timestamps
+
+            chunksize = max(1, len(combinations) // (self.workers * 8))
+            results = []
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                     initargs=(prices_shm.name, timestamps_shm.name, len(self.prices))) as pool:
+                for params, metrics in pool.map(_evaluate, combinations, chunksize=chunksize):
+                    row = {**params, **metrics}
+                    row['score'] = self.score(row)
+                    results.append(row)
+        finally:
+            prices_shm.close()
+            prices_shm.unlink()
+            timestamps_shm.close()
+            timestamps_shm.unlink()
+
+        results.sort(key=lambda row: row['score'], reverse=True)
+        elapsed = time.perf_counter() - started
+        self.logger.info(
+            f"Evaluated {len(combinations)} combinations over {len(self.prices)} ticks "
+            f"with {self.workers} workers in {elapsed:.1f}s"
+        )
+        return results[:top] if top else results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tick_file', nargs='?', help="binary tick file written by TickRecorder")
+    parser.add_argument('--req-id', type=int, default=1, help="reqId of the symbol in the tick file")
+    parser.add_argument('--synthetic', type=int, default=0, help="use N synthetic ticks instead of a file")
+    parser.add_argument('--random', type=int, default=0, help="random search with N samples instead of the grid")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--score', choices=('profit', 'profit_to_drawdown'), default='profit')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.tick_file:
+        from tick_recorder import load_ticks, last_prices
+        prices, timestamps = last_prices(load_ticks(args.tick_file), args.req_id)
+    else:
+        prices, timestamps = synthetic_ticks(args.synthetic or 1_000_000, seed=0)
+
+    if args.random:
+        space = {
+            'buy_trigger_percentage': (-0.03, -0.002),
+            'sell_trigger_percentage': (0.002, 0.03),
+            'stop_loss_percentage': (-0.06, -0.005),
+            'max_positions': (1, 10),
+            'position_size': [30],
+        }
+        combinations = random_samples(space, args.random, seed=0)
+    else:
+        combinations = grid(DEFAULT_GRID)
+
+    score = score_profit if args.score == 'profit' else score_profit_to_drawdown
+    optimizer = ParameterOptimizer(prices, timestamps, workers=args.workers, score=score)
+    for rank, row in enumerate(optimizer.run(combinations, top=args.top), 1):
+        params = ', '.join(f"{name}={row[name]:.4g}" for name in PARAMETERS if name in row)
+        print(f"{rank:>3}. score {row['score']:>12.2f}  profit ${row['total_profit']:>11.2f}  "
+              f"drawdown ${row['max_drawdown']:>10.2f}  trades {row['total_trades']:>6}  {params}")
+
+
+if __name__ == '__main__':
+    main()
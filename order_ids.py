@@ -0,0 +1,89 @@
+import logging
+import threading
+
+
+class OrderIdAllocator:
+    """
+    Thread-safe source of TWS order IDs.
+
+    next() hands out single IDs under a lock; reserve() carves out a whole
+    range in one locked step for an OrderIdBlock, which then allocates from
+    it without touching the shared lock. sync() applies nextValidId from TWS:
+    the counter only ever moves forward, so IDs already handed out are never
+    reissued. A forward jump bumps the epoch, which makes existing blocks
+    discard the rest of their (now stale) range.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = None
+        self.epoch = 0
+        self.ready = threading.Event()
+        self.logger = logging.getLogger('OrderIdAllocator')
+
+    def sync(self, order_id):
+        """Apply a next valid ID reported by TWS"""
+        with self.lock:
+            if self.next_id is None or order_id > self.next_id:
+                if self.next_id is not None:
+                    self.logger.warning(f"Order IDs resynced from {self.next_id} to {order_id}")
+                    self.epoch += 1
+                self.next_id = order_id
+        self.ready.set()
+
+    def peek(self):
+        return self.next_id
+
+    def next(self):
+        """Return the next order ID, or None before TWS has sent one"""
+        with self.lock:
+            order_id = self.next_id
+            if order_id is not None:
+                self.next_id = order_id + 1
+            return order_id
+
+    def reserve(self, count):
+        """
+        Reserve count consecutive IDs
+        Returns: (first_id, epoch), or (None, epoch) before TWS has sent an ID
+        """
+        with self.lock:
+            first = self.next_id
+            if first is not None:
+                self.next_id = first + count
+            return first, self.epoch
+
+    def block(self, size=100):
+        return OrderIdBlock(self, size)
+
+
+class OrderIdBlock:
+    """
+    A private range of order IDs for one strategy or symbol thread.
+
+    Not thread-safe by itself: give each submitting thread its own block.
+    IDs from different blocks interleave, so orders from two blocks do not
+    reach TWS in ID order and TWS rejects the late lower ones (error 103).
+    IBConnection therefore places orders with IDs from the shared allocator;
+    blocks suit callers that need unique IDs but not their order.
+    """
+
+    def __init__(self, allocator, size=100):
+        self.allocator = allocator
+        self.size = size
+        self.current = 0
+        self.end = 0
+        self.epoch = -1
+
+    def next(self):
+        if self.current >= self.end or self.epoch != self.allocator.epoch:
+            first, epoch = self.allocator.reserve(self.size)
+            if first is None:
+                return None
+            self.current, self.end, self.epoch = first, first + self.size, epoch
+        order_id = self.current
+        self.current += 1
+        return order_id
+
+    def remaining(self):
+        return self.end - self.current if self.epoch == self.allocator.epoch else 0
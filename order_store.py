@@ -0,0 +1,181 @@
+from collections import deque
+import json
+import logging
+import time
+
+
+class OrderRecord:
+    """Latest known state of one order, updated in place on every orderStatus"""
+
+    __slots__ = ('order_id', 'status', 'filled', 'remaining', 'avg_fill_price', 'why_held',
+                 'terminal', 'updated', 'executions')
+
+    def __init__(self, order_id):
+        self.order_id = order_id
+        self.status = ''
+        self.filled = 0.0
+        self.remaining = 0.0
+        self.avg_fill_price = 0.0
+        self.why_held = ''
+        self.terminal = False
+        self.updated = 0.0
+        self.executions = None
+
+    def as_dict(self):
+        """The status dict handed to order futures and get_order_status callers"""
+        return {
+            'status': self.status,
+            'filled': self.filled,
+            'remaining': self.remaining,
+            'avgFillPrice': self.avg_fill_price,
+            'whyHeld': self.why_held
+        }
+
+    def to_json(self):
+        return json.dumps({
+            'order_id': self.order_id,
+            **self.as_dict(),
+            'executions': self.executions or []
+        }, separators=(',', ':'))
+
+
+class OrderStore:
+    """
+    Order states keyed by order ID, bounded in memory.
+
+    Every record lives in one dict, so a lookup is a single dict probe.
+    Orders that reach a terminal status are also queued in completion
+    order. A terminal order is evicted once it is older than ttl seconds,
+    or when more than max_terminal are kept. Each update checks only the
+    head of the queue, so eviction is amortized O(1). Evicted orders are
+    appended to archive_path as JSON lines, if it is set.
+    """
+
+    def __init__(self, ttl=300.0, max_terminal=10000, archive_path=None):
+        self.ttl = ttl
+        self.max_terminal = max_terminal
+        self.archive_path = archive_path
+        self.records = {}
+        # The fill-waiting path calls this; bind the dict's own get so a
+        # lookup costs no more than it did on a plain dict
+        self.get = self.records.get
+        self.retired = deque()
+        self.terminal_count = 0
+        self.archived = 0
+        self.archive_file = None
+        self.clock = time.monotonic
+        self.logger = logging.getLogger('OrderStore')
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, order_id):
+        return order_id in self.records
+
+    def update(self, order_id, status, filled, remaining, avg_fill_price, why_held, terminal):
+        """Apply an orderStatus callback; returns the updated record"""
+        record = self.records.get(order_id)
+        if record is None:
+            record = self.records[order_id] = OrderRecord(order_id)
+        elif record.terminal and not terminal:
+            # Only known from executions so far, and still working; its
+            # queue entry is skipped when it reaches the head
+            record.terminal = False
+            self.terminal_count -= 1
+        record.status = status
+        record.filled = filled
+        record.remaining = remaining
+        record.avg_fill_price = avg_fill_price
+        record.why_held = why_held
+        record.updated = now = self.clock()
+        if terminal and not record.terminal:
+            self._retire(record, now)
+        return record
+
+    def add_execution(self, order_id, execution):
+        """
+        Attach a fill to its order
+        Returns: False if the execId was already recorded
+        """
+        record = self.records.get(order_id)
+        if record is None:
+            # Reported by reqExecutions for an order this process never saw
+            record = self.records[order_id] = OrderRecord(order_id)
+            record.status = 'Unknown'
+            record.updated = self.clock()
+            self._retire(record, record.updated)
+        if record.executions is None:
+            record.executions = []
+        elif any(fill['execId'] == execution['execId'] for fill in record.executions):
+            return False
+        record.executions.append(execution)
+        return True
+
+    def executions(self):
+        """Return {order_id: [fills]} for every order still in memory"""
+        return {
+            record.order_id: list(record.executions)
+            for record in list(self.records.values()) if record.executions
+        }
+
+    def _retire(self, record, now):
+        record.terminal = True
+        self.retired.append(record)
+        self.terminal_count += 1
+        # Common case: under the cap and the oldest order is still fresh
+        if self.terminal_count > self.max_terminal or self.retired[0].updated <= now - self.ttl:
+            self.evict(now)
+
+    def evict(self, now=None):
+        """Drop terminal orders past the TTL or the size cap, oldest first"""
+        records = self.records
+        retired = self.retired
+        expired = (now if now is not None else self.clock()) - self.ttl
+        evicted = []
+        while retired:
+            record = retired[0]
+            if not record.terminal or records.get(record.order_id) is not record:
+                # Went back to working, or retired again later in the queue
+                retired.popleft()
+                continue
+            if self.terminal_count <= self.max_terminal and record.updated > expired:
+                break
+            retired.popleft()
+            del records[record.order_id]
+            self.terminal_count -= 1
+            evicted.append(record)
+        if evicted:
+            self.archive(evicted)
+        return len(evicted)
+
+    def archive(self, records):
+        self.archived += len(records)
+        if not self.archive_path:
+            return
+        try:
+            if self.archive_file is None:
+                self.archive_file = open(self.archive_path, 'a')
+            self.archive_file.write(''.join(record.to_json() + '\n' for record in records))
+            self.archive_file.flush()
+        except OSError as e:
+            self.logger.error(f"Order archive write failed: {str(e)}")
+
+    def close(self):
+        """Archive every terminal order still in memory and close the archive"""
+        records = [record for record in self.records.values() if record.terminal]
+        for record in records:
+            del self.records[record.order_id]
+        self.retired.clear()
+        self.terminal_count = 0
+        if records:
+            self.archive(records)
+        if self.archive_file is not None:
+            self.archive_file.close()
+            self.archive_file = None
+
+
+def read_archive(path):
+    """Yield archived order dicts from an OrderStore archive file"""
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
@@ -0,0 +1,150 @@
+import math
+import threading
+
+
+class SymbolExposure:
+    """Running position and P&L for one symbol"""
+
+    __slots__ = ('symbol', 'shares', 'cost', 'realized', 'trades', 'price')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.shares = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.trades = 0
+        self.price = 0.0
+
+    @property
+    def market_value(self):
+        return self.shares * self.price
+
+    @property
+    def unrealized(self):
+        return self.shares * self.price - self.cost
+
+    def as_dict(self):
+        return {
+            'symbol': self.symbol,
+            'shares': self.shares,
+            'cost_basis': self.cost,
+            'price': self.price,
+            'market_value': self.market_value,
+            'realized': self.realized,
+            'unrealized': self.unrealized,
+            'trades': self.trades,
+        }
+
+
+class Portfolio:
+    """
+    Firm-wide position, P&L and exposure across every symbol traded.
+
+    Totals are running sums: a fill applies the change in that symbol's
+    shares, cost and realized P&L, and a price tick moves market value by
+    shares * price change, so summary() costs the same for one symbol or a
+    thousand and nothing is recomputed per tick. Every resync_every updates
+    the totals are rebuilt exactly from the per-symbol entries to shed
+    accumulated float error.
+
+    Updates may come from any thread: traders report fills, the reader
+    thread or trading loops report prices.
+    """
+
+    def __init__(self, resync_every=100_000):
+        self.symbols = {}
+        self.lock = threading.Lock()
+        self.resync_every = resync_every
+        self.updates = 0
+        self.total_shares = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.trades = 0
+        self.market_value = 0.0
+        self.gross_exposure = 0.0
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def _entry(self, symbol):
+        entry = self.symbols.get(symbol)
+        if entry is None:
+            entry = self.symbols[symbol] = SymbolExposure(symbol)
+        return entry
+
+    def mark(self, symbol, price):
+        """Revalue symbol's position at a new price"""
+        if price <= 0:
+            return
+        with self.lock:
+            entry = self._entry(symbol)
+            if entry.shares:
+                change = price - entry.price
+                self.market_value += entry.shares * change
+                self.gross_exposure += abs(entry.shares) * change
+            entry.price = price
+            self._count()
+
+    def set_position(self, symbol, shares, cost, realized, trades):
+        """
+        Report symbol's current totals after a fill; only the differences
+        from the last report are applied to the firm-wide sums
+        """
+        with self.lock:
+            entry = self._entry(symbol)
+            self.total_shares += shares - entry.shares
+            self.cost += cost - entry.cost
+            self.realized += realized - entry.realized
+            self.trades += trades - entry.trades
+            self.market_value += (shares - entry.shares) * entry.price
+            self.gross_exposure += (abs(shares) - abs(entry.shares)) * entry.price
+            entry.shares = shares
+            entry.cost = cost
+            entry.realized = realized
+            entry.trades = trades
+            self._count()
+
+    def _count(self):
+        self.updates += 1
+        if self.updates % self.resync_every == 0:
+            self._resync()
+
+    def _resync(self):
+        entries = self.symbols.values()
+        self.total_shares = math.fsum(entry.shares for entry in entries)
+        self.cost = math.fsum(entry.cost for entry in entries)
+        self.realized = math.fsum(entry.realized for entry in entries)
+        self.market_value = math.fsum(entry.shares * entry.price for entry in entries)
+        self.gross_exposure = math.fsum(abs(entry.shares) * entry.price for entry in entries)
+
+    def symbol(self, symbol):
+        """Return one symbol's entry as a dict, or None if it was never reported"""
+        with self.lock:
+            entry = self.symbols.get(symbol)
+            return entry.as_dict() if entry is not None else None
+
+    def summary(self):
+        """Return the firm-wide totals; O(1) in the number of symbols and lots"""
+        with self.lock:
+            unrealized = self.market_value - self.cost
+            return {
+                'symbols': len(self.symbols),
+                'shares': self.total_shares,
+                'cost_basis': self.cost,
+                'market_value': self.market_value,
+                'gross_exposure': self.gross_exposure,
+                'realized': self.realized,
+                'unrealized': unrealized,
+                'total_pnl': self.realized + unrealized,
+                'trades': self.trades,
+            }
+
+    def breakdown(self):
+        """Return every symbol's entry, largest gross exposure first"""
+        with self.lock:
+            entries = [entry.as_dict() for entry in self.symbols.values()]
+        entries.sort(key=lambda entry: abs(entry['market_value']), reverse=True)
+        return entries
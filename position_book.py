@@ -0,0 +1,195 @@
+from bisect import bisect_left, bisect_right
+
+
+class Lot:
+    """One position lot with its precomputed stop and target prices"""
+
+    __slots__ = ('lot_id', 'shares', 'price', 'timestamp', 'stop_price', 'target_price', 'exiting')
+
+    def __init__(self, lot_id, shares, price, timestamp, stop_price, target_price):
+        self.lot_id = lot_id
+        self.shares = shares
+        self.price = price
+        self.timestamp = timestamp
+        self.stop_price = stop_price
+        self.target_price = target_price
+        self.exiting = False
+
+    def __repr__(self):
+        return f"Lot({self.lot_id}, shares={self.shares}, price={self.price:.4f})"
+
+
+class _ThresholdIndex:
+    """Lots kept sorted by one threshold price, searchable with bisect"""
+
+    __slots__ = ('prices', 'lots')
+
+    def __init__(self):
+        self.prices = []
+        self.lots = []
+
+    def add(self, price, lot):
+        index = bisect_right(self.prices, price)
+        self.prices.insert(index, price)
+        self.lots.insert(index, lot)
+
+    def remove(self, price, lot):
+        start = bisect_left(self.prices, price)
+        end = bisect_right(self.prices, price)
+        for index in range(start, end):
+            if self.lots[index] is lot:
+                del self.prices[index]
+                del self.lots[index]
+                return
+
+    def at_or_above(self, price):
+        return self.lots[bisect_left(self.prices, price):]
+
+    def at_or_below(self, price):
+        return self.lots[:bisect_right(self.prices, price)]
+
+
+class PositionBook:
+    """
+    Open lots for one symbol, indexed by stop and target price.
+
+    Lots that are not already being exited are kept in two sorted indices,
+    so "which lots crossed their stop or target at price P" is a binary
+    search instead of a scan. Lots iterate in the order they were opened.
+    """
+
+    def __init__(self, stop_loss_percentage=-0.02, target_percentage=0.01):
+        self.stop_loss_percentage = stop_loss_percentage
+        self.target_percentage = target_percentage
+        self.lots = {}
+        self.stops = _ThresholdIndex()
+        self.targets = _ThresholdIndex()
+        self.next_lot_id = 1
+        self.active_count = 0
+        self.total_shares = 0
+        self.total_cost = 0.0
+        # Bumped whenever a lot's shares or price change, so views can skip redraws
+        self.version = 0
+
+    def __len__(self):
+        return len(self.lots)
+
+    def __bool__(self):
+        return bool(self.lots)
+
+    def __iter__(self):
+        return iter(list(self.lots.values()))
+
+    def set_thresholds(self, stop_loss_percentage, target_percentage):
+        """Change the stop and target percentages and re-index every lot"""
+        self.stop_loss_percentage = stop_loss_percentage
+        self.target_percentage = target_percentage
+        for lot in self.lots.values():
+            if not lot.exiting:
+                self._unindex(lot)
+            self._set_prices(lot)
+            if not lot.exiting:
+                self._index(lot)
+
+    def add(self, shares, price, timestamp):
+        """Open a new lot; returns it"""
+        lot = Lot(self.next_lot_id, shares, price, timestamp, 0.0, 0.0)
+        self.next_lot_id += 1
+        self._set_prices(lot)
+        self.lots[lot.lot_id] = lot
+        self.total_shares += shares
+        self.total_cost += shares * price
+        self.version += 1
+        self._index(lot)
+        return lot
+
+    def restore(self, lot_id, shares, price, timestamp):
+        """Re-open a lot under its original id, e.g. from a state journal"""
+        lot = Lot(lot_id, shares, price, timestamp, 0.0, 0.0)
+        self.next_lot_id = max(self.next_lot_id, lot_id + 1)
+        self._set_prices(lot)
+        self.lots[lot_id] = lot
+        self.total_shares += shares
+        self.total_cost += shares * price
+        self.version += 1
+        self._index(lot)
+        return lot
+
+    def fill(self, lot, shares, price):
+        """Add a partial fill to an existing lot at a new average price"""
+        cost = lot.shares * lot.price + shares * price
+        if not lot.exiting:
+            self._unindex(lot)
+        lot.shares += shares
+        lot.price = cost / lot.shares
+        self._set_prices(lot)
+        self.total_shares += shares
+        self.total_cost += shares * price
+        self.version += 1
+        if not lot.exiting:
+            self._index(lot)
+
+    def reduce(self, lot, shares):
+        """Take shares out of a lot at its entry price; closes it when empty"""
+        shares = min(shares, lot.shares)
+        lot.shares -= shares
+        self.total_shares -= shares
+        self.total_cost -= shares * lot.price
+        self.version += 1
+        if lot.shares <= 0:
+            self.remove(lot)
+
+    def remove(self, lot):
+        if self.lots.pop(lot.lot_id, None) is None:
+            return
+        if not lot.exiting:
+            self._unindex(lot)
+        self.version += 1
+        if lot.shares:
+            self.total_shares -= lot.shares
+            self.total_cost -= lot.shares * lot.price
+            lot.shares = 0
+        if not self.lots:
+            # Drop accumulated float error once flat
+            self.total_shares = 0
+            self.total_cost = 0.0
+
+    def mark_exiting(self, lot):
+        """Exclude a lot from stop/target queries while its exit order works"""
+        if not lot.exiting:
+            self._unindex(lot)
+            lot.exiting = True
+
+    def release(self, lot):
+        """Make a lot eligible for exits again, e.g. after its sell was cancelled"""
+        if lot.exiting and lot.lot_id in self.lots:
+            lot.exiting = False
+            self._index(lot)
+
+    def stopped_out(self, price):
+        """Lots whose stop price is at or above price"""
+        return self.stops.at_or_above(price)
+
+    def targets_hit(self, price):
+        """Lots whose target price is at or below price"""
+        return self.targets.at_or_below(price)
+
+    def highest_stop(self):
+        return self.stops.prices[-1] if self.stops.prices else None
+
+    def lowest_target(self):
+        return self.targets.prices[0] if self.targets.prices else None
+
+    def _set_prices(self, lot):
+        lot.stop_price = lot.price * (1 + self.stop_loss_percentage)
+        lot.target_price = lot.price * (1 + self.target_percentage)
+
+    def _index(self, lot):
+        self.stops.add(lot.stop_price, lot)
+        self.targets.add(lot.target_price, lot)
+        self.active_count += 1
+
+    def _unindex(self, lot):
+        self.stops.remove(lot.stop_price, lot)
+        self.targets.remove(lot.target_price, lot)
+        self.active_count -= 1
@@ -0,0 +1,459 @@
+from concurrent.futures import Future
+from functools import partial
+import logging
+import logging.handlers
+import multiprocessing
+import threading
+import time
+
+from async_logging import TICK_LOGGERS, RateLimitFilter
+from ib_connection import IBConnection
+from latency import LatencyTracker
+from market_data import QuoteTable
+from service import TradingService
+from tick_ring import TickRing
+
+
+class ProcessTradingService(TradingService):
+    """
+    TradingService with strategies in worker processes.
+
+    This process owns the IBConnection. Its reader thread decodes messages
+    and copies every tick into a shared-memory TickRing, so strategy CPU
+    work in the workers never competes with decoding for this process's
+    GIL. Workers send orders, cancels, position reports and their latency
+    histograms over one request queue served by route_requests. Order IDs
+    are assigned there, in the order orders are sent, because TWS rejects
+    an ID below one already used on the connection. Workers do not wait for
+    them: an order is sent under a provisional negative ID, which cancels
+    and bracket children may refer to, and the broker's ID and later the
+    final status go back on a queue per worker. Log records from the
+    workers are relayed to this process's handlers, and the portfolio here
+    covers every worker's strategies. After a reconnect the broker state
+    goes to every worker, behind the statuses of orders settled from it.
+    """
+
+    def __init__(self, config, ib=None):
+        super().__init__(config, ib)
+        self.context = multiprocessing.get_context('spawn')
+        self.ring = None
+        self.slots = {}
+        self.worker_of = {}
+        # [(process, response queue)] by worker index
+        self.workers = []
+        self.requests = None
+        # (worker, provisional ID) -> broker order ID, while the order works
+        self.provisional = {}
+        self.router = None
+        self.log_relay = None
+        self.worker_stop = None
+
+    def start_strategies(self):
+        """
+        Deal the strategies out round-robin to config['workers'] processes,
+        start them, then subscribe every symbol and publish its ticks into
+        the ring
+        """
+        config = self.config
+        strategies = config['strategies']
+        count = max(1, min(config['workers'], len(strategies)))
+        symbols = [strategy['symbol'].upper() for strategy in strategies]
+        for slot, symbol in enumerate(symbols):
+            self.slots[symbol] = slot
+            self.worker_of[symbol] = slot % count
+        broker_state = self.ib.request_broker_state() if config['journal_dir'] else None
+
+        self.ring = TickRing.create(config['ring_capacity'])
+        self.requests = self.context.Queue()
+        log_queue = self.context.Queue()
+        self.log_relay = logging.handlers.QueueListener(log_queue, _RelayHandler())
+        self.log_relay.start()
+        self.worker_stop = self.context.Event()
+        self.router = threading.Thread(target=self.route_requests, name='order-router', daemon=True)
+        self.router.start()
+
+        for worker in range(count):
+            assigned = [strategy for slot, strategy in enumerate(strategies) if slot % count == worker]
+            responses = self.context.Queue()
+            process = self.context.Process(
+                target=run_worker, name=f"strategy-worker-{worker}", daemon=True,
+                args=(worker, dict(config, strategies=assigned), self.ring.name, symbols,
+                      broker_state, self.requests, responses, log_queue, self.worker_stop)
+            )
+            process.start()
+            self.workers.append((process, responses))
+        if broker_state:
+            self.watch_open_orders(broker_state)
+        self.ib.add_reconnect_listener(self.forward_broker_state)
+
+        # Workers read the ring from its first tick, so nothing published
+        # before they attach is lost
+        for symbol, strategy in zip(symbols, strategies):
+            self.ib.add_tick_listener(symbol, partial(self.publish_tick, self.slots[symbol], symbol))
+            self.ib.subscribe(symbol, strategy['tick_by_tick'])
+        self.logger.info(f"Started {len(symbols)} strategies in {count} worker processes: {', '.join(symbols)}")
+
+    def watch_open_orders(self, broker_state):
+        """Route the final status of orders still working at the broker to the worker trading their symbol"""
+        for order_id, entry in broker_state['open_orders'].items():
+            worker = self.worker_of.get(entry.get('symbol'))
+            if worker is None:
+                continue
+            future = Future()
+            self.ib.order_futures[order_id] = future
+            future.add_done_callback(partial(self.route_status, worker, order_id))
+
+    def forward_broker_state(self, broker_state):
+        """Reconnect listener: hand the reconciled broker state to every worker"""
+        for _, responses in self.workers:
+            responses.put(('broker_state', broker_state))
+
+    def publish_tick(self, slot, symbol, price):
+        """Tick listener on the IB reader thread: copy the symbol's top of book into the ring"""
+        quotes = self.ib.quotes
+        index = quotes.slots[symbol]
+        self.ring.publish(slot, price, quotes.bid[index], quotes.ask[index], quotes.last_size[index],
+                          self.ib.last_tick_ns)
+        self.portfolio.mark(symbol, price)
+
+    def route_requests(self):
+        """Serve worker requests until a None arrives"""
+        while True:
+            message = self.requests.get()
+            if message is None:
+                return
+            kind, worker = message[0], message[1]
+            try:
+                if kind == 'place':
+                    self.place(worker, *message[2:])
+                elif kind == 'cancel':
+                    order_id = message[2]
+                    if order_id < 0:
+                        order_id = self.provisional.get((worker, order_id))
+                    if order_id is not None:
+                        self.ib.cancelOrder(order_id)
+                elif kind == 'position':
+                    self.portfolio.set_position(*message[2:])
+                elif kind == 'latency':
+                    self.ib.latency.merge_histograms(message[2])
+            except Exception as e:
+                self.logger.error(f"Worker {worker} {kind} request failed: {str(e)}")
+
+    def place(self, worker, provisional, contract, order, tick_ns, decision_ns):
+        """Send a worker's order under the next broker ID and tell the worker which it got"""
+        responses = self.workers[worker][1]
+        if order.parentId < 0:
+            # A bracket child names its parent by provisional ID; the parent went first
+            order.parentId = self.provisional.get((worker, order.parentId), 0)
+            if not order.parentId:
+                responses.put(('placed', provisional, None))
+                return
+        order_id, future = self.ib.submit_order(contract, order, tick_ns, decision_ns)
+        if order_id is not None:
+            self.provisional[(worker, provisional)] = order_id
+        # The ID goes out before the status callback can fire
+        responses.put(('placed', provisional, order_id))
+        if future is not None:
+            future.add_done_callback(partial(self.route_placed_status, worker, provisional, order_id))
+
+    def route_placed_status(self, worker, provisional, order_id, future):
+        self.provisional.pop((worker, provisional), None)
+        self.route_status(worker, order_id, future)
+
+    def route_status(self, worker, order_id, future):
+        self.workers[worker][1].put(('status', order_id, future.result()))
+
+    def stop_strategies(self):
+        """Stop the workers, then serve whatever they sent before exiting"""
+        self.ib.remove_reconnect_listener(self.forward_broker_state)
+        if self.worker_stop is not None:
+            self.worker_stop.set()
+        for process, responses in self.workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                self.logger.warning(f"{process.name} did not stop, terminating it")
+                process.terminate()
+            # Statuses for an exited worker may never be read
+            responses.cancel_join_thread()
+        if self.router is not None:
+            self.requests.put(None)
+            self.router.join(timeout=5)
+            self.router = None
+        if self.log_relay is not None:
+            self.log_relay.stop()
+            self.log_relay = None
+        super().stop_strategies()
+
+    def shutdown(self):
+        super().shutdown()
+        # After disconnect: the reader thread no longer publishes
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class _RelayHandler(logging.Handler):
+    """Hands log records from worker processes to this process's loggers"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+class RemotePortfolio:
+    """Portfolio stand-in for workers: fills are reported to the coordinator, which marks prices itself"""
+
+    def __init__(self, ib):
+        self.ib = ib
+
+    def mark(self, symbol, price):
+        pass
+
+    def set_position(self, symbol, shares, cost, realized, trades):
+        self.ib.send('position', symbol, shares, cost, realized, trades)
+
+
+class WorkerConnection:
+    """
+    IBConnection stand-in inside a strategy worker process.
+
+    Ticks for this worker's symbols are polled from the coordinator's
+    TickRing on a thread and handed to the tick listeners, as tickPrice
+    does in IBConnection; the ring is checked every poll_interval seconds
+    while it is idle. Orders and cancels go to the coordinator, and final
+    statuses come back to resolve the same per-order futures. The
+    coordinator assigns each order's ID as it sends the order on, so
+    submit_order returns a provisional one (see assigned_order_id). Latency
+    recorded here is shipped to the coordinator every latency_interval
+    seconds and on disconnect.
+    """
+
+    def __init__(self, worker, ring, symbols, slots, requests, responses, poll_interval=0.0002, broker_state=None,
+                 latency_interval=60.0):
+        self.worker = worker
+        self.requests = requests
+        self.responses = responses
+        self.symbols = symbols
+        self.quotes = QuoteTable()
+        for symbol in symbols:
+            self.quotes.add_symbol(symbol)
+        self.reader = ring.reader(slots, start=0)
+        self.poll_interval = poll_interval
+        self.broker_state = broker_state
+        self.tick_listeners = {}
+        self.reconnect_listeners = []
+        self.order_futures = {}
+        self.last_tick_ns = 0
+        self.latency = LatencyTracker()
+        self.latency_interval = latency_interval
+        self.symbol = None
+        self.is_connected = False
+        # Orders sent to the coordinator and waiting for their broker ID:
+        # provisional ID -> (order future, ID future)
+        self.placing = {}
+        # provisional ID -> ID future, until assigned_order_id hands it out
+        self.assigned = {}
+        # Provisional IDs count down from -1 and never clash with broker IDs
+        self.next_provisional = -1
+        self.provisional_lock = threading.Lock()
+        # broker ID -> provisional ID of orders placed from here
+        self.provisional_of = {}
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.logger = logging.getLogger('WorkerConnection')
+
+    create_contract = IBConnection.create_contract
+
+    def start(self):
+        self.is_connected = True
+        self.stop_event.clear()
+        for target, name in ((self.poll_ticks, 'ticks'), (self.receive, 'responses'),
+                             (self.ship_latency, 'latency')):
+            thread = threading.Thread(target=target, name=f"worker{self.worker}-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def disconnect(self):
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        self.stop_event.set()
+        self.responses.put(None)
+        for thread in self.threads:
+            thread.join(timeout=1)
+        self.threads = []
+        self.send_latency()
+        if self.reader.dropped:
+            self.logger.warning(f"Worker {self.worker} fell behind the tick ring and lost "
+                                f"{self.reader.dropped} ticks")
+
+    def send(self, kind, *args):
+        self.requests.put((kind, self.worker) + args)
+
+    def poll_ticks(self):
+        reader = self.reader
+        quotes = self.quotes
+        symbols = self.symbols
+        listeners = self.tick_listeners
+        while self.is_connected:
+            batch = reader.poll()
+            if batch is None:
+                time.sleep(self.poll_interval)
+                continue
+            for ts_ns, slot, last, bid, ask, size in zip(
+                    batch['ts_ns'].tolist(), batch['slot'].tolist(), batch['last'].tolist(),
+                    batch['bid'].tolist(), batch['ask'].tolist(), batch['size'].tolist()):
+                quotes.update_last(slot, last, size)
+                quotes.bid[slot] = bid
+                quotes.ask[slot] = ask
+                self.last_tick_ns = ts_ns
+                for listener in listeners.get(symbols[slot], ()):
+                    listener(last)
+
+    def ship_latency(self):
+        while not self.stop_event.wait(self.latency_interval):
+            self.send_latency()
+
+    def send_latency(self):
+        """Hand the histograms recorded since the last call to the coordinator, which merges them"""
+        histograms = self.latency.drain()
+        if histograms:
+            self.send('latency', histograms)
+
+    def receive(self):
+        """Apply the coordinator's responses until disconnect"""
+        while True:
+            message = self.responses.get()
+            if message is None:
+                return
+            if message[0] == 'status':
+                _, order_id, status = message
+                future = self.order_futures.pop(self.provisional_of.pop(order_id, order_id), None)
+                if future is not None and not future.done():
+                    future.set_result(status)
+            elif message[0] == 'placed':
+                _, provisional, order_id = message
+                entry = self.placing.pop(provisional, None)
+                if entry is None:
+                    continue
+                future, assigned = entry
+                if order_id is None:
+                    self.order_futures.pop(provisional, None)
+                    future.set_result({'status': 'Error', 'filled': 0.0, 'remaining': 0.0,
+                                       'avgFillPrice': 0.0, 'whyHeld': 'not placed by the coordinator'})
+                else:
+                    # Registered before any status for order_id can be read
+                    self.provisional_of[order_id] = provisional
+                assigned.set_result(order_id)
+            elif message[0] == 'broker_state':
+                self.broker_state = message[1]
+                for listener in list(self.reconnect_listeners):
+                    listener(message[1])
+
+    def submit_order(self, contract, order, tick_ns=0):
+        """
+        Hand an order to the coordinator without waiting for it
+        Returns: (provisional ID, future) like IBConnection.submit_order. The
+        provisional ID is negative; cancelOrder and a child's parentId
+        accept it, and assigned_order_id gives the broker's ID. If the
+        coordinator cannot place the order the future resolves with 'Error'
+        """
+        decision_ns = time.perf_counter_ns()
+        with self.provisional_lock:
+            provisional = self.next_provisional
+            self.next_provisional -= 1
+        future = Future()
+        assigned = Future()
+        self.order_futures[provisional] = future
+        self.placing[provisional] = (future, assigned)
+        self.assigned[provisional] = assigned
+        self.send('place', provisional, contract, order, tick_ns, decision_ns)
+        return provisional, future
+
+    def assigned_order_id(self, provisional):
+        """Future of the broker ID for a provisional ID from submit_order (None if not placed); call once"""
+        return self.assigned.pop(provisional)
+
+    def cancelOrder(self, order_id, *args):
+        self.send('cancel', order_id)
+
+    def request_broker_state(self, timeout=10.0):
+        """Broker state fetched once by the coordinator before the workers started"""
+        if self.broker_state is None:
+            raise RuntimeError("The coordinator did not fetch broker state")
+        return self.broker_state
+
+    def get_last_price(self, symbol):
+        return self.quotes.get(symbol)
+
+    def subscribe(self, symbol, tick_by_tick=False):
+        # The coordinator subscribes; ticks arrive through the ring
+        return self.quotes.slots.get(symbol)
+
+    def add_tick_listener(self, symbol, callback):
+        listeners = self.tick_listeners.setdefault(symbol, [])
+        if callback not in listeners:
+            listeners.append(callback)
+
+    def remove_tick_listener(self, symbol, callback):
+        listeners = self.tick_listeners.get(symbol)
+        if listeners and callback in listeners:
+            listeners.remove(callback)
+
+    def add_reconnect_listener(self, callback):
+        if callback not in self.reconnect_listeners:
+            self.reconnect_listeners.append(callback)
+
+    def remove_reconnect_listener(self, callback):
+        if callback in self.reconnect_listeners:
+            self.reconnect_listeners.remove(callback)
+
+    def stop_recording(self):
+        pass
+
+
+class WorkerService(TradingService):
+    """The strategies of one worker process, trading through a WorkerConnection"""
+
+    def __init__(self, config, ib):
+        super().__init__(config, ib)
+        self.portfolio = RemotePortfolio(ib)
+
+    def shutdown(self):
+        self.stopped.set()
+        self.stop_strategies()
+
+
+def setup_worker_logging(log_queue, config):
+    """Send every record to the coordinator, which writes them with its own handlers"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(getattr(logging, config['log_level'].upper()))
+    if config['tick_log_rate']:
+        for name in TICK_LOGGERS:
+            logging.getLogger(name).addFilter(RateLimitFilter(config['tick_log_rate']))
+
+
+def run_worker(worker, config, ring_name, symbols, broker_state,
+               requests, responses, log_queue, stop):
+    """Entry point of a strategy worker process"""
+    setup_worker_logging(log_queue, config)
+    ring = TickRing.attach(ring_name)
+    slots = [symbols.index(strategy['symbol'].upper()) for strategy in config['strategies']]
+    ib = WorkerConnection(worker, ring, symbols, slots, requests, responses,
+                          config['ring_poll_interval'], broker_state, config['latency_dump_interval'])
+    service = WorkerService(config, ib)
+
+    def wait_for_stop():
+        stop.wait()
+        service.stop()
+
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    ib.start()
+    try:
+        service.start_strategies()
+        service.run()
+    finally:
+        ib.disconnect()
+        ring.close()
@@ -0,0 +1,163 @@
+from collections import deque
+import logging
+import threading
+import time
+
+from latency import LatencyHistogram
+
+# Priority classes, most urgent first
+PRIORITY_CANCEL = 0
+PRIORITY_ORDER = 1
+PRIORITY_DATA = 2
+PRIORITY_NAMES = ('cancel', 'order', 'data')
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst banked"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Spend a token; returns 0.0, or the seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class OutboundScheduler:
+    """
+    Single outbound path for API messages, rate limited by a token bucket.
+
+    A message goes out on the caller's thread when nothing is queued and a
+    token is available, so an idle connection adds no hand-off. Otherwise it
+    waits in its priority class and a sender thread drains cancels, then
+    orders, then data requests, FIFO within a class. A cancel queued behind
+    its own order's placeOrder takes that message, and the orders queued
+    before it, along ahead of it; placeOrders never overtake one another.
+
+    With the default 40 messages per second and a burst of 10, no one-second
+    window exceeds the gateway's 50 messages per second.
+    """
+
+    def __init__(self, send, rate=40.0, burst=10):
+        # send(message, priority, key) writes one message to the socket
+        self.send = send
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.delayed = [0] * len(PRIORITY_NAMES)
+        self.max_depth = [0] * len(PRIORITY_NAMES)
+        self.waits = [LatencyHistogram() for _ in PRIORITY_NAMES]
+        self.logger = logging.getLogger('OutboundScheduler')
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name='outbound', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the sender thread; messages still queued are dropped
+        Returns: order IDs of the dropped placeOrder messages
+        """
+        with self.condition:
+            self.running = False
+            dropped = sum(len(queue) for queue in self.queues)
+            orders = [entry[3] for queue in self.queues for entry in queue if entry[2] == PRIORITY_ORDER]
+            for queue in self.queues:
+                queue.clear()
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        self.thread = None
+        if dropped:
+            self.logger.warning(f"Dropped {dropped} queued messages on stop")
+        return orders
+
+    def submit(self, priority, message, key=None):
+        """
+        Send message now if allowed, otherwise queue it
+        key: order ID for placeOrder and cancelOrder messages
+        """
+        queues = self.queues
+        with self.condition:
+            if not self.running:
+                self.send(message, priority, key)
+                return
+            now = time.monotonic()
+            if not (queues[0] or queues[1] or queues[2]) and self.bucket.take(now) == 0.0:
+                self.send(message, priority, key)
+                self.sent[priority] += 1
+                self.waits[priority].record(0)
+                return
+            if key is not None and priority == PRIORITY_CANCEL:
+                self._promote(key)
+            queue = queues[priority]
+            queue.append((time.perf_counter_ns(), message, priority, key))
+            self.delayed[priority] += 1
+            if len(queue) > self.max_depth[priority]:
+                self.max_depth[priority] = len(queue)
+            self.condition.notify()
+
+    def _promote(self, key):
+        """Move the queued orders up to the last message for order key into the cancel class"""
+        queue = self.queues[PRIORITY_ORDER]
+        last = None
+        for index, entry in enumerate(queue):
+            if entry[3] == key:
+                last = index
+        if last is None:
+            return
+        # Earlier orders go too, so order IDs still leave in increasing order
+        for _ in range(last + 1):
+            self.queues[PRIORITY_CANCEL].append(queue.popleft())
+
+    def run(self):
+        queues = self.queues
+        while True:
+            with self.condition:
+                while self.running and not (queues[0] or queues[1] or queues[2]):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                delay = self.bucket.take(time.monotonic())
+                if delay > 0.0:
+                    self.condition.wait(delay)
+                    continue
+                queue = queues[0] or queues[1] or queues[2]
+                enqueued_ns, message, priority, key = queue.popleft()
+                # Sent under the lock so messages leave in the order they were taken
+                self.send(message, priority, key)
+                self.sent[priority] += 1
+                self.waits[priority].record(time.perf_counter_ns() - enqueued_ns)
+
+    def queue_depths(self):
+        with self.condition:
+            return {name: len(queue) for name, queue in zip(PRIORITY_NAMES, self.queues)}
+
+    def snapshot(self):
+        """Return {class: {sent, delayed, queued, max_queued, wait}}; waits in microseconds"""
+        with self.condition:
+            return {
+                name: {
+                    'sent': self.sent[priority],
+                    'delayed': self.delayed[priority],
+                    'queued': len(self.queues[priority]),
+                    'max_queued': self.max_depth[priority],
+                    'wait': self.waits[priority].summary(),
+                }
+                for priority, name in enumerate(PRIORITY_NAMES)
+            }
@@ -0,0 +1,234 @@
+import json
+import logging
+import threading
+import time
+
+from ib_connection import IBConnection
+from journal import StateJournal
+from portfolio import Portfolio
+from strategy import load_strategy
+from trader import StockTrader, STOP_LOSS_PERCENTAGE
+
+DEFAULT_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 7497,
+    'client_id': 1,
+    'log_file': 'trading.log',
+    'log_level': 'INFO',
+    'tick_log_rate': 1.0,
+    'record_dir': None,
+    'latency_dump': None,
+    'latency_dump_interval': 60.0,
+    # Seconds to wait for a first quote when a strategy has no reference price
+    'reference_timeout': 30.0,
+    # Per-symbol state journals for warm restarts; None keeps state in memory only
+    'journal_dir': None,
+    'journal_snapshot_every': 10000,
+    # Finished orders kept in memory, then appended to order_archive if set
+    'order_ttl': 300.0,
+    'max_terminal_orders': 10000,
+    'order_archive': None,
+    # Outbound API messages per second and burst; the gateway allows 50/s
+    'message_rate': 40.0,
+    'message_burst': 10,
+    # Reconnect after TWS drops the socket, retrying every reconnect_delay
+    # seconds and doubling up to reconnect_max_delay
+    'reconnect': True,
+    'reconnect_delay': 0.5,
+    'reconnect_max_delay': 30.0,
+    # Strategy worker processes fed through a shared-memory tick ring; 0 runs
+    # every strategy on a thread in this process
+    'workers': 0,
+    'ring_capacity': 65536,
+    'ring_poll_interval': 0.0002,
+    'strategies': [],
+}
+
+STRATEGY_DEFAULTS = {
+    'reference_price': None,
+    'buy_trigger_percentage': -0.01,
+    'sell_trigger_percentage': 0.01,
+    'max_positions': 3,
+    'position_size': 30,
+    'stop_loss_percentage': STOP_LOSS_PERCENTAGE,
+    # Attach broker-side take-profit/stop orders (OCA bracket) to each buy
+    'bracket_orders': False,
+    # Stream unaggregated BidAsk/AllLast ticks (reqTickByTickData)
+    'tick_by_tick': False,
+    # Entry rules as 'module:Class' with keyword arguments; None keeps ThresholdStrategy
+    'strategy': None,
+    'strategy_params': {},
+}
+
+
+def load_config(path=None, overrides=None):
+    """
+    Read a JSON config file over DEFAULT_CONFIG, then apply overrides
+    (CLI values; None entries are ignored)
+    Returns: config dict with every strategy filled in from STRATEGY_DEFAULTS
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+    config['strategies'] = [{**STRATEGY_DEFAULTS, **strategy} for strategy in config['strategies']]
+    return config
+
+
+class TradingService:
+    """
+    Headless runner: connect to TWS, then run one StockTrader per configured
+    symbol on its own thread, all sharing one IBConnection.
+    """
+
+    def __init__(self, config, ib=None):
+        self.config = config
+        self.ib = ib or IBConnection(config['order_ttl'], config['max_terminal_orders'], config['order_archive'],
+                                     config['message_rate'], config['message_burst'], config['reconnect'],
+                                     config['reconnect_delay'], config['reconnect_max_delay'])
+        self.traders = {}
+        # Running P&L and exposure across every strategy
+        self.portfolio = Portfolio()
+        self.threads = []
+        self.stopped = threading.Event()
+        self.logger = logging.getLogger('TradingService')
+
+    def connect(self):
+        config = self.config
+        if not self.ib.connect_and_init(config['host'], config['port'], config['client_id']):
+            return False
+        if config['record_dir']:
+            self.ib.start_recording(config['record_dir'])
+        if config['latency_dump']:
+            self.ib.latency.start_dump(config['latency_dump'], config['latency_dump_interval'])
+        return True
+
+    def start_strategies(self):
+        """
+        Create a trader per symbol, restore and reconcile journaled state,
+        subscribe every symbol, then start the trading threads
+        """
+        strategies = []
+        for strategy in self.config['strategies']:
+            symbol = strategy['symbol'].upper()
+            trader = StockTrader(self.ib, symbol)
+            trader.set_parameters(
+                strategy['buy_trigger_percentage'],
+                strategy['sell_trigger_percentage'],
+                strategy['max_positions'],
+                strategy['position_size'],
+                strategy['stop_loss_percentage']
+            )
+            trader.bracket_orders = strategy['bracket_orders']
+            trader.tick_by_tick = strategy['tick_by_tick']
+            trader.portfolio = self.portfolio
+            if strategy['strategy']:
+                trader.strategy = load_strategy(strategy['strategy'], strategy['strategy_params'])
+            if self.config['journal_dir']:
+                trader.attach_journal(StateJournal(self.config['journal_dir'], symbol,
+                                                   self.config['journal_snapshot_every']))
+            self.traders[symbol] = trader
+            strategies.append((trader, strategy))
+
+        if self.config['journal_dir']:
+            self.reconcile()
+
+        for trader, strategy in strategies:
+            self.ib.subscribe(trader.symbol, trader.tick_by_tick)
+            thread = threading.Thread(
+                target=self.run_strategy, args=(trader, strategy['reference_price']),
+                name=f"trader-{trader.symbol}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        self.logger.info(f"Started {len(self.traders)} strategies: {', '.join(self.traders)}")
+
+    def reconcile(self):
+        """Settle every trader's journaled state against the broker in one request"""
+        started = time.perf_counter()
+        broker_state = self.ib.request_broker_state()
+        discrepancies = []
+        for trader in self.traders.values():
+            discrepancies += trader.reconcile(broker_state)
+        self.logger.info(f"Reconciled {len(self.traders)} strategies with the broker in "
+                         f"{(time.perf_counter() - started) * 1000:.0f}ms, "
+                         f"{len(discrepancies)} discrepancies")
+        return discrepancies
+
+    def run_strategy(self, trader, reference_price=None):
+        symbol = trader.symbol
+        try:
+            # A configured reference wins over one restored from the journal
+            reference_price = reference_price or trader.reference_price
+            if not reference_price:
+                reference_price = self.wait_for_price(symbol, self.config['reference_timeout'])
+                if not reference_price:
+                    self.logger.error(f"No price for {symbol} within "
+                                      f"{self.config['reference_timeout']}s, strategy not started")
+                    return
+            trader.set_reference_price(reference_price)
+            if not self.stopped.is_set():
+                trader.start_trading()
+        except Exception as e:
+            self.logger.error(f"Strategy for {symbol} stopped: {str(e)}")
+
+    def wait_for_price(self, symbol, timeout):
+        """Return the last price of symbol, waiting for the first tick if needed"""
+        price = self.ib.get_last_price(symbol)
+        if price > 0:
+            return price
+        ticked = threading.Event()
+        listener = lambda _: ticked.set()
+        self.ib.add_tick_listener(symbol, listener)
+        try:
+            deadline = time.monotonic() + timeout
+            while not self.stopped.is_set() and time.monotonic() < deadline:
+                if ticked.wait(0.1):
+                    break
+        finally:
+            self.ib.remove_tick_listener(symbol, listener)
+        price = self.ib.get_last_price(symbol)
+        return price if price > 0 else None
+
+    def run(self):
+        """Block until stop() is called, then shut down"""
+        self.stopped.wait()
+        self.shutdown()
+
+    def stop(self):
+        """Ask run() to return; safe from signal handlers and other threads"""
+        self.stopped.set()
+
+    def stop_strategies(self):
+        """Stop every trader, wait for its thread and close its journal"""
+        for trader in self.traders.values():
+            trader.stop_trading()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        for trader in self.traders.values():
+            if trader.journal:
+                trader.journal.close()
+        self.threads = []
+
+    def shutdown(self):
+        self.stopped.set()
+        if not self.ib.is_connected and not self.threads:
+            self.ib.stop_reconnecting()
+            return
+        self.stop_strategies()
+        self.ib.stop_recording()
+        self.ib.latency.stop_dump()
+        self.ib.disconnect()
+        self.ib.orders.close()
+        for name, stats in self.ib.scheduler.snapshot().items():
+            self.logger.info(f"Outbound {name}: {stats['sent']} sent, {stats['delayed']} delayed, "
+                             f"max queue {stats['max_queued']}, wait p99 {stats['wait']['p99']:.0f}us")
+        totals = self.portfolio.summary()
+        self.logger.info(f"Portfolio: {totals['symbols']} symbols, {totals['shares']} shares, "
+                         f"exposure ${totals['gross_exposure']:.2f}, realized ${totals['realized']:.2f}, "
+                         f"unrealized ${totals['unrealized']:.2f}")
+        self.ib.is_connected = False
+        self.logger.info("Trading service stopped")
@@ -0,0 +1,145 @@
+import importlib
+
+# Signal bits returned by Strategy.evaluate; 0 means do nothing
+BUY = 1
+SELL = 2
+REFERENCE = 4
+
+
+class Strategy:
+    """
+    Trading rules plugged into a StockTrader (trader.strategy).
+
+    The trader owns positions, orders and each lot's stop and target; a
+    strategy decides when to open a lot (BUY), close every open lot (SELL)
+    and move the reference price to the current tick (REFERENCE).
+
+    evaluate() makes those decisions for NumPy arrays of prices against the
+    inputs state() collects from a trader. Scalars and arrays broadcast, so
+    one call covers a window of ticks for one symbol (backtest replay scans
+    for the next tick that does anything) or the latest tick of many
+    symbols, each with its own state (stack_states). Live, on_tick evaluates
+    the single tick; the same object therefore makes the same decisions live
+    and in replay. Subclasses overriding on_tick or triggers for speed must
+    agree with evaluate, or replay will skip ticks they act on.
+
+    NumPy is imported inside the array methods, so a live trader whose
+    strategy has a scalar on_tick starts without it.
+
+    on_bar sees bars closed by the trader's indicators (enable_indicators),
+    on_fill every order that filled at least partly, after positions and
+    statistics were updated. Hooks run on the trader's thread.
+    """
+
+    def state(self, trader):
+        """Return {name: scalar} for everything evaluate reads from trader"""
+        return {
+            'reference': trader.reference_price,
+            'can_buy': trader.open_position_count() < trader.max_positions,
+        }
+
+    def evaluate(self, prices, state):
+        """Return BUY/SELL/REFERENCE bits for each price; broadcasts over prices and state"""
+        raise NotImplementedError
+
+    def triggers(self, prices, state):
+        """Boolean mask of the prices evaluate would signal on; replay scans with this"""
+        return self.evaluate(prices, state) != 0
+
+    def on_tick(self, trader, price):
+        self.act(trader, price, int(self.evaluate(price, self.state(trader))))
+
+    def act(self, trader, price, signal):
+        """Carry out signal on trader at price"""
+        if signal & SELL:
+            trader.close_positions(price)
+        if signal & BUY:
+            if trader.open_position_count() < trader.max_positions:
+                trader.execute_buy_order(price, trader.position_size)
+            trader.move_reference_price(price)
+        if signal & REFERENCE:
+            trader.move_reference_price(price)
+            trader.logger.info(f"Updated reference price to ${price:.2f}")
+
+    def on_bar(self, trader, bar):
+        pass
+
+    def on_fill(self, trader, trade):
+        pass
+
+
+class ThresholdStrategy(Strategy):
+    """
+    The original rules: buy when the price has dropped buy_trigger_percentage
+    from the reference price, and re-anchor the reference whenever the price
+    moves further than either trigger. Exits are left to each lot's stop and
+    target. Thresholds are the trader's, so set_parameters and the optimizer
+    keep working unchanged.
+    """
+
+    def state(self, trader):
+        state = super().state(trader)
+        state['buy_trigger'] = trader.buy_trigger_percentage
+        state['sell_trigger'] = trader.sell_trigger_percentage
+        return state
+
+    def evaluate(self, prices, state):
+        import numpy as np
+        buy_trigger = state['buy_trigger']
+        price_change = (prices - state['reference']) / state['reference']
+        buy = (price_change <= buy_trigger) & state['can_buy']
+        move = np.abs(price_change) > np.maximum(np.abs(buy_trigger), state['sell_trigger'])
+        return np.where(buy, BUY, 0) | np.where(move, REFERENCE, 0)
+
+    def triggers(self, prices, state):
+        # evaluate without building the signal codes; prices must be an array
+        import numpy as np
+        buy_trigger = state['buy_trigger']
+        price_change = (prices - state['reference']) / state['reference']
+        mask = np.abs(price_change) > np.maximum(np.abs(buy_trigger), state['sell_trigger'])
+        buy = price_change <= buy_trigger
+        buy &= state['can_buy']
+        mask |= buy
+        return mask
+
+    def on_tick(self, trader, price):
+        # Scalar form of evaluate; live ticks do not pay for NumPy dispatch
+        buy_trigger = trader.buy_trigger_percentage
+        price_change = (price - trader.reference_price) / trader.reference_price
+        trader.tick_logger.info("price_change %.2f%% at reference_price $%.2f",
+                                price_change * 100, trader.reference_price)
+        signal = 0
+        if price_change <= buy_trigger and trader.open_position_count() < trader.max_positions:
+            signal |= BUY
+        if abs(price_change) > max(abs(buy_trigger), trader.sell_trigger_percentage):
+            signal |= REFERENCE
+        if signal:
+            self.act(trader, price, signal)
+
+
+def stack_states(strategy, traders):
+    """Return {name: array} with one entry per trader, for evaluate over many symbols"""
+    import numpy as np
+    states = [strategy.state(trader) for trader in traders]
+    if not states:
+        return {}
+    return {name: np.array([state[name] for state in states]) for name in states[0]}
+
+
+def update_state(arrays, index, state):
+    """Refresh one trader's entries in arrays from stack_states"""
+    for name, value in state.items():
+        arrays[name][index] = value
+
+
+def load_strategy(spec, params=None):
+    """
+    Instantiate a strategy from a config value
+    spec: 'module:Class' or 'module.Class', importable from the working directory
+    params: keyword arguments for the class
+    """
+    module_name, _, class_name = spec.rpartition(':') if ':' in spec else spec.rpartition('.')
+    if not module_name:
+        raise ValueError(f"Strategy must be given as module:Class, got {spec!r}")
+    strategy_class = getattr(importlib.import_module(module_name), class_name)
+    return strategy_class(**(params or {}))
@@ -0,0 +1,181 @@
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# One fixed-width little-endian record per tick (32 bytes)
+RECORD = struct.Struct('<qiidd')
+TICK_DTYPE = np.dtype([
+    ('timestamp', '<i8'),  # epoch nanoseconds
+    ('req_id', '<i4'),
+    ('tick_type', '<i4'),
+    ('price', '<f8'),  # NaN for size-only ticks; bid, ask and last carry their size
+    ('size', '<f8'),
+])
+assert TICK_DTYPE.itemsize == RECORD.size
+
+DAY_NS = 86_400 * 1_000_000_000
+LAST_TICK_TYPE = 4
+
+
+class TickRecorder:
+    """
+    Append every tick to per-day binary files (UTC days).
+
+    A file's reqIds mean one symbol each, listed in its .symbols.json
+    sidecar. When a reqId would be mapped to a different symbol than the
+    day's file already records (a restart that subscribed in another order,
+    or a reqId reused), recording moves on to the next segment of the day,
+    ticks-YYYYMMDD.N.bin, so earlier ticks keep their symbols.
+
+    Records are packed into an in-memory buffer and written in blocks, so the
+    per-tick cost on the IB reader thread is one struct.pack_into call. The
+    buffer is written out when full, when flush_interval has elapsed since the
+    last write, and on close.
+    """
+
+    def __init__(self, directory, buffer_records=4096, flush_interval=1.0):
+        self.directory = directory
+        self.buffer_records = buffer_records
+        self.flush_interval_ns = int(flush_interval * 1_000_000_000)
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.file = None
+        self.path = None
+        self.day = None
+        self.segment = 0
+        self.day_end = 0
+        self.last_flush = 0
+        self.symbols = {}
+        self.file_symbols = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('TickRecorder')
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, req_id, tick_type, price, size=0.0, timestamp=None):
+        """Append one tick; timestamp defaults to now in epoch nanoseconds"""
+        if timestamp is None:
+            timestamp = time.time_ns()
+        with self.lock:
+            if timestamp >= self.day_end:
+                self._roll(timestamp)
+            RECORD.pack_into(self.buffer, self.offset, timestamp, req_id, tick_type, price, size)
+            self.offset += RECORD.size
+            if self.offset == len(self.buffer) or timestamp - self.last_flush >= self.flush_interval_ns:
+                self._write(timestamp)
+
+    def set_symbol(self, req_id, symbol):
+        """Remember which symbol a reqId refers to; saved next to the tick file"""
+        with self.lock:
+            self.symbols[req_id] = symbol
+            if not self.path:
+                return
+            if self.file_symbols.get(req_id, symbol) != symbol:
+                self.logger.info(f"reqId {req_id} was {self.file_symbols[req_id]} in {self.path}, now {symbol}")
+                self._open_segment(time.time_ns(), self.segment + 1)
+            else:
+                self.file_symbols[req_id] = symbol
+                self._write_symbols()
+
+    def flush(self):
+        with self.lock:
+            self._write(time.time_ns())
+
+    def close(self):
+        with self.lock:
+            self._write(time.time_ns())
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def _write(self, now):
+        if self.offset and self.file:
+            self.file.write(memoryview(self.buffer)[:self.offset])
+            self.file.flush()
+            self.offset = 0
+        self.last_flush = now
+
+    def _roll(self, timestamp):
+        day_start = timestamp - timestamp % DAY_NS
+        self.day_end = day_start + DAY_NS
+        self.day = time.strftime('%Y%m%d', time.gmtime(day_start // 1_000_000_000))
+        segments = [segment for day, segment, _ in _tick_files(self.directory) if day == self.day]
+        self._open_segment(timestamp, max(segments, default=0))
+
+    def _open_segment(self, now, segment):
+        """Write out the buffer and switch to the first segment, from segment on, whose reqIds agree with ours"""
+        self._write(now)
+        if self.file:
+            self.file.close()
+        while True:
+            path = tick_file_path(self.directory, self.day, segment)
+            file_symbols = load_symbols(path)
+            if all(file_symbols.get(req_id, symbol) == symbol for req_id, symbol in self.symbols.items()):
+                break
+            segment += 1
+        file_symbols.update(self.symbols)
+        self.segment = segment
+        self.path = path
+        self.file_symbols = file_symbols
+        self.file = open(self.path, 'ab')
+        # Drop a torn record left by a crash so the file stays record-aligned
+        misaligned = self.file.tell() % RECORD.size
+        if misaligned:
+            self.file.truncate(self.file.tell() - misaligned)
+            self.file.seek(0, os.SEEK_END)
+        self._write_symbols()
+        self.logger.info(f"Recording ticks to {self.path}")
+
+    def _write_symbols(self):
+        with open(symbols_file_path(self.path), 'w') as f:
+            json.dump({str(k): v for k, v in self.file_symbols.items()}, f)
+
+
+def tick_file_path(directory, day, segment=0):
+    """day: UTC date as a YYYYMMDD string; segments after the first are numbered from 1"""
+    name = f"ticks-{day}.bin" if segment == 0 else f"ticks-{day}.{segment}.bin"
+    return os.path.join(directory, name)
+
+
+def symbols_file_path(path):
+    return path[:-len('.bin')] + '.symbols.json'
+
+
+def _tick_files(directory):
+    """Yield (day, segment, path) for every tick file in directory"""
+    for path in glob.glob(os.path.join(directory, 'ticks-*.bin')):
+        day, _, segment = os.path.basename(path)[len('ticks-'):-len('.bin')].partition('.')
+        yield day, int(segment or 0), path
+
+
+def list_tick_files(directory):
+    """Tick files in recording order: by day, then segment"""
+    return [path for _, _, path in sorted(_tick_files(directory))]
+
+
+def load_symbols(path):
+    """Return {req_id: symbol} for a tick file"""
+    try:
+        with open(symbols_file_path(path)) as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def load_ticks(path):
+    """Map a tick file read-only as a NumPy structured array without copying"""
+    count = os.path.getsize(path) // RECORD.size
+    if count == 0:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+
+def last_prices(ticks, req_id):
+    """Return (prices, timestamps) of last-trade ticks for one reqId"""
+    selected = ticks[(ticks['req_id'] == req_id) & (ticks['tick_type'] == LAST_TICK_TYPE)]
+    return selected['price'], selected['timestamp']
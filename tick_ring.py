@@ -0,0 +1,149 @@
+from multiprocessing import shared_memory
+import struct
+
+import numpy as np
+
+# Header: [0] ticks published so far, [1] capacity
+HEADER_BYTES = 64
+TICK_DTYPE = np.dtype([('seq', '<i8'), ('ts_ns', '<i8'), ('slot', '<i8'),
+                       ('last', '<f8'), ('bid', '<f8'), ('ask', '<f8'), ('size', '<f8')])
+# Everything after seq, written in one call
+_BODY = struct.Struct('<qqdddd')
+_WORDS = TICK_DTYPE.itemsize // 8
+
+
+class TickRing:
+    """
+    Fixed-size ring of ticks in shared memory: one writer, any number of
+    readers, no locks.
+
+    The writer stores a tick's fields, then its sequence number, then
+    advances the published count in the header. Readers keep their own
+    cursor (TickReader) and never write to the ring, so adding a reader
+    costs the writer nothing. A reader that falls more than capacity ticks
+    behind loses the overwritten ticks and counts them; a slot overwritten
+    while it is being copied fails the sequence check and is counted the
+    same way.
+
+    The writer packs each tick with struct, which is cheaper than numpy for
+    single stores on the IB reader thread; readers copy whole batches out
+    as numpy record arrays.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        self.header = self.buf[:HEADER_BYTES].cast('q')
+        self.capacity = self.header[1]
+        self.mask = self.capacity - 1
+        self.words = self.buf[HEADER_BYTES:HEADER_BYTES + self.capacity * TICK_DTYPE.itemsize].cast('q')
+        self.records = np.frombuffer(self.buf, dtype=TICK_DTYPE, count=self.capacity, offset=HEADER_BYTES)
+        self.published = self.header[0]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, capacity=65536, name=None):
+        """Allocate a new ring; capacity must be a power of two"""
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError(f"Ring capacity must be a power of two, got {capacity}")
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=HEADER_BYTES + capacity * TICK_DTYPE.itemsize)
+        header = shm.buf[:HEADER_BYTES].cast('q')
+        header[0] = 0
+        header[1] = capacity
+        header.release()
+        ring = cls(shm, owner=True)
+        ring.records['seq'] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Open a ring created by another process. Readers should be started by
+        the creating process (multiprocessing), which owns the segment and
+        removes it in close()
+        """
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    def publish(self, slot, last, bid, ask, size, ts_ns):
+        """Append one tick; single writer only"""
+        seq = self.published
+        word = (seq & self.mask) * _WORDS
+        # Invalidate first so a reader copying this slot cannot accept a half-written tick
+        self.words[word] = -1
+        _BODY.pack_into(self.buf, HEADER_BYTES + word * 8 + 8, ts_ns, slot, last, bid, ask, size)
+        self.words[word] = seq
+        self.published = seq + 1
+        self.header[0] = seq + 1
+
+    def reader(self, slots=None, start=None):
+        return TickReader(self, slots, start)
+
+    def close(self):
+        """Release this process's mapping; the creator also removes the segment"""
+        self.records = None
+        self.words.release()
+        self.header.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class TickReader:
+    """
+    One consumer's position in a TickRing
+    slots: only return ticks for these slots; None returns every tick
+    start: first sequence number to read; None starts at the newest tick
+    """
+
+    def __init__(self, ring, slots=None, start=None):
+        self.ring = ring
+        self.cursor = ring.header[0] if start is None else start
+        self.dropped = 0
+        self.wanted = None
+        if slots is not None:
+            self.wanted = np.zeros(max(slots, default=-1) + 1, dtype=bool)
+            self.wanted[list(slots)] = True
+
+    def backlog(self):
+        return self.ring.header[0] - self.cursor
+
+    def poll(self, max_ticks=4096):
+        """
+        Copy out the ticks published since the last poll, oldest first
+        Returns: TICK_DTYPE record array (seq, ts_ns, slot, last, bid, ask,
+        size), or None when nothing new has been published
+        """
+        ring = self.ring
+        head = ring.header[0]
+        cursor = self.cursor
+        if head == cursor:
+            return None
+        if head - cursor > ring.capacity:
+            # Lapped: everything older than one ring's worth is gone
+            self.dropped += head - ring.capacity - cursor
+            cursor = head - ring.capacity
+        end = min(head, cursor + max_ticks)
+        sequence = np.arange(cursor, end, dtype=np.int64)
+        index = sequence & ring.mask
+        batch = ring.records[index]
+        self.cursor = end
+
+        # A slot the writer started overwriting during the copy no longer
+        # holds its sequence number, even if the copied seq still matched
+        valid = (batch['seq'] == sequence) & (ring.records['seq'][index] == sequence)
+        if not valid.all():
+            self.dropped += int(len(valid) - valid.sum())
+        if self.wanted is not None:
+            slots = batch['slot']
+            in_range = slots < len(self.wanted)
+            valid &= in_range
+            valid[in_range] &= self.wanted[slots[in_range]]
+        if not valid.all():
+            batch = batch[valid]
+        return batch
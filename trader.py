@@ -1,34 +1,89 @@
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
 from ibapi.order import Order
 from ibapi.order_state import OrderState
 from ibapi.common import *  # For error codes and other constants
 import time
+import queue
 import logging
+from concurrent.futures import Future
 from datetime import datetime
+from position_book import PositionBook
+from indicators import BarIndicators
+from strategy import ThresholdStrategy
+
+STOP_LOSS_PERCENTAGE = -0.02  # 2% stop loss
+
+# Event kinds carried on StockTrader.event_queue
+TICK_EVENT = 'tick'
+ORDER_EVENT = 'order'
+# Wakes the trading loop so stop_trading takes effect immediately
+STOP_EVENT = 'stop'
+# Broker state fetched after IBConnection reconnected
+RECONNECT_EVENT = 'reconnect'
+# Broker ID assigned to an order placed under a provisional one
+ORDER_ID_EVENT = 'order_id'
 
 
 class StockTrader:
-    def __init__(self, ib_connection):
+    def __init__(self, ib_connection, symbol=None):
         self.ib = ib_connection
+        self.symbol = symbol
         self.reference_price = 0
         self.buy_count = 0
-        self.positions = []
         self.start_time = None
         self.is_trading = False
         self.logger = logging.getLogger('StockTrader')
+        # Per-tick messages; rate limited when async logging is set up
+        self.tick_logger = logging.getLogger('StockTrader.ticks')
         self.total_trades = 0
         self.total_profit = 0
+        self.event_queue = queue.Queue()
+        self.pending_orders = {}
+        self.pending_buys = 0
+        # Arrival time of the tick being processed, for latency tracking
+        self.tick_ns = 0
+        self.order_timeout = 60  # seconds before an unfilled order is cancelled
+        # Attach take-profit and stop orders to every buy, working at the broker
+        self.bracket_orders = False
+        # Subscribe to unaggregated BidAsk/AllLast ticks instead of sampled quotes
+        self.tick_by_tick = False
+        # Limit prices come off the live spread while it is at most this wide
+        self.max_spread_percentage = 0.005
+        self.buy_trigger_percentage = -0.01
+        self.sell_trigger_percentage = 0.01
+        self.max_positions = 3
+        self.position_size = 30
+        self.stop_loss_percentage = STOP_LOSS_PERCENTAGE
+        self.positions = PositionBook(self.stop_loss_percentage, self.sell_trigger_percentage)
+        # Replaced by the backtest engine with a simulated clock
+        self.clock = datetime.now
+        self.now = time.time  # seconds, for bar timestamps
+        # Optional BarIndicators driving reference price and stop distance
+        self.indicators = None
+        self.stop_atr_multiple = None
+        # Optional StateJournal recording lots, orders and statistics
+        self.journal = None
+        # Orders in flight when the previous process stopped, from the journal
+        self.recovered_orders = {}
+        # Optional Portfolio shared by every trader, for firm-wide P&L
+        self.portfolio = None
+        # Entry and reference rules; see strategy.Strategy
+        self.strategy = ThresholdStrategy()
 
     def monitor_and_trade(self, symbol: str, buy_trigger_percentage=-0.01, sell_trigger_percentage=0.01,
-                          max_positions=3, position_size=30):
+                          max_positions=3, position_size=30, stop_loss_percentage=STOP_LOSS_PERCENTAGE):
         """
         Monitor real-time prices and execute trades based on conditions
         buy_trigger_percentage: negative percentage indicating price drop to trigger buy
         sell_trigger_percentage: positive percentage indicating price rise to trigger sell
         max_positions: maximum number of positions allowed
         position_size: number of shares per position
+        stop_loss_percentage: negative percentage below entry price that closes a lot
+
+        Ticks pushed by IBConnection.tickPrice and order completions resolved
+        by IBConnection.orderStatus both arrive on event_queue and are handled
+        on this thread as soon as they arrive. Orders never block the loop.
         """
         try:
             if not self.ib.is_connected:
@@ -41,101 +96,187 @@ class StockTrader:
             self.logger.info(f"Starting price monitoring for {symbol}")
             self.logger.info(f"Current connection status: {self.ib.is_connected}")
 
-            # self.ib.start_price_stream(symbol)
-            # Add timeout for initial price data
-            timeout = 30  # seconds
-            start_time = time.time()
-            while self.ib.current_price <= 0:
-                if time.time() - start_time > timeout:
+            self.set_parameters(buy_trigger_percentage, sell_trigger_percentage, max_positions,
+                                position_size, stop_loss_percentage)
+
+            # Several traders can share one connection, one symbol each
+            self.symbol = symbol
+            self.ib.subscribe(symbol, self.tick_by_tick)
+            self.ib.add_tick_listener(symbol, self.on_tick)
+            self.ib.add_reconnect_listener(self.on_reconnect)
+            try:
+                # Add timeout for initial price data
+                timeout = 30  # seconds
+                last_price = self.ib.get_last_price(symbol)
+                if last_price > 0:
+                    self.event_queue.put((TICK_EVENT, (last_price, 0.0), 0))
+                try:
+                    kind, payload, timestamp_ns = self.event_queue.get(timeout=timeout)
+                except queue.Empty:
                     raise TimeoutError("Timeout waiting for initial price data")
-                time.sleep(1)
+                self.dispatch_event(kind, payload, timestamp_ns)
+
+                while self.is_trading:
+                    try:
+                        kind, payload, timestamp_ns = self.event_queue.get(timeout=1)
+                    except queue.Empty:
+                        self.check_order_timeouts()
+                        continue
+                    self.dispatch_event(kind, payload, timestamp_ns)
+                    self.check_order_timeouts()
+            finally:
+                self.ib.remove_tick_listener(symbol, self.on_tick)
+                self.ib.remove_reconnect_listener(self.on_reconnect)
 
+        except Exception as e:
+            self.logger.error(f"Monitoring error: {str(e)}")
+            raise
 
-            # Store reference price for calculating triggers
-            # reference_price = self.ib.current_price
-
-            STOP_LOSS_PERCENTAGE = -0.02  # 2% stop loss
-
-            while True:
-                current_price = self.ib.current_price
+    def set_parameters(self, buy_trigger_percentage, sell_trigger_percentage, max_positions,
+                       position_size, stop_loss_percentage=STOP_LOSS_PERCENTAGE):
+        """Set the trigger thresholds and sizing used by process_tick"""
+        self.buy_trigger_percentage = buy_trigger_percentage
+        self.sell_trigger_percentage = sell_trigger_percentage
+        self.max_positions = max_positions
+        self.position_size = position_size
+        self.stop_loss_percentage = stop_loss_percentage
+        self.positions.set_thresholds(stop_loss_percentage, sell_trigger_percentage)
+
+    def enable_indicators(self, bar_seconds=60.0, ema_period=20, atr_period=14, stop_atr_multiple=2.0):
+        """
+        Derive levels from live bars instead of fixed settings: on every bar
+        close the reference price moves to the EMA of closes and, once ATR is
+        available, the stop loss is set stop_atr_multiple ATRs below entry
+        """
+        self.indicators = BarIndicators(bar_seconds, ema_period, ema_period, atr_period)
+        self.stop_atr_multiple = stop_atr_multiple
+
+    def on_bar(self, bar):
+        indicators = self.indicators
+        if indicators.ema.ready:
+            self.reference_price = indicators.ema.value
+            self.record_reference_price()
+        if self.stop_atr_multiple and indicators.atr.ready and bar.close > 0:
+            stop_loss_percentage = -self.stop_atr_multiple * indicators.atr.value / bar.close
+            if stop_loss_percentage != self.stop_loss_percentage:
+                self.stop_loss_percentage = stop_loss_percentage
+                self.positions.set_thresholds(stop_loss_percentage, self.sell_trigger_percentage)
+        self.logger.info("Bar closed %s: reference $%.2f, stop %.2f%%", bar,
+                         self.reference_price, self.stop_loss_percentage * 100)
+        self.strategy.on_bar(self, bar)
+
+    def on_tick(self, price):
+        """Hand a tick from the IB reader thread over to the strategy thread"""
+        # last_tick_ns and last_size belong to the trade being dispatched
+        size = self.ib.quotes.get(self.symbol, 'last_size')
+        self.event_queue.put((TICK_EVENT, (price, size), self.ib.last_tick_ns))
+
+    def on_order_done(self, trade):
+        """Hand a completed order back to the strategy thread"""
+        self.event_queue.put((ORDER_EVENT, trade, 0))
+
+    def on_order_id(self, trade, order_id):
+        """Hand the broker ID of an order placed under a provisional one to the strategy thread"""
+        self.event_queue.put((ORDER_ID_EVENT, (trade, order_id), 0))
+
+    def on_reconnect(self, broker_state):
+        """Reconnect listener; queued behind the fills IBConnection settled before calling it"""
+        self.event_queue.put((RECONNECT_EVENT, broker_state, 0))
+
+    def dispatch_event(self, kind, payload, timestamp_ns=0):
+        if kind == TICK_EVENT:
+            if timestamp_ns:
+                self.ib.latency.record('tick_queue', time.perf_counter_ns() - timestamp_ns)
+            self.tick_ns = timestamp_ns
+            self.process_tick(*payload)
+        elif kind == ORDER_EVENT:
+            self.handle_order_event(payload)
+        elif kind == RECONNECT_EVENT:
+            self.resume_after_reconnect(payload)
+        elif kind == ORDER_ID_EVENT:
+            self.assign_order_id(*payload)
+
+    def process_pending_events(self):
+        """Handle queued events without blocking; used by the backtest engine"""
+        while True:
+            try:
+                kind, payload, timestamp_ns = self.event_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.dispatch_event(kind, payload, timestamp_ns)
 
-                if current_price <= 0:  # Add price validation
-                    self.logger.warning("Invalid price received, skipping cycle")
-                    time.sleep(1)
-                    continue
+    def open_position_count(self):
+        """
+        Positions that count towards max_positions: every lot still held,
+        including those with a working exit or bracket, plus pending buys
+        """
+        return len(self.positions) + self.pending_buys
 
-                price_change = (current_price - self.reference_price) / self.reference_price
-                self.logger.info(f"price_change ${price_change:.2f} at reference_price ${self.reference_price:.2f}")
-                # Check stop loss for all positions
-                for position in self.positions:
-                    loss_percentage = (current_price - position['price']) / position['price']
-                    if loss_percentage <= STOP_LOSS_PERCENTAGE:
-                        self.logger.warning(f"Stop loss triggered at {loss_percentage:.2%}")
-                        self.execute_sell_order([position], [], position['shares'], current_price)
+    def process_tick(self, current_price, size=0.0):
+        """
+        Run stop-loss, sell and buy checks against a single tick
+        size: shares traded at current_price, weighting the live bar's volume and VWAP
+        """
+        if current_price <= 0:  # Add price validation
+            self.logger.warning("Invalid price received, skipping tick")
+            return
+        if self.portfolio is not None:
+            self.portfolio.mark(self.symbol, current_price)
 
-                # Check for sell conditions first
-                if self.positions:
-                    self.check_and_execute_sells(current_price, sell_trigger_percentage)
+        if self.indicators is not None:
+            bar = self.indicators.update(current_price, size, self.now())
+            if bar is not None:
+                self.on_bar(bar)
 
-                # Check for buy conditions
-                if len(self.positions) < max_positions and price_change <= buy_trigger_percentage:
-                    self.execute_buy_order(current_price, position_size)
-                    # Update reference price after buy
-                    self.reference_price = current_price
+        # Stops and targets hit on this tick leave in a single sell order
+        if self.positions:
+            self.check_and_execute_sells(current_price, self.sell_trigger_percentage)
 
-                # Update reference price if price moved significantly
-                if abs(price_change) > max(abs(buy_trigger_percentage), sell_trigger_percentage):
-                    self.reference_price = current_price
-                    self.logger.info(f"Updated reference price to ${self.reference_price:.2f}")
+        self.strategy.on_tick(self, current_price)
 
-                time.sleep(1)
+    def move_reference_price(self, price):
+        self.reference_price = price
+        self.record_reference_price()
 
-        except Exception as e:
-            self.logger.error(f"Monitoring error: {str(e)}")
-            raise
+    def close_positions(self, current_price):
+        """Sell every lot that is not already being exited, in one order"""
+        lots = [lot for lot in self.positions if not lot.exiting]
+        if lots:
+            self.execute_sell_order(lots, sum(lot.shares for lot in lots), current_price)
 
     def check_and_execute_sells(self, current_price, sell_trigger_percentage):
-        """Check positions and execute sells based on current price"""
-        profitable_positions = []
-        positions_to_keep = []
-        total_shares_to_sell = 0
+        """
+        Collect every lot at its stop or target and sell them in one order
+        Returns: lots the exit order covers
+        """
         price_at_analysis = current_price
-
-        for position in self.positions:
-            profit_percentage = (price_at_analysis - position['price']) / position['price']
-            if profit_percentage >= sell_trigger_percentage:
-                profitable_positions.append(position)
-                total_shares_to_sell += position['shares']
-            else:
-                positions_to_keep.append(position)
-
-        if profitable_positions:
-            self.execute_sell_order(profitable_positions, positions_to_keep,
-                                    total_shares_to_sell, price_at_analysis)
+        # Stops and targets were precomputed when the lots opened
+        stopped = self.positions.stopped_out(price_at_analysis)
+        for lot in stopped:
+            loss_percentage = (price_at_analysis - lot.price) / lot.price
+            self.logger.warning("Stop loss triggered at %.2f%%", loss_percentage * 100)
+        exits = stopped + [lot for lot in self.positions.targets_hit(price_at_analysis)
+                           if lot not in stopped]
+        if exits:
+            total_shares_to_sell = sum(lot.shares for lot in exits)
+            self.execute_sell_order(exits, total_shares_to_sell, price_at_analysis)
+        return exits
 
     def execute_buy_order(self, current_price, position_size):
-        """Execute buy order at current price level"""
+        """
+        Submit a buy order at current price level
+        Returns: True if the order was sent; the position is added when it fills
+        """
         try:
             # Verify connection
             if not self.ib.is_connected:
                 self.logger.error("Not connected to IB")
                 return False
 
-            # Get next valid order ID
-            order_id = self.ib.get_next_order_id()
-            if order_id is None:
-                self.logger.error("Failed to get valid order ID")
-                return False
-
             # Create contract
-            contract = Contract()
-            contract.symbol = self.ib.symbol
-            contract.secType = "STK"
-            contract.exchange = "SMART"
-            contract.currency = "USD"
+            contract = self.ib.create_contract(self.symbol)
 
-            # Create limit buy order slightly above current price
-            limit_price = current_price * 1.0001  # 0.01% above current price
+            limit_price = self.limit_price("BUY", current_price)
 
             order = Order()
             order.action = "BUY"
@@ -146,55 +287,32 @@ class StockTrader:
             order.tif = 'GTC'  # Good-Til-Canceled
             order.outsideRth = True  # Allow order outside regular trading hours
 
-            # Log order details
-            self.logger.info(f"Placing order {order_id}: BUY {position_size} {contract.symbol} @ ${limit_price:.2f}")
-
-            # Place order
-            self.ib.placeOrder(order_id, contract, order)
-
-            # Create trade object
-            trade = {
-                'order': order,
-                'contract': contract,
-                'order_id': order_id,
-                'status': None,
-                'filled': 0,
-                'avgFillPrice': 0,
-                'orderStatus': None
-            }
-
-            # Wait for fill
-            if self.wait_for_fill(trade):
-                actual_fill_price = trade.get('avgFillPrice', current_price)
-
-                # Add position
-                self.positions.append({
-                    'shares': position_size,
-                    'price': actual_fill_price,
-                    'timestamp': datetime.now()
-                })
-
-                self.logger.info(f"Buy executed: {position_size} shares at ${actual_fill_price:.2f}")
-                return True
-
-            return False
+            if self.bracket_orders:
+                trade = self.submit_bracket(contract, order)
+            else:
+                trade = self.submit_order(contract, order)
+            if trade is None:
+                return False
+            self.pending_buys += 1
+            return True
 
         except Exception as e:
             self.logger.error(f"Buy execution error: {str(e)}")
             return False
 
-    def execute_sell_order(self, profitable_positions, positions_to_keep,
-                           total_shares_to_sell, current_price):
-        """Execute sell order for profitable positions"""
+    def execute_sell_order(self, positions_to_sell, total_shares_to_sell, current_price):
+        """
+        Submit one sell order covering positions_to_sell
+        Returns: True if the order was sent; positions are closed when it fills
+        """
         try:
-            contract = Contract()
-            contract.symbol = self.ib.symbol
-            contract.secType = "STK"
-            contract.exchange = "SMART"
-            contract.currency = "USD"
+            if not self.ib.is_connected:
+                self.logger.error("Not connected to IB")
+                return False
 
-            # Create limit sell order slightly below current price
-            limit_price = current_price * 0.999  # 0.1% below current price
+            contract = self.ib.create_contract(self.symbol)
+
+            limit_price = self.limit_price("SELL", current_price)
 
             order = Order()
             order.action = "SELL"
@@ -203,72 +321,234 @@ class StockTrader:
             order.lmtPrice = limit_price
             order.tif = "DAY"
 
-            trade = self.ib.placeOrder(contract, order)
-
-            if self.wait_for_fill(trade):
-                actual_fill_price = trade.orderStatus.avgFillPrice
-
-                # Calculate actual profit
-                actual_total_profit = sum(
-                    (actual_fill_price - pos['price']) * pos['shares']
-                    for pos in profitable_positions
-                )
-
-                # Update positions and statistics
-                self.positions = positions_to_keep
-                self.total_trades += 1
-                self.total_profit += actual_total_profit
-
-                self.logger.info(
-                    f"Sell executed: {total_shares_to_sell} shares at ${actual_fill_price:.2f}, "
-                    f"Profit: ${actual_total_profit:.2f}"
-                )
-                return True
+            trade = self.submit_order(contract, order, positions=positions_to_sell)
+            if trade is None:
+                return False
+            # Exclude from further exit checks until the order completes
+            for lot in positions_to_sell:
+                self.positions.mark_exiting(lot)
+            return True
 
         except Exception as e:
             self.logger.error(f"Sell execution error: {str(e)}")
             return False
 
-    def wait_for_fill(self, trade, timeout=60):
+    def limit_price(self, action, current_price):
         """
-        Wait for order to fill with timeout
-        Returns: True if filled, False if timeout or error
+        Price a limit order at the far touch of the live spread: the ask for
+        buys, the bid for sells. Without a sane two-sided quote, fall back to
+        a fixed offset from current_price.
         """
-        start_time = time.time()
-
-        while True:
-            # Check if timeout reached
-            if time.time() - start_time > timeout:
-                self.logger.error("Order timeout - cancelling order")
+        bid, ask = self.ib.quotes.bid_ask(self.symbol)
+        if 0 < bid <= ask and ask - bid <= current_price * self.max_spread_percentage:
+            return ask if action == "BUY" else bid
+        if action == "BUY":
+            return current_price * 1.0001  # 0.01% above current price
+        return current_price * 0.999  # 0.1% below current price
+
+    def submit_bracket(self, contract, parent):
+        """
+        Place a buy with a take-profit limit sell and a stop sell attached.
+        The children share an OCA group, so when one fills the broker
+        cancels the other, and they only become active once the parent
+        fills. Their prices come from the parent's limit price and the
+        current sell and stop percentages.
+        Returns: the parent's trade dict, or None on failure
+        """
+        take_profit = Order()
+        take_profit.action = "SELL"
+        take_profit.orderType = "LMT"
+        take_profit.lmtPrice = round(parent.lmtPrice * (1 + self.sell_trigger_percentage), 2)
+
+        stop = Order()
+        stop.action = "SELL"
+        stop.orderType = "STP"
+        stop.auxPrice = round(parent.lmtPrice * (1 + self.stop_loss_percentage), 2)
+
+        # Nothing is sent on to the exchange until the last child arrives
+        parent.transmit = False
+        trade = self.submit_order(contract, parent)
+        if trade is None:
+            return None
+        parent_id = trade['order_id']
+        oca_group = f"{contract.symbol}-{parent_id}"
+        trade['children'] = []
+        for child in (take_profit, stop):
+            child.parentId = parent_id
+            child.totalQuantity = parent.totalQuantity
+            child.tif = 'GTC'
+            child.outsideRth = parent.outsideRth
+            child.ocaGroup = oca_group
+            child.ocaType = 1  # Cancel the rest of the group when one fills
+            child.transmit = child is stop
+            # Protective orders work until they fill, never timing out
+            child_trade = self.submit_order(contract, child, timeout=float('inf'))
+            if child_trade is None:
+                # The group was never transmitted; drop the parent too
+                self.ib.cancelOrder(parent_id)
+                break
+            child_trade['siblings'] = trade['children']
+            trade['children'].append(child_trade)
+        return trade
+
+    def submit_order(self, contract, order, positions=None, timeout=None):
+        """
+        Place an order without waiting for it
+        Returns: trade dict tracked in pending_orders, or None on failure
+        """
+        order_id, future = self.ib.submit_order(contract, order, tick_ns=self.tick_ns)
+        if order_id is None:
+            self.logger.error("Failed to get valid order ID")
+            return None
+
+        self.logger.info("Placed order %s: %s %s %s %s @ $%.2f", order_id, order.action, order.orderType,
+                         order.totalQuantity, contract.symbol,
+                         order.auxPrice if order.orderType == 'STP' else order.lmtPrice)
+        trade = self.track_order(order_id, future, contract, order, positions, timeout)
+        if order_id < 0:
+            # Provisional: the coordinator process assigns the broker's ID as it sends the order
+            self.ib.assigned_order_id(order_id).add_done_callback(
+                lambda assigned, trade=trade: self.on_order_id(trade, assigned.result()))
+        else:
+            self.journal_order(trade)
+        return trade
+
+    def assign_order_id(self, trade, order_id):
+        """Re-key a trade placed under a provisional ID by the broker's ID, unless it already finished"""
+        if order_id is None or self.pending_orders.pop(trade['order_id'], None) is None:
+            return
+        self.logger.debug("Order %s placed as %s", trade['order_id'], order_id)
+        trade['order_id'] = order_id
+        self.pending_orders[order_id] = trade
+        self.journal_order(trade)
+
+    def journal_order(self, trade):
+        """Record a working order with the lots it covers so a restart can settle it"""
+        if self.journal and trade['order_id'] > 0:
+            self.journal.append('order', id=trade['order_id'], action=trade['action'],
+                                qty=trade['order'].totalQuantity,
+                                lots=[lot.lot_id for lot in trade['positions']])
+
+    def track_order(self, order_id, future, contract, order, positions=None, timeout=None):
+        """Add an order to pending_orders; its future's completion is handled on this thread"""
+        trade = {
+            'order': order,
+            'contract': contract,
+            'order_id': order_id,
+            'action': order.action,
+            'positions': positions or [],
+            'future': future,
+            'deadline': time.monotonic() + (timeout or self.order_timeout),
+            # Bracket legs: the parent's children, and each child's shared sibling list
+            'children': (),
+            'siblings': (),
+            'cancel_requested': False,
+            'status': None,
+            'filled': 0,
+            'avgFillPrice': 0,
+            'orderStatus': None
+        }
+        self.pending_orders[order_id] = trade
+        future.add_done_callback(lambda _, trade=trade: self.on_order_done(trade))
+        return trade
+
+    def check_order_timeouts(self):
+        """Cancel pending orders that have not completed within their timeout"""
+        if not self.pending_orders:
+            return
+        now = time.monotonic()
+        for trade in self.pending_orders.values():
+            if not trade['cancel_requested'] and now > trade['deadline']:
+                self.logger.error(f"Order {trade['order_id']} timeout - cancelling order")
+                trade['cancel_requested'] = True
                 self.ib.cancelOrder(trade['order_id'])
-                return False
-
-            # Get latest order status
-            status = self.ib.get_order_status(trade['order_id'])
-            if status:
-                trade['status'] = status.get('status')
-                trade['filled'] = status.get('filled', 0)
-                trade['avgFillPrice'] = status.get('avgFillPrice', 0)
-                trade['orderStatus'] = status
 
-                # Check if order is complete
-                if trade['status'] == 'Filled':
-                    return self.handle_order_status(trade)
-                elif trade['status'] in ['Cancelled', 'ApiCancelled', 'Error']:
-                    return self.handle_order_status(trade)
-
-            time.sleep(1)
+    def handle_order_event(self, trade):
+        """Apply a completed order to positions and statistics"""
+        if self.pending_orders.pop(trade['order_id'], None) is None:
+            return
+        status = trade['future'].result()
+        trade['status'] = status.get('status')
+        trade['filled'] = status.get('filled', 0)
+        trade['avgFillPrice'] = status.get('avgFillPrice', 0)
+        trade['orderStatus'] = status
+        self.handle_order_status(trade)
+
+        filled = trade['filled']
+        fill_price = trade['avgFillPrice']
+        if trade['action'] == 'BUY':
+            self.pending_buys -= 1
+            # A cancelled order may still have filled partially
+            if filled > 0:
+                lot = self.positions.add(filled, fill_price, self.clock())
+                if self.journal:
+                    self.journal.append('open', lot=lot.lot_id, shares=filled, price=fill_price,
+                                        ts=lot.timestamp.timestamp())
+                self.logger.info("Buy executed: %s shares at $%.2f", filled, fill_price)
+                self.protect_lot(lot, trade['children'])
+                self.report_position()
+                self.strategy.on_fill(self, trade)
+            if self.journal:
+                self.journal.append('done', id=trade['order_id'])
+            return
+
+        remaining = filled
+        profit = 0
+        sold_shares = 0
+        for lot in trade['positions']:
+            sold = min(lot.shares, remaining)
+            remaining -= sold
+            sold_shares += sold
+            profit += (fill_price - lot.price) * sold
+            self.positions.reduce(lot, sold)
+            if sold and self.journal:
+                self.journal.append('reduce', lot=lot.lot_id, shares=sold)
+            # Whatever did not sell is eligible for exits again, once no
+            # other bracket leg is still protecting it
+            if not any(sibling['order_id'] in self.pending_orders for sibling in trade['siblings']):
+                self.positions.release(lot)
+
+        # A fill that closed no lot (a leg whose lot was already sold) is no trade
+        if sold_shares > 0:
+            self.total_trades += 1
+            self.total_profit += profit
+            if self.journal:
+                self.journal.append('stats', trades=self.total_trades, profit=self.total_profit)
+            self.logger.info("Sell executed: %s shares at $%.2f, Profit: $%.2f", filled, fill_price, profit)
+            self.report_position()
+            self.strategy.on_fill(self, trade)
+        if self.journal:
+            self.journal.append('done', id=trade['order_id'])
+
+    def report_position(self):
+        """Push this symbol's running totals to the shared portfolio"""
+        if self.portfolio is not None:
+            self.portfolio.set_position(self.symbol, self.positions.total_shares, self.positions.total_cost,
+                                        self.total_profit, self.total_trades)
+
+    def protect_lot(self, lot, children):
+        """
+        Hand a freshly filled lot to its working bracket legs: the broker
+        exits it, so client-side stop and target checks skip it
+        """
+        children = [child for child in children if child['order_id'] in self.pending_orders]
+        if not children:
+            return
+        self.positions.mark_exiting(lot)
+        for child in children:
+            child['positions'] = [lot]
+            # Re-record the leg with its lot so a restart can settle it
+            self.journal_order(child)
 
     def handle_order_status(self, trade):
         """Handle order status updates"""
         status = trade.get('orderStatus', {})
 
         if trade['status'] == 'Filled':
-            self.logger.info(
-                f"Order filled: {trade['filled']} shares at average price ${trade['avgFillPrice']:.2f}"
-            )
+            self.logger.info("Order filled: %s shares at average price $%.2f",
+                             trade['filled'], trade['avgFillPrice'])
             return True
-        elif trade['status'] in ['Cancelled', 'ApiCancelled']:
+        elif trade['status'] in ['Cancelled', 'ApiCancelled', 'Inactive']:
             self.logger.warning(f"Order cancelled: {status.get('whyHeld', 'Unknown reason')}")
             return False
         elif trade['status'] == 'Error':
@@ -277,59 +557,147 @@ class StockTrader:
 
         return None
 
-    def handle_order_status(self, trade):
-        """Handle order status updates"""
-        status = trade.orderStatus
-
-        if status.status == 'Filled':
-            self.logger.info(
-                f"Order filled: {status.filled} shares at average price ${status.avgFillPrice:.2f}"
-            )
-            return True
-        elif status.status in ['Cancelled', 'ApiCancelled']:
-            self.logger.warning(f"Order cancelled: {status.whyHeld}")
-            return False
-        elif status.status == 'Error':
-            self.logger.error(f"Order error: {status.whyHeld}")
-            return False
+    def record_reference_price(self):
+        if self.journal:
+            self.journal.append('ref', price=self.reference_price)
+
+    def attach_journal(self, journal):
+        """Restore lots, statistics and the reference price from a journal, then record to it"""
+        state = journal.state
+        for lot_id, (shares, price, timestamp) in sorted(state['lots'].items()):
+            self.positions.restore(lot_id, shares, price, datetime.fromtimestamp(timestamp))
+        self.positions.next_lot_id = max(self.positions.next_lot_id, state['next_lot_id'])
+        self.total_trades = state['total_trades']
+        self.total_profit = state['total_profit']
+        if state['reference_price']:
+            self.reference_price = state['reference_price']
+        self.recovered_orders = dict(state['orders'])
+        self.journal = journal
+        self.report_position()
+        self.logger.info(f"Restored {len(self.positions)} lots, {len(self.recovered_orders)} "
+                         f"orders in flight, reference price ${self.reference_price:.2f}")
+
+    def reconcile(self, broker_state):
+        """
+        Settle orders that were in flight at the last shutdown against the
+        broker's open orders and executions from IBConnection.request_broker_state,
+        then compare the position with the broker's
+        Returns: list of discrepancy messages (empty when everything matches)
+        """
+        open_orders = broker_state['open_orders']
+        executions = broker_state['executions']
+        for order_id, recovered in sorted(self.recovered_orders.items()):
+            lots = [self.positions.lots[lot_id] for lot_id in recovered['lots'] if lot_id in self.positions.lots]
+            order = Order()
+            order.action = recovered['action']
+            order.totalQuantity = recovered['quantity']
+            contract = self.ib.create_contract(self.symbol)
+            if recovered['action'] == 'BUY':
+                self.pending_buys += 1
+            else:
+                for lot in lots:
+                    self.positions.mark_exiting(lot)
+
+            if order_id in open_orders:
+                # Still working: resume tracking it like any other order
+                future = Future()
+                self.ib.order_futures[order_id] = future
+                # Bracket legs keep protecting their lots; other orders time out as usual
+                timeout = float('inf') if open_orders[order_id].get('parent_id') else None
+                self.track_order(order_id, future, contract, order, lots, timeout)
+                self.logger.info(f"Resumed open order {order_id}")
+                continue
+
+            fills = executions.get(order_id, [])
+            filled = sum(fill['shares'] for fill in fills)
+            average = sum(fill['shares'] * fill['price'] for fill in fills) / filled if filled else 0.0
+            future = Future()
+            future.set_result({'status': 'Filled' if filled >= recovered['quantity'] else 'Cancelled',
+                               'filled': filled, 'remaining': recovered['quantity'] - filled,
+                               'avgFillPrice': average, 'whyHeld': 'recovered'})
+            self.track_order(order_id, future, contract, order, lots)
+            # Apply now rather than through the queue so positions are settled before trading
+            self.handle_order_event(self.pending_orders[order_id])
+        self.recovered_orders = {}
+        return self.check_position(broker_state)
+
+    def resume_after_reconnect(self, broker_state):
+        """
+        Carry on after IBConnection reconnected: cancels sent while the
+        socket was down never left, so orders still working are cancelled
+        again on timeout; then compare the position with the broker's
+        """
+        open_orders = broker_state['open_orders']
+        for order_id, trade in self.pending_orders.items():
+            if order_id in open_orders:
+                trade['cancel_requested'] = False
+        return self.check_position(broker_state)
 
-        return None
+    def check_position(self, broker_state):
+        """
+        Compare this symbol's shares with the broker's position
+        Returns: list of discrepancy messages (empty when they match)
+        """
+        discrepancies = []
+        broker_shares, _ = broker_state['positions'].get(self.symbol, (0.0, 0.0))
+        if abs(broker_shares - self.positions.total_shares) > 1e-9:
+            discrepancies.append(f"{self.symbol}: broker holds {broker_shares} shares, "
+                                 f"trader has {self.positions.total_shares}")
+        for message in discrepancies:
+            self.logger.warning(f"Reconcile: {message}")
+        return discrepancies
+
+    def pnl_summary(self, current_price=None):
+        """
+        Running totals for this symbol, from the position book's aggregates
+        rather than its lots, so the cost does not grow with the lot count
+        current_price: defaults to the last traded price
+        """
+        if current_price is None:
+            current_price = self.ib.get_last_price(self.symbol)
+        shares = self.positions.total_shares
+        cost = self.positions.total_cost
+        market_value = shares * current_price
+        return {
+            'shares': shares,
+            'cost_basis': cost,
+            'current_price': current_price,
+            'market_value': market_value,
+            'realized': self.total_profit,
+            'unrealized': market_value - cost,
+            'total_positions': len(self.positions),
+            'trades': self.total_trades,
+        }
 
     def get_positions_summary(self):
-        """Get summary of current positions"""
+        """Get summary of current positions, one entry per lot"""
         if not self.positions:
             return "No open positions"
 
-        summary = []
-        total_value = 0
-        total_profit = 0
-
-        for pos in self.positions:
-            current_value = pos['shares'] * self.ib.current_price
-            position_profit = (self.ib.current_price - pos['price']) * pos['shares']
-            profit_percentage = (self.ib.current_price - pos['price']) / pos['price'] * 100
-
-            summary.append({
-                'shares': pos['shares'],
-                'buy_price': pos['price'],
-                'current_price': self.ib.current_price,
-                'profit': position_profit,
-                'profit_percentage': profit_percentage,
-                'value': current_value
-            })
-
-            total_value += current_value
-            total_profit += position_profit
+        totals = self.pnl_summary()
+        current_price = totals['current_price']
+        summary = [
+            {
+                'shares': pos.shares,
+                'buy_price': pos.price,
+                'current_price': current_price,
+                'profit': (current_price - pos.price) * pos.shares,
+                'profit_percentage': (current_price - pos.price) / pos.price * 100,
+                'value': pos.shares * current_price
+            }
+            for pos in self.positions
+        ]
 
         return {
             'positions': summary,
-            'total_value': total_value,
-            'total_profit': total_profit,
-            'total_positions': len(self.positions)
+            'total_value': totals['market_value'],
+            'total_profit': totals['unrealized'],
+            'total_positions': totals['total_positions']
         }
 
     def set_reference_price(self, price):
         self.reference_price = price
+        self.record_reference_price()
         self.logger.info(f"Reference price set to: {price}")
 
     def start_trading(self):
@@ -338,15 +706,19 @@ class StockTrader:
         self.is_trading = True
         self.start_time = datetime.now()
         self.logger.info("Trading started")
+        # Defaults: buy on 1% drop, sell on 1% gain, 2% stop loss, 3 positions
+        # of 30 shares; override with set_parameters, e.g. from optimizer results
         self.monitor_and_trade(
-            symbol=self.ib.symbol,
-            buy_trigger_percentage=-0.01,  # Buy on 1% drop
-            sell_trigger_percentage=0.01,  # Sell on 1% gain
-            max_positions=3,  # Maximum 3 positions
-            position_size=30  # 100 shares per position
+            symbol=self.symbol or self.ib.symbol,
+            buy_trigger_percentage=self.buy_trigger_percentage,
+            sell_trigger_percentage=self.sell_trigger_percentage,
+            max_positions=self.max_positions,
+            position_size=self.position_size,
+            stop_loss_percentage=self.stop_loss_percentage
         )
 
     def stop_trading(self):
         self.is_trading = False
+        self.event_queue.put((STOP_EVENT, None, 0))
         self.start_time = None
         self.logger.info("Trading stopped")